@@ -0,0 +1,95 @@
+"""
+Corpora for the flowchart benchmarks.
+
+Each corpus is a list of (name, source code) pairs. The synthetic corpora
+stress one dimension of the generator each; the stdlib corpus is a large
+body of real-world code.
+"""
+
+import os
+import sysconfig
+
+
+def deep_nesting(depth=60, functions=20):
+    """Functions whose bodies nest if/for/while/else blocks depth levels deep."""
+    keywords = ["if x > {i}:", "for item{i} in x:", "while x < {i}:"]
+    lines = []
+    for number in range(functions):
+        lines.append(f"def nested_{number}(x):")
+        for level in range(depth):
+            indent = "    " * (level + 1)
+            lines.append(indent + keywords[level % 3].format(i=level))
+            if level % 7 == 6:
+                # Inside a loop, skip to the next iteration; inside an if, just change x
+                lines.append(indent + "    if x:")
+                lines.append(indent + ("        continue" if level % 3 else "        x += 1"))
+        lines.append("    " * (depth + 1) + "return x")
+        lines.append("")
+    return [("deep_nesting", "\n".join(lines))]
+
+
+def many_functions(count=5000):
+    """A single module holding count small functions and methods."""
+    lines = []
+    for number in range(count):
+        # Alternate between five methods of a class and five module-level functions
+        if number % 10 == 0:
+            lines.append(f"class Holder{number}:")
+        indent = "    " if number % 10 < 5 else ""
+        if indent:
+            lines.append(f"    def method_{number}(self, items):")
+        else:
+            lines.append(f"def function_{number}(items):")
+        lines.append(indent + "    total = 0")
+        lines.append(indent + "    for item in items:")
+        lines.append(indent + "        if item < 0:")
+        lines.append(indent + "            break")
+        lines.append(indent + "        total += item")
+        lines.append(indent + "    return total")
+        lines.append("")
+    return [("many_functions", "\n".join(lines))]
+
+
+def long_elif_chain(length=400, functions=5):
+    """Functions made of one if/elif chain with length branches."""
+    lines = []
+    for number in range(functions):
+        lines.append(f"def dispatch_{number}(x):")
+        lines.append("    if x == 0:")
+        lines.append("        return 'zero'")
+        for branch in range(1, length):
+            lines.append(f"    elif x == {branch}:")
+            lines.append(f"        return x * {branch}")
+        lines.append("    else:")
+        lines.append("        raise ValueError(x)")
+        lines.append("")
+    return [("long_elif_chain", "\n".join(lines))]
+
+
+def stdlib(limit=None):
+    """The pure-Python modules of the standard library, in sorted order."""
+    root = sysconfig.get_paths()["stdlib"]
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in ("site-packages", "test", "tests", "__pycache__"))
+        paths.extend(os.path.join(dirpath, name) for name in filenames if name.endswith(".py"))
+    corpus = []
+    for path in sorted(paths)[:limit]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                corpus.append((os.path.relpath(path, root), f.read()))
+        except (OSError, UnicodeDecodeError):
+            continue
+    return corpus
+
+
+def build_corpora(scale=1.0, stdlib_limit=None, include_stdlib=True):
+    """Return the benchmark corpora by name, with the synthetic sizes multiplied by scale."""
+    corpora = {
+        "deep_nesting": deep_nesting(functions=max(1, int(20 * scale))),
+        "many_functions": many_functions(max(1, int(5000 * scale))),
+        "long_elif_chain": long_elif_chain(functions=max(1, int(5 * scale))),
+    }
+    if include_stdlib:
+        corpora["stdlib"] = stdlib(stdlib_limit)
+    return corpora
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for FlowchartGenerator.
+
+Measures the parse, visit and serialize phases of generate_mermaid_flowchart,
+the end-to-end time of generate_mermaid_flowchart and save_mermaid_diagram,
+and the peak memory of both, on synthetic corpora (deep nesting, thousands
+of functions, long if/elif chains) and on the standard library.
+
+Results are written as JSON, by default to benchmarks/results/<commit>.json,
+so that runs on different commits can be compared:
+
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/<old commit>.json
+
+Times are the best of --repeat runs (the median is recorded too); peak memory
+is measured in a separate run under tracemalloc, so it does not slow down the
+timed runs. The run fails (exit status 1) if a module of a synthetic corpus
+cannot be generated, or with --compare if a measurement regressed.
+"""
+
+import argparse
+import ast
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+
+from flomatic.code_to_mermaid import FlowchartGenerator  # noqa: E402
+from flomatic.function_index import FunctionIndex  # noqa: E402
+from flomatic.serializers import to_mermaid  # noqa: E402
+
+from corpora import build_corpora  # noqa: E402
+
+RESULTS_VERSION = 1
+
+# The timed measurements; 'parse', 'visit' and 'serialize' add up to about 'generate'
+TIMINGS = ["parse", "visit", "serialize", "generate", "save"]
+
+# Corpora every module of which must be generated; a skipped module fails the run (the standard
+# library can have modules that do not parse on the running Python)
+REQUIRED_CORPORA = ["deep_nesting", "many_functions", "long_elif_chain"]
+
+
+def usable_sources(corpus):
+    """Return the modules of a corpus the generator can process, and an error message per other module."""
+    generator = FlowchartGenerator()
+    usable = []
+    errors = {}
+    for name, source in corpus:
+        try:
+            generator.generate_mermaid_flowchart(source)
+        except (SyntaxError, ValueError, RecursionError) as e:
+            errors[name] = f"{type(e).__name__}: {e}"
+        else:
+            usable.append((name, source))
+    return usable, errors
+
+
+def time_once(corpus, scratch_dir):
+    """Time every measurement once over a whole corpus, returning seconds per measurement."""
+    generator = FlowchartGenerator()
+    timings = dict.fromkeys(TIMINGS, 0.0)
+    clock = time.perf_counter
+    for _, source in corpus:
+        start = clock()
+        index = FunctionIndex.from_source(source)
+        parsed = clock()
+        graph = generator.generate_flowchart_graph(source, index=index)
+        visited = clock()
+        to_mermaid(graph)
+        serialized = clock()
+        generator.generate_mermaid_flowchart(source)
+        generated = clock()
+        timings["parse"] += parsed - start
+        timings["visit"] += visited - parsed
+        timings["serialize"] += serialized - visited
+        timings["generate"] += generated - serialized
+
+    output_dir = tempfile.mkdtemp(dir=scratch_dir)
+    start = clock()
+    for _, source in corpus:
+        generator.save_mermaid_diagram(source, output_dir)
+    timings["save"] = clock() - start
+    shutil.rmtree(output_dir)
+    return timings
+
+
+def peak_memory(function, corpus):
+    """Return the peak traced memory in bytes while calling function on every module of a corpus."""
+    tracemalloc.start()
+    try:
+        for _, source in corpus:
+            function(source)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_corpus(corpus, repeat, scratch_dir):
+    """Run all the measurements on one corpus and return its result dictionary."""
+    corpus, errors = usable_sources(corpus)
+    runs = [time_once(corpus, scratch_dir) for _ in range(repeat)]
+    result = {
+        "modules": len(corpus),
+        "functions": sum(len(FunctionIndex(ast.parse(source))) for _, source in corpus),
+        "bytes": sum(len(source.encode("utf-8")) for _, source in corpus),
+        "errors": errors,
+        "seconds": {name: min(run[name] for run in runs) for name in TIMINGS},
+        "median_seconds": {name: statistics.median(run[name] for run in runs) for name in TIMINGS},
+    }
+
+    generator = FlowchartGenerator()
+    output_dir = tempfile.mkdtemp(dir=scratch_dir)
+    result["peak_memory"] = {
+        "generate": peak_memory(generator.generate_mermaid_flowchart, corpus),
+        "save": peak_memory(lambda source: generator.save_mermaid_diagram(source, output_dir), corpus),
+    }
+    shutil.rmtree(output_dir)
+    return result
+
+
+def git_revision():
+    """Return the current commit and whether the working tree has changes, or (None, None) outside git."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=HERE, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, universal_newlines=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=HERE,
+                                stdout=subprocess.PIPE, universal_newlines=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+
+def run_benchmarks(corpora, repeat=5):
+    """Benchmark each corpus and return the results document."""
+    commit, dirty = git_revision()
+    results = {
+        "version": RESULTS_VERSION,
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "corpora": {},
+    }
+    scratch_dir = tempfile.mkdtemp(prefix="flomatic-bench-")
+    try:
+        for name, corpus in corpora.items():
+            print(f"{name}: {len(corpus)} modules...", file=sys.stderr)
+            results["corpora"][name] = benchmark_corpus(corpus, repeat, scratch_dir)
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    return results
+
+
+def compare_results(baseline, current, threshold=1.1):
+    """Compare two results documents.
+
+    Returns:
+        tuple: Report lines, and the (corpus, measurement, ratio) of each measurement that
+               got slower or bigger than threshold times the baseline.
+    """
+    lines = [f"{'corpus':<18} {'measurement':<22} {'baseline':>12} {'current':>12} {'ratio':>7}"]
+    regressions = []
+    for corpus, result in current["corpora"].items():
+        old = baseline["corpora"].get(corpus)
+        if old is None:
+            continue
+        pairs = [(f"time.{name}", old["seconds"][name], result["seconds"][name]) for name in TIMINGS]
+        pairs += [(f"memory.{name}", old["peak_memory"][name], result["peak_memory"][name])
+                  for name in result["peak_memory"]]
+        for measurement, old_value, new_value in pairs:
+            ratio = new_value / old_value if old_value else float("inf")
+            marker = " !" if ratio > threshold else ""
+            lines.append(f"{corpus:<18} {measurement:<22} {old_value:>12.6g} {new_value:>12.6g} {ratio:>7.2f}{marker}")
+            if ratio > threshold:
+                regressions.append((corpus, measurement, ratio))
+    return lines, regressions
+
+
+def failed_corpora(results):
+    """Return the names of the required corpora that skipped any module in a results document."""
+    return [name for name, result in results["corpora"].items()
+            if name in REQUIRED_CORPORA and result["errors"]]
+
+
+def print_summary(results):
+    for name, result in results["corpora"].items():
+        seconds = result["seconds"]
+        print(f"{name}: {result['modules']} modules, {result['functions']} functions, "
+              f"{len(result['errors'])} skipped")
+        print("  " + "  ".join(f"{phase} {seconds[phase] * 1000:.1f} ms" for phase in TIMINGS))
+        print("  " + "  ".join(f"peak {phase} {size / 1024 / 1024:.1f} MiB"
+                               for phase, size in result["peak_memory"].items()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark FlowchartGenerator.")
+    parser.add_argument("--corpus", action="append", help="only run this corpus (repeatable)")
+    parser.add_argument("--scale", type=float, default=1.0, help="size multiplier for the synthetic corpora")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per corpus; the best is reported")
+    parser.add_argument("--no-stdlib", action="store_true", help="skip the standard library corpus")
+    parser.add_argument("--stdlib-limit", type=int, help="only use the first N standard library modules")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", metavar="BASELINE", help="results file to compare against")
+    parser.add_argument("--current", metavar="RESULTS",
+                        help="with --compare, compare this results file instead of running the benchmarks")
+    parser.add_argument("--threshold", type=float, default=1.1,
+                        help="with --compare, ratio above which a measurement counts as a regression")
+    args = parser.parse_args(argv)
+
+    if args.current:
+        with open(args.current) as f:
+            results = json.load(f)
+    else:
+        corpora = build_corpora(args.scale, args.stdlib_limit, include_stdlib=not args.no_stdlib)
+        if args.corpus:
+            corpora = {name: corpora[name] for name in args.corpus}
+        results = run_benchmarks(corpora, args.repeat)
+        output = args.output
+        if output is None:
+            name = (results["commit"] or "unversioned")[:12] + ("-dirty" if results["dirty"] else "")
+            output = os.path.join(HERE, "results", f"{name}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+        print_summary(results)
+        print(f"Results written to {output}")
+        failed = failed_corpora(results)
+        if failed:
+            for name in failed:
+                for module, error in results["corpora"][name]["errors"].items():
+                    print(f"{name}: {module} failed: {error}", file=sys.stderr)
+            return 1
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        lines, regressions = compare_results(baseline, results, args.threshold)
+        print("\n".join(lines))
+        if regressions:
+            print(f"{len(regressions)} measurements regressed by more than {args.threshold:.2f}x")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,13 @@
 #!/bin/bash
 # Script to convert all Mermaid diagram files (.mmd) to PNG format
+#
+# Diagrams are rendered in batches, one mmdc process (and headless browser) per
+# batch, and only diagrams that are newer than their PNG are converted.
+# Set JOBS to render several batches at once.
 
 # Create output directory if it doesn't exist
 mkdir -p mermaid_diagrams/png
 
-# Convert each .mmd file to PNG
-for file in mermaid_diagrams/*.mmd; do
-    filename=$(basename "$file" .mmd)
-    echo "Converting $filename.mmd to PNG..."
-    mmdc -i "$file" -o "mermaid_diagrams/png/$filename.png"
-done
+PYTHONPATH=src python -m flomatic.render --jobs "${JOBS:-1}" mermaid_diagrams mermaid_diagrams/png
 
 echo "Conversion complete. PNG files are in mermaid_diagrams/png directory."
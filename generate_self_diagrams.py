@@ -16,21 +16,16 @@ def main():
     source_file = os.path.join('src', 'flomatic', 'code_to_mermaid.py')
     output_dir = 'mermaid_diagrams'
     
-    # Ensure output directory exists
-    os.makedirs(output_dir, exist_ok=True)
-    
-    # Read the source code
-    with open(source_file, 'r') as f:
-        source_code = f.read()
-    
     # Create a FlowchartGenerator instance
     generator = FlowchartGenerator()
     
-    # Generate diagrams for all functions in the file
-    file_paths = generator.save_mermaid_diagram(source_code, output_dir=output_dir)
+    # Regenerate only the diagrams of functions that changed since the last run
+    written, removed = generator.update_mermaid_diagrams(source_file, output_dir=output_dir)
     
-    print(f"Generated {len(file_paths)} Mermaid diagram files in {output_dir}:")
-    for path in file_paths:
+    print(f"Updated {len(written)} and removed {len(removed)} Mermaid diagram files in {output_dir}:")
+    for path in written:
+        print(f"  + {path}")
+    for path in removed:
         print(f"  - {path}")
 
 if __name__ == "__main__":
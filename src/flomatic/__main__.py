@@ -0,0 +1,7 @@
+"""Run the flomatic command-line interface: python -m flomatic [options] PATH [PATH ...]"""
+
+import sys
+
+from flomatic.cli import main
+
+sys.exit(main())
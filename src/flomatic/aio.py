@@ -0,0 +1,181 @@
+"""
+Asyncio API for serving diagrams from an event loop.
+
+AsyncFlowchartService runs the parsing and visiting on an executor, so a
+large file does not block the event loop. Concurrent requests for the same
+diagram share one computation, and recent results are kept in an in-memory
+LRU cache:
+
+    async with AsyncFlowchartService() as service:
+        flowchart = await service.generate(source_code, target_function="example")
+
+By default the work runs on the event loop's default thread pool. Pass a
+ProcessPoolExecutor to spread it over several CPUs.
+"""
+
+import asyncio
+import functools
+import threading
+from collections import OrderedDict
+
+from flomatic.cache import cache_key
+from flomatic.code_to_mermaid import RENDERER_VERSION, FlowchartGenerator
+from flomatic.sources import read_source
+
+# The number of recently indexed sources each worker process keeps
+INDEX_CACHE_SIZE = 8
+
+# One generator per set of options, shared by the executor's threads (each worker process
+# has its own copy)
+_generators = {}
+# The function indexes of recently requested sources by source hash, least recently used
+# first, which requests for other functions of the same file reuse
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def _worker_generator(options):
+    generator = _generators.get(options)
+    if generator is None:
+        # Two threads may both create one here; either is as good as the other
+        generator = _generators.setdefault(options, FlowchartGenerator(**dict(options)))
+    return generator
+
+
+def _worker_index(generator, source_code):
+    key = cache_key(source_code)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index
+    # Built outside the lock; two threads may both index a source, and either index will do
+    index = generator._index_source(source_code)
+    with _indexes_lock:
+        _indexes[key] = index
+        while len(_indexes) > INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
+
+
+def _generate(options, source_code, target_function, compact, format):
+    """Generate one flowchart in an executor worker."""
+    generator = _worker_generator(options)
+    index = _worker_index(generator, source_code)
+    return generator.generate_flowchart(source_code, target_function, compact, index, format)
+
+
+def _generate_all(options, source_code, compact, format):
+    """Generate the flowcharts of every function in an executor worker."""
+    return _worker_generator(options).generate_function_flowcharts(source_code, compact, format=format)
+
+
+class AsyncFlowchartService:
+    """Generates flowcharts for asyncio code without blocking the event loop.
+
+    Attributes:
+        hits (int): Requests answered from the LRU cache.
+        misses (int): Requests that started a computation.
+        coalesced (int): Requests that joined a computation already in progress.
+    """
+
+    def __init__(self, executor=None, cache_size=128, generator_options=None):
+        """Create a service.
+
+        Args:
+            executor (concurrent.futures.Executor, optional): Where flowcharts are generated. The
+                                                            service shuts it down when closed.
+                                                            Defaults to the event loop's default
+                                                            executor (a thread pool).
+            cache_size (int, optional): The number of recent results kept in memory. Defaults to 128.
+            generator_options (dict, optional): Keyword arguments for the FlowchartGenerator used
+                                              in each worker, e.g. {'max_label_length': 40}.
+        """
+        self.executor = executor
+        self.cache_size = cache_size
+        self._options = tuple(sorted((generator_options or {}).items()))
+        self._results = OrderedDict()  # Key -> result, least recently used first
+        self._pending = {}  # Key -> future of the computation in progress
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Shut down the executor, if one was given."""
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+
+    async def generate(self, source_code, target_function=None, compact=True, format="mermaid"):
+        """Generate a flowchart, as FlowchartGenerator.generate_flowchart does.
+
+        Args:
+            source_code (str): The Python source code to generate a diagram for.
+            target_function (str, optional): If provided, only generate a flowchart for this function
+                                           (fully qualified, e.g. 'Calculator.multiply').
+            compact (bool, optional): If True, only include control flow elements. Defaults to True.
+            format (str, optional): The output format (see FlowchartGenerator.generate_flowchart).
+                                  Defaults to 'mermaid'.
+
+        Returns:
+            str or bytes: The serialized flowchart.
+        """
+        key = cache_key("flowchart", RENDERER_VERSION, self._options, compact, format, target_function,
+                        source_code)
+        return await self._submit(key, _generate, self._options, source_code, target_function, compact, format)
+
+    async def generate_all(self, source_code, compact=True, format="mermaid"):
+        """Generate the flowchart of every function, as FlowchartGenerator.generate_function_flowcharts does.
+
+        Returns:
+            list: (function name, flowchart) tuples in source order.
+        """
+        key = cache_key("functions", RENDERER_VERSION, self._options, compact, format, source_code)
+        return await self._submit(key, _generate_all, self._options, source_code, compact, format)
+
+    async def generate_file(self, source_file, target_function=None, compact=True, format="mermaid"):
+        """Generate a flowchart for a source file, reading it on the executor too.
+
+        Takes the same arguments as generate, with the path of the file (or of a member of a .whl or
+        .zip archive, see flomatic.sources) instead of its source.
+        """
+        loop = asyncio.get_running_loop()
+        source_code = await loop.run_in_executor(self.executor, read_source, source_file)
+        return await self.generate(source_code, target_function, compact, format)
+
+    async def _submit(self, key, function, *args):
+        """Return the result for key from the cache, a computation in progress or a new one."""
+        result = self._results.get(key)
+        if result is not None:
+            self._results.move_to_end(key)
+            self.hits += 1
+            return result
+
+        future = self._pending.get(key)
+        if future is None:
+            self.misses += 1
+            future = asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+            self._pending[key] = future
+            future.add_done_callback(functools.partial(self._finished, key))
+        else:
+            self.coalesced += 1
+        # Shielded, so a caller that is cancelled does not cancel the others' computation
+        return await asyncio.shield(future)
+
+    def _finished(self, key, future):
+        del self._pending[key]
+        if future.cancelled() or future.exception() is not None:
+            return
+        self._results[key] = future.result()
+        if len(self._results) > self.cache_size:
+            self._results.popitem(last=False)
+
+    def stats(self):
+        """Return the request counters and the number of cached results as a dictionary."""
+        return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced,
+                "entries": len(self._results), "pending": len(self._pending)}
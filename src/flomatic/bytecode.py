@@ -0,0 +1,654 @@
+"""
+Flowcharts built from bytecode instead of source.
+
+For code that is already loaded, such as installed packages shipped
+without .py files, bytecode_graph builds a function's flowchart from its
+code object with the dis module, without reading or parsing any source.
+
+The instructions are split into basic blocks at jumps and jump targets,
+and the blocks are mapped onto the node vocabulary of the source-based
+flowcharts:
+
+- a conditional jump becomes an "If: <condition>" node, or a
+  "While: <condition>" node when the test is reached again by a jump
+  backwards,
+- FOR_ITER becomes a "For: <target> in <iterable>" node,
+- returning a value becomes a "Return: <value>" node, and raising an
+  exception a "Raise" node,
+- in detailed (non-compact) mode, statements become nodes named like their
+  AST counterparts ("Assign", "AugAssign", "Expr", "Import", ...).
+
+Labels are rebuilt from the instructions by simulating the value stack
+for the common expression opcodes; where an expression uses anything
+else the node keeps the bare label (e.g. "If").
+
+The bytecode does not keep everything the source has, so these diagrams
+are coarser than the source-based ones: placeholders such as "Then" and
+"Loop Body" are not drawn, "break" and "continue" are plain edges,
+"and"/"or" conditions are one decision per operand, try and with blocks
+are not drawn (exception handlers are not followed), "return None" goes
+straight to End, and nested functions show as a "Function <name>" node
+without their body.
+"""
+
+import dis
+import inspect
+from collections import namedtuple
+
+from flomatic.graph import START, FlowGraph
+
+# Instructions that end a function without a successor
+RETURN_OPS = frozenset(["RETURN_VALUE", "RETURN_CONST"])
+RAISE_OPS = frozenset(["RAISE_VARARGS", "RERAISE"])
+
+# Unconditional jumps
+JUMP_OPS = frozenset(["JUMP_FORWARD", "JUMP_ABSOLUTE", "JUMP_BACKWARD", "JUMP_BACKWARD_NO_INTERRUPT",
+                      "JUMP", "JUMP_NO_INTERRUPT"])
+
+# Operators of the binary and in-place opcodes before Python 3.11 (later versions use BINARY_OP)
+BINARY_OPERATORS = {
+    "ADD": "+", "SUBTRACT": "-", "MULTIPLY": "*", "TRUE_DIVIDE": "/", "FLOOR_DIVIDE": "//",
+    "MODULO": "%", "POWER": "**", "MATRIX_MULTIPLY": "@", "LSHIFT": "<<", "RSHIFT": ">>",
+    "AND": "&", "OR": "|", "XOR": "^",
+}
+UNARY_OPERATORS = {"UNARY_NEGATIVE": "-", "UNARY_POSITIVE": "+", "UNARY_INVERT": "~", "UNARY_NOT": "not "}
+
+# Instructions that only load a name
+LOAD_NAME_OPS = frozenset(["LOAD_FAST", "LOAD_FAST_CHECK", "LOAD_FAST_AND_CLEAR", "LOAD_DEREF", "LOAD_CLOSURE",
+                           "LOAD_NAME", "LOAD_GLOBAL", "LOAD_CLASSDEREF", "LOAD_FROM_DICT_OR_DEREF",
+                           "LOAD_FROM_DICT_OR_GLOBALS"])
+STORE_NAME_OPS = frozenset(["STORE_FAST", "STORE_NAME", "STORE_DEREF", "STORE_GLOBAL"])
+# Instructions that do nothing to the values on the stack
+NO_STACK_OPS = frozenset(["NOP", "RESUME", "PRECALL", "CACHE", "EXTENDED_ARG", "MAKE_CELL", "COPY_FREE_VARS",
+                          "TO_BOOL", "GET_ITER", "GET_AITER", "SETUP_LOOP"])
+
+# The depth the top of the stack is moved down to by the rotations of Python 3.10 and earlier
+ROTATIONS = {"ROT_TWO": 2, "ROT_THREE": 3, "ROT_FOUR": 4}
+
+CO_ASYNC = inspect.CO_COROUTINE | inspect.CO_ASYNC_GENERATOR
+
+# An expression rebuilt from the instructions: its text (None when unknown), whether it
+# needs parentheses as an operand, and its value for constants
+_Value = namedtuple("_Value", ["text", "compound", "const"], defaults=(False, None))
+
+_UNKNOWN = _Value(None)
+# The NULL pushed below a callable by the call protocol of Python 3.11 and later
+_NULL = _Value(None)
+
+
+class _Block:
+    """A basic block: its instructions, the nodes it adds and how it ends."""
+
+    __slots__ = ("start", "instructions", "statements", "kind", "label", "test", "target", "successors",
+                 "nodes")
+
+    def __init__(self, start):
+        self.start = start
+        self.instructions = []
+        self.statements = []  # (label, shown in compact mode) for each statement
+        self.kind = None  # 'if', 'for', 'async for', 'return', 'raise' or None for a block that moves on
+        self.label = None  # The text of the condition, loop, return value or exception
+        self.test = None  # The source line and text of the value an 'if' block tests
+        self.target = None  # The names a 'for' block assigns
+        self.successors = []
+        self.nodes = []  # The node ids the block adds, in order
+
+
+def code_object(function):
+    """Return the code object of a function, method, or code object.
+
+    Decorators that set __wrapped__ (e.g. with functools.wraps) are looked through.
+
+    Raises:
+        TypeError: If function has no code object (e.g. a builtin).
+    """
+    if inspect.iscode(function):
+        return function
+    function = inspect.unwrap(getattr(function, "__func__", function))
+    code = getattr(function, "__code__", None)
+    if code is None:
+        raise TypeError(f"{function!r} has no bytecode")
+    return code
+
+
+def code_name(function):
+    """Return the qualified name of a function, as the FunctionIndex names it (without '<locals>')."""
+    if inspect.iscode(function):
+        name = getattr(function, "co_qualname", function.co_name)
+    else:
+        function = inspect.unwrap(getattr(function, "__func__", function))
+        name = getattr(function, "__qualname__", None) or code_object(function).co_name
+    return name.replace("<locals>.", "")
+
+
+def bytecode_graph(code, compact=True, max_label_length=None):
+    """Build the flowchart graph of a code object from its bytecode.
+
+    Args:
+        code (code): The code object of a function (see code_object).
+        compact (bool, optional): If True, only include control flow elements in the diagram.
+                                If False, also add a node for every statement. Defaults to True.
+        max_label_length (int, optional): If provided, truncate label expressions to this length.
+
+    Returns:
+        FlowGraph: The flowchart as a graph of integer nodes and edges.
+    """
+    blocks = _split_blocks(code)
+    _simulate(code, blocks)
+    by_start = {block.start: block for block in blocks}
+    reachable = _reachable_blocks(blocks, by_start)
+
+    # Work out the labels and nodes of the blocks in order, then the edges between them
+    kind = "Async Function" if code.co_flags & CO_ASYNC else "Function"
+    labels = [f"{kind} {code.co_name}"]
+    conditions = {}  # Block test -> node id of a condition, which the compiler may copy
+    for block in blocks:
+        if block.start not in reachable:
+            continue
+        for label, always in block.statements:
+            if always or not compact:
+                block.nodes.append(_new_node(labels, label))
+        if block.kind == "if":
+            node = conditions.get(block.test)
+            if node is None:
+                node = _new_node(labels, _with_text("If", block.label, max_label_length))
+                if block.test is not None:
+                    conditions[block.test] = node
+            block.nodes.append(node)
+        elif block.kind in ("for", "async for"):
+            kind = "For" if block.kind == "for" else "Async For"
+            if block.target is None or block.label is None:
+                label = kind
+            else:
+                # The target and the iterable are truncated separately, as in flowcharts from source
+                target = _shorten(block.target, max_label_length)
+                label = f"{kind}: {target} in {_shorten(block.label, max_label_length)}"
+            block.nodes.append(_new_node(labels, label))
+        elif block.kind == "return" and block.label is not None:
+            block.nodes.append(_new_node(labels, _with_text("Return", block.label, max_label_length)))
+        elif block.kind == "raise":
+            block.nodes.append(_new_node(labels, _with_text("Raise", block.label, max_label_length)))
+    _close_empty_loops(blocks, by_start, reachable, labels)
+
+    end = len(labels) + 1
+    edges = []
+    entry = {}
+    first = _entry(blocks[0], by_start, entry, end)
+    edges.append((START, 1))
+    edges.append((1, first))
+    for block in blocks:
+        if block.start not in reachable or not block.nodes:
+            continue
+        nodes = block.nodes
+        for from_node, to_node in zip(nodes, nodes[1:]):
+            edges.append((from_node, to_node))
+        if block.kind in ("return", "raise"):
+            edges.append((nodes[-1], end))
+        for successor in block.successors:
+            if successor in by_start:
+                edges.append((nodes[-1], _entry(by_start[successor], by_start, entry, end)))
+
+    # A test reached again by a jump backwards is a loop condition
+    for from_node, to_node in edges:
+        if from_node >= to_node and labels[to_node - 1].startswith("If"):
+            labels[to_node - 1] = "While" + labels[to_node - 1][2:]
+    return _build(labels, edges)
+
+
+def _new_node(labels, label):
+    labels.append(label)
+    # Node ids count from 1, after Start
+    return len(labels)
+
+
+def _with_text(kind, text, max_label_length):
+    return kind if text is None else f"{kind}: {_shorten(text, max_label_length)}"
+
+
+def _shorten(text, max_label_length):
+    if max_label_length is not None and len(text) > max_label_length:
+        return text[:max(max_label_length - 3, 0)] + "..."
+    return text
+
+
+def _split_blocks(code):
+    """Split the instructions of a code object into basic blocks, with the successors of each."""
+    instructions = _flow_instructions(code)
+    exits = _async_for_exits(instructions)
+    targets = {_branch_target(instruction, exits) for instruction in instructions}
+    blocks = []
+    ended = True
+    for instruction in instructions:
+        if ended or instruction.offset in targets:
+            if blocks and not _ends_flow(blocks[-1]):
+                # Falling through comes before the jump, as the then branch does before the else
+                blocks[-1].successors.insert(0, instruction.offset)
+            blocks.append(_Block(instruction.offset))
+        block = blocks[-1]
+        block.instructions.append(instruction)
+        target = _branch_target(instruction, exits)
+        if target is not None:
+            block.successors.append(target)
+        # What follows a branch starts a new block, even if nothing jumps to it
+        ended = target is not None or _ends_flow(block)
+    return blocks
+
+
+def _flow_instructions(code):
+    """Return the instructions of a code object, without the loops that wait for an await."""
+    instructions = []
+    skip_to = None
+    for instruction in dis.get_instructions(code):
+        if skip_to is not None and instruction.offset < skip_to:
+            continue
+        skip_to = instruction.argval if instruction.opname == "SEND" else None
+        instructions.append(instruction)
+    return instructions
+
+
+def _async_for_exits(instructions):
+    """Map each GET_ANEXT to the END_ASYNC_FOR its loop exits through, which nothing jumps to."""
+    exits = {}
+    open_loops = []
+    for instruction in instructions:
+        if instruction.opname == "GET_ANEXT":
+            open_loops.append(instruction.offset)
+        elif instruction.opname == "END_ASYNC_FOR" and open_loops:
+            exits[open_loops.pop()] = instruction.offset
+    return exits
+
+
+def _branch_target(instruction, exits):
+    """Return the offset a jump, conditional jump or loop header may go to, or None."""
+    name = instruction.opname
+    if name in JUMP_OPS or _is_conditional(name) or name == "FOR_ITER":
+        return instruction.argval
+    return exits.get(instruction.offset)
+
+
+def _is_conditional(name):
+    # POP_JUMP_IF_TRUE, POP_JUMP_FORWARD_IF_NONE, JUMP_IF_FALSE_OR_POP, ...
+    return "JUMP" in name and "_IF_" in name
+
+
+def _ends_flow(block):
+    name = block.instructions[-1].opname
+    return name in RETURN_OPS or name in RAISE_OPS or name in JUMP_OPS
+
+
+def _simulate(code, blocks):
+    """Work out the kind, label and statements of every block.
+
+    The blocks are simulated in order with one value stack. A block that cannot be
+    entered from the one before it starts with the stack recorded at a jump to it.
+    """
+    stack = []
+    entry_stacks = {}  # Block start -> the stack at a jump to it
+    statement = _Statement(0)
+    line = None
+    for position, block in enumerate(blocks):
+        follows = position > 0 and _falls_through(blocks[position - 1])
+        if not follows:
+            stack = list(entry_stacks.get(block.start, ()))
+            statement = _Statement(len(stack))
+        for instruction in block.instructions:
+            name = instruction.opname
+            line = _line(instruction, line)
+            if name in RETURN_OPS:
+                value = _const(instruction.argval) if name == "RETURN_CONST" else _pop(stack)
+                block.kind = "return"
+                # Returning None (explicitly, or at the end of the function) goes straight to End
+                block.label = None if value.text == "None" else value.text
+            elif name == "RAISE_VARARGS":
+                values = [_pop(stack) for _ in range(instruction.arg)]
+                block.kind = "raise"
+                block.label = values[-1].text if values else None
+            elif name == "RERAISE":
+                block.kind = "raise"
+            elif name in JUMP_OPS:
+                entry_stacks.setdefault(instruction.argval, list(stack))
+            elif name in ("FOR_ITER", "GET_ANEXT"):
+                iterator = stack[-1] if stack else _UNKNOWN
+                exit_offset = block.successors[-1]
+                entry_stacks.setdefault(exit_offset, _jump_stack(instruction, stack))
+                stack.append(_UNKNOWN)
+                block.kind = "for" if name == "FOR_ITER" else "async for"
+                block.label = iterator.text
+                # The statements up to the end of the loop target are part of the loop header
+                statement = _Statement(len(stack) - 1, loop=block)
+            elif _is_conditional(name):
+                entry_stacks.setdefault(instruction.argval, _jump_stack(instruction, stack))
+                # Where the jump is not taken, the tested value is popped
+                test = _pop(stack)
+                block.kind = "if"
+                block.label = _condition(name, test)
+                block.test = (line, test.text) if test.text is not None else None
+            else:
+                _step(code, instruction, stack, statement)
+                if statement.finished(stack, instruction):
+                    if statement.label is not None:
+                        block.statements.append(statement.label)
+                    statement = _Statement(len(stack))
+
+
+def _line(instruction, line):
+    """Return the source line of an instruction, given the line of the one before."""
+    positions = getattr(instruction, "positions", None)
+    if positions is not None and positions.lineno is not None:
+        return positions.lineno
+    # Before Python 3.11, only the first instruction of each line has its number
+    return instruction.starts_line or line
+
+
+def _falls_through(block):
+    return not _ends_flow(block)
+
+
+def _jump_stack(instruction, stack):
+    """Return the stack on the path where a conditional jump or FOR_ITER is taken."""
+    try:
+        depth = len(stack) + dis.stack_effect(instruction.opcode, instruction.arg, jump=True)
+    except ValueError:
+        return []
+    return stack[:max(depth, 0)] + [_UNKNOWN] * max(depth - len(stack), 0)
+
+
+def _condition(name, test):
+    """Return the condition under which a conditional jump falls through, as the source tests it."""
+    if test.text is None:
+        return None
+    # The compiler jumps over the then branch when the source condition does not hold
+    jumps_if = name[name.index("_IF_") + 4:].replace("_OR_POP", "")
+    if jumps_if == "NONE":
+        return f"{_operand(test)} is not None"
+    if jumps_if == "NOT_NONE":
+        return f"{_operand(test)} is None"
+    if jumps_if == "TRUE":
+        return test.text[4:] if test.text.startswith("not ") else f"not {_operand(test)}"
+    return test.text
+
+
+def _reachable_blocks(blocks, by_start):
+    seen = {blocks[0].start}
+    stack = [blocks[0]]
+    while stack:
+        for successor in stack.pop().successors:
+            if successor in by_start and successor not in seen:
+                seen.add(successor)
+                stack.append(by_start[successor])
+    return seen
+
+
+def _close_empty_loops(blocks, by_start, reachable, labels):
+    """Give a node to loops without any node of their own (e.g. 'while True: pass')."""
+    for block in blocks:
+        if block.start not in reachable or block.nodes:
+            continue
+        seen = set()
+        current = block
+        while not current.nodes and len(current.successors) == 1 and current.successors[0] in by_start:
+            if current.start in seen:
+                current.nodes.append(_new_node(labels, "While: True"))
+                break
+            seen.add(current.start)
+            current = by_start[current.successors[0]]
+
+
+def _entry(block, by_start, entry, end):
+    """Return the node flow enters a block at, following blocks that add no nodes."""
+    node = entry.get(block.start)
+    if node is None:
+        current = block
+        while not current.nodes:
+            if not current.successors or current.successors[0] not in by_start:
+                # A return of None, or a reraise: the function ends here
+                node = end
+                break
+            current = by_start[current.successors[0]]
+        else:
+            node = current.nodes[0]
+        entry[block.start] = node
+    return node
+
+
+def _build(labels, edges):
+    """Build the graph, adding each edge right after the later of its two nodes."""
+    end = len(labels) + 1
+    edges_at = [[] for _ in range(end + 1)]
+    seen = set()
+    for edge in edges:
+        if edge not in seen:
+            seen.add(edge)
+            edges_at[max(edge)].append(edge)
+    graph = FlowGraph()
+    for from_node, to_node in edges_at[START]:
+        graph.add_edge(from_node, to_node)
+    for label, at in zip(labels, edges_at[1:]):
+        graph.add_node(label)
+        for from_node, to_node in at:
+            graph.add_edge(from_node, to_node)
+    graph.add_end()
+    for from_node, to_node in edges_at[end]:
+        graph.add_edge(from_node, to_node)
+    return graph
+
+
+class _Statement:
+    """Tracks the statement being simulated, to tell where it ends and what it is."""
+
+    __slots__ = ("depth", "loop", "names", "kind", "definition", "keywords", "label")
+
+    def __init__(self, depth, loop=None):
+        self.depth = depth  # The stack depth before the statement
+        self.loop = loop  # The 'for' block whose target is being assigned, if any
+        self.names = []  # The names assigned, for a loop target (None for other targets)
+        self.kind = None  # 'AugAssign', 'Import' or 'Class' when an instruction tells so
+        self.definition = None  # The code object of a function being defined
+        self.keywords = ()  # The keyword names of the next call, from KW_NAMES
+        self.label = None  # (label, shown in compact mode) once the statement has ended
+
+    def finished(self, stack, instruction):
+        """Return True if instruction ends the statement, setting its label."""
+        name = instruction.opname
+        if len(stack) > self.depth or not (name.startswith(("STORE_", "DELETE_")) or name in (
+                "POP_TOP", "IMPORT_STAR")):
+            return False
+        if self.loop is not None:
+            # The loop target is part of the for node's label
+            if self.names and None not in self.names:
+                self.loop.target = ", ".join(self.names)
+        elif name.startswith("DELETE_"):
+            self.label = "Delete", False
+        elif name == "POP_TOP":
+            self.label = "Expr", False
+        elif self.kind == "Import" or name == "IMPORT_STAR":
+            self.label = "Import", False
+        elif self.kind == "Class":
+            self.label = f"Class {instruction.argval}", True
+        elif self.definition is not None and self.definition.co_name == instruction.argval:
+            kind = "Async Function" if self.definition.co_flags & CO_ASYNC else "Function"
+            self.label = f"{kind} {instruction.argval}", True
+        else:
+            self.label = self.kind or "Assign", False
+        return True
+
+
+def _const(value):
+    return _Value(repr(value), False, value)
+
+
+def _pop(stack):
+    return stack.pop() if stack else _UNKNOWN
+
+
+def _operand(value):
+    if value.text is None:
+        return None
+    return f"({value.text})" if value.compound else value.text
+
+
+def _binary(left, operator, right, compound=True):
+    left_text = _operand(left)
+    right_text = _operand(right)
+    if left_text is None or right_text is None:
+        return _UNKNOWN
+    return _Value(f"{left_text} {operator} {right_text}", compound)
+
+
+def _step(code, instruction, stack, statement):
+    """Apply one instruction to the simulated stack."""
+    name = instruction.opname
+    if name in NO_STACK_OPS:
+        return
+    if name in LOAD_NAME_OPS:
+        # Python 3.11 and later push a NULL with globals that are called ('NULL + print')
+        if instruction.argrepr.startswith("NULL"):
+            stack.append(_NULL)
+        stack.append(_Value(instruction.argval))
+        if instruction.argrepr.endswith("+ NULL"):
+            stack.append(_NULL)
+    elif name == "LOAD_CONST":
+        stack.append(_const(instruction.argval))
+    elif name in ("LOAD_ATTR", "LOAD_METHOD"):
+        owner = _operand(_pop(stack))
+        value = _Value(f"{owner}.{instruction.argval}") if owner is not None else _UNKNOWN
+        method = name == "LOAD_METHOD" or "NULL|self" in instruction.argrepr
+        if method and not instruction.argrepr.endswith("NULL|self"):
+            stack.append(_NULL)
+        stack.append(value)
+        if method and instruction.argrepr.endswith("NULL|self"):
+            stack.append(_NULL)
+    elif name == "SEND":
+        # The value sent to an awaitable, which is replaced by its result
+        _pop(stack)
+        if stack:
+            stack[-1] = _UNKNOWN
+    elif name == "PUSH_NULL":
+        stack.append(_NULL)
+    elif name == "KW_NAMES":
+        # Read from co_consts, as dis does not resolve the argument on every version
+        statement.keywords = code.co_consts[instruction.arg]
+    elif name in ("CALL", "CALL_FUNCTION", "CALL_METHOD", "CALL_FUNCTION_KW", "CALL_KW"):
+        keywords = statement.keywords
+        statement.keywords = ()
+        if name in ("CALL_FUNCTION_KW", "CALL_KW"):
+            # The names are a constant tuple above the arguments
+            keywords = _pop(stack).const or ()
+        arguments = [_pop(stack) for _ in range(instruction.arg)][::-1]
+        # The callable is next to a NULL, or a method next to its object, in either order
+        callable_ = _pop(stack)
+        if callable_ is _NULL:
+            callable_ = _pop(stack)
+        elif stack and stack[-1] is _NULL:
+            stack.pop()
+        stack.append(_call(callable_, arguments, keywords))
+    elif name in ("COMPARE_OP", "IS_OP", "CONTAINS_OP"):
+        right = _pop(stack)
+        left = _pop(stack)
+        if name == "IS_OP":
+            operator = "is not" if instruction.arg else "is"
+        elif name == "CONTAINS_OP":
+            operator = "not in" if instruction.arg else "in"
+        else:
+            operator = instruction.argrepr
+            if operator.startswith("bool(") and operator.endswith(")"):
+                operator = operator[5:-1]
+        stack.append(_binary(left, operator, right))
+    elif name == "BINARY_OP" or name.startswith(("BINARY_", "INPLACE_")) and name.split("_", 1)[1] in BINARY_OPERATORS:
+        right = _pop(stack)
+        left = _pop(stack)
+        operator = instruction.argrepr if name == "BINARY_OP" else BINARY_OPERATORS[name.split("_", 1)[1]]
+        if operator.endswith("=") or name.startswith("INPLACE_"):
+            statement.kind = "AugAssign"
+        stack.append(_binary(left, operator.rstrip("="), right))
+    elif name == "BINARY_SUBSCR":
+        index = _pop(stack)
+        owner = _operand(_pop(stack))
+        ok = owner is not None and index.text is not None
+        stack.append(_Value(f"{owner}[{index.text}]") if ok else _UNKNOWN)
+    elif name in UNARY_OPERATORS:
+        operand = _operand(_pop(stack))
+        stack.append(_Value(f"{UNARY_OPERATORS[name]}{operand}", True) if operand is not None else _UNKNOWN)
+    elif name in ("BUILD_TUPLE", "BUILD_LIST"):
+        items = [_pop(stack) for _ in range(instruction.arg)][::-1]
+        texts = [item.text for item in items]
+        if None in texts:
+            stack.append(_UNKNOWN)
+        elif name == "BUILD_LIST":
+            stack.append(_Value(f"[{', '.join(texts)}]"))
+        else:
+            stack.append(_Value(f"({texts[0]},)" if len(texts) == 1 else f"({', '.join(texts)})"))
+    elif name == "MAKE_FUNCTION":
+        function = _pop(stack)
+        if isinstance(function.const, str):
+            # Before Python 3.11 the qualified name is on top of the code object
+            function = _pop(stack)
+        for _ in range(bin((instruction.arg or 0) & 0x0f).count("1")):
+            _pop(stack)
+        if inspect.iscode(function.const) and not function.const.co_name.startswith("<"):
+            statement.definition = function.const
+        stack.append(_UNKNOWN)
+    elif name == "LOAD_BUILD_CLASS":
+        statement.kind = "Class"
+        stack.append(_UNKNOWN)
+    elif name == "IMPORT_NAME":
+        statement.kind = "Import"
+        _pop(stack)
+        _pop(stack)
+        stack.append(_UNKNOWN)
+    elif statement.loop is not None and name in STORE_NAME_OPS:
+        _pop(stack)
+        statement.names.append(instruction.argval)
+    elif name in ("SWAP", "ROT_TWO", "ROT_THREE", "ROT_FOUR"):
+        # SWAP n exchanges the top with the nth value; ROT_n moves the top down to the nth place
+        depth = instruction.arg if name == "SWAP" else ROTATIONS[name]
+        if len(stack) < depth:
+            # The value coming up was pushed before the statement
+            stack[-1:] = [_UNKNOWN]
+        elif name == "SWAP":
+            stack[-1], stack[-depth] = stack[-depth], stack[-1]
+        else:
+            stack.insert(-(depth - 1), stack.pop())
+    elif name in ("COPY", "DUP_TOP", "DUP_TOP_TWO"):
+        # COPY n pushes the nth value again; DUP_TOP_TWO copies the top two in order
+        depth, count = (instruction.arg, 1) if name == "COPY" else (1, 1) if name == "DUP_TOP" else (2, 2)
+        for _ in range(count):
+            stack.append(stack[-depth] if len(stack) >= depth else _UNKNOWN)
+    elif name in ("UNPACK_SEQUENCE", "UNPACK_EX"):
+        _pop(stack)
+        if name == "UNPACK_SEQUENCE":
+            count = instruction.arg
+        else:
+            # The names before and after the starred one, and the starred one
+            count = (instruction.arg & 0xff) + (instruction.arg >> 8) + 1
+        stack.extend([_UNKNOWN] * count)
+    else:
+        _unknown_effect(instruction, stack, statement)
+
+
+def _unknown_effect(instruction, stack, statement):
+    """Apply an instruction the labels do not follow, keeping only the stack depth right."""
+    if statement.loop is not None:
+        # A loop target that is not a plain name (e.g. an attribute or a subscript)
+        statement.names.append(None)
+    try:
+        effect = dis.stack_effect(instruction.opcode, instruction.arg, jump=False)
+    except ValueError:
+        effect = 0
+    for _ in range(-effect):
+        _pop(stack)
+    if effect > 0:
+        stack.extend([_UNKNOWN] * effect)
+    elif stack and not instruction.opname.startswith(("STORE_", "DELETE_", "POP_")):
+        stack[-1] = _UNKNOWN
+
+
+def _call(callable_, arguments, keywords):
+    function = _operand(callable_)
+    texts = [argument.text for argument in arguments]
+    if function is None or None in texts:
+        return _UNKNOWN
+    if keywords:
+        positional = len(texts) - len(keywords)
+        texts = texts[:positional] + [f"{keyword}={text}" for keyword, text in zip(keywords, texts[positional:])]
+    return _Value(f"{function}({', '.join(texts)})")
@@ -0,0 +1,198 @@
+"""
+Persistent on-disk cache for generated diagrams.
+
+Entries are keyed by a hash of everything a diagram depends on (the function's
+normalized source, its qualified name and the generator options), so an
+unchanged function is served from the cache without being visited again. The
+cache is bounded in size and evicts the least recently used entries first.
+"""
+
+import hashlib
+import io
+import os
+import tempfile
+import textwrap
+from collections import OrderedDict
+
+from flomatic.serializers import BINARY_FORMATS, FORMATS, format_suffix
+
+# Module indexes are stored with this suffix, and diagrams with that of their format (e.g. .mmd or .dot)
+INDEX_SUFFIX = ".index"
+ENTRY_SUFFIXES = tuple(suffix for _, suffix in FORMATS.values()) + (INDEX_SUFFIX,)
+
+# An instance measures the directory again after writing this fraction of max_size, so that
+# processes sharing a directory (e.g. the workers of a parallel run) keep it within about
+# max_size between them rather than each within max_size of its own
+RESCAN_FRACTION = 16
+
+
+def cache_key(*parts):
+    """Return a hex digest identifying the given parts, in order."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def source_lines(source_code):
+    """Split source code into lines the same way the parser numbers them."""
+    return io.StringIO(source_code, newline=None).readlines()
+
+
+def normalized_source(lines, start_line, end_line):
+    """Return the source of lines start_line..end_line (1-based, inclusive), dedented
+    and with trailing whitespace removed, so that re-indenting a function does not
+    change its cache key.
+    """
+    segment = textwrap.dedent("".join(lines[start_line - 1:end_line]))
+    return "\n".join(line.rstrip() for line in segment.splitlines())
+
+
+class DiagramCache:
+    """A size-bounded LRU cache of diagrams stored as files in a directory.
+
+    Diagrams are stored under their key with the file suffix of their format
+    (e.g. .mmd or .adj). The cache can also
+    hold per-module indexes (a JSON list of the diagrams for a whole source file)
+    so that an unchanged file can be served without being parsed at all. Recency
+    is tracked through file modification times, so it carries over between runs
+    and is shared by the processes using the same directory. Each of them may take
+    the directory over max_size by at most max_size / RESCAN_FRACTION before it
+    measures the directory again and evicts what the others wrote too.
+
+    Attributes:
+        hits (int): Number of diagram lookups served from the cache.
+        misses (int): Number of diagram lookups that were not in the cache.
+        evictions (int): Number of entries removed to stay within max_size.
+    """
+
+    def __init__(self, cache_dir, max_size=256 * 1024 * 1024):
+        """Open (creating if necessary) a cache directory.
+
+        Args:
+            cache_dir (str): Directory holding the cache entries.
+            max_size (int, optional): Maximum total size of the entries in bytes.
+                                    Defaults to 256 MiB.
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._entries = OrderedDict()
+        self._scan()
+
+    def get(self, key, format="mermaid"):
+        """Return the cached diagram for key in an output format, or None if it is not cached.
+
+        Diagrams in a binary format are returned as bytes.
+        """
+        data = self._read(key + format_suffix(format), binary=format in BINARY_FORMATS)
+        if data is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return data
+
+    def put(self, key, data, format="mermaid"):
+        """Store a diagram in an output format under key."""
+        self._write(key + format_suffix(format), data)
+
+    def get_index(self, key):
+        """Return the cached module index for key, or None. Not counted as a hit or miss."""
+        return self._read(key + INDEX_SUFFIX)
+
+    def put_index(self, key, text):
+        """Store a module index under key."""
+        self._write(key + INDEX_SUFFIX, text)
+
+    def stats(self):
+        """Return the cache counters and current size as a dictionary."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "size": self._size,
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _scan(self):
+        """Measure the entries in the directory, including those written by other processes."""
+        # Modification times can tie, so entries this instance used keep their order among equals
+        rank = {name: i for i, name in enumerate(self._entries, 1)}
+        # Entry file names mapped to their sizes, least recently used first
+        self._entries = OrderedDict()
+        self._size = 0
+        self._written = 0  # Bytes written since the directory was measured
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(ENTRY_SUFFIXES):
+                try:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    # Evicted by another process meanwhile
+                    continue
+                entries.append((stat.st_mtime_ns, rank.get(entry.name, 0), entry.name, stat.st_size))
+        for _, _, name, size in sorted(entries):
+            self._entries[name] = size
+            self._size += size
+
+    def _read(self, name, binary=False):
+        path = os.path.join(self.cache_dir, name)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            self._forget(name)
+            return None
+        # Mark the entry as most recently used, in memory and on disk
+        if name not in self._entries:
+            self._entries[name] = len(data)
+            self._size += self._entries[name]
+        self._entries.move_to_end(name)
+        try:
+            os.utime(path)
+        except OSError:
+            # Evicted by another process since it was read, which does not make the data stale
+            pass
+        return data if binary else data.decode("utf-8")
+
+    def _write(self, name, data):
+        if not isinstance(data, bytes):
+            data = data.encode("utf-8")
+        # Write atomically so concurrent readers never see a partial entry
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, os.path.join(self.cache_dir, name))
+
+        self._forget(name)
+        self._entries[name] = len(data)
+        self._size += len(data)
+        self._written += len(data)
+        if self._size > self.max_size or self._written > self.max_size // RESCAN_FRACTION:
+            self._scan()
+        self._evict()
+
+    def _forget(self, name):
+        size = self._entries.pop(name, None)
+        if size is not None:
+            self._size -= size
+
+    def _evict(self):
+        # Remove least recently used entries until the cache fits, always keeping the newest one
+        while self._size > self.max_size and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self._size -= size
+            self.evictions += 1
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,261 @@
+"""
+Command-line interface for generating flowchart diagrams.
+
+Accepts any mix of source files, directories, .whl and .zip archives, glob
+patterns and dotted module names, and saves the per-function diagrams of
+every matched file under the output directory, one subdirectory per file.
+The generator modules are only imported once the arguments have been
+parsed, so --help and runs where nothing changed start quickly.
+
+Usage:
+    python -m flomatic [options] PATH [PATH ...]
+    python -m flomatic --watch [options] PATH [PATH ...]
+    python -m flomatic --diff BASE[..HEAD] [options] [PATH ...]
+"""
+
+import argparse
+import glob
+import os
+import sys
+
+FORMAT_CHOICES = ["mermaid", "dot", "json", "adjacency"]
+
+
+def glob_root(pattern):
+    """Return the directory part of a glob pattern before its first wildcard.
+
+    Files matched by the pattern keep their path relative to this directory
+    in the output, e.g. src/**/*.py -> src.
+    """
+    parts = []
+    for part in pattern.replace(os.sep, "/").split("/"):
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return "/".join(parts) or "."
+
+
+def collect_sources(paths, include=("*.py",), exclude=()):
+    """Expand files, directories, archives, glob patterns and module names into (source file, root) pairs.
+
+    Directories, and .whl and .zip archives, are searched recursively for files
+    matching include and not exclude; the files in an archive are read from it
+    later without extracting them. Files named directly or matched by a glob
+    are kept unless they match exclude. A path that does not exist and is a
+    dotted name (e.g. 'email.mime') is looked up as a module or package without
+    importing it. Each source file is listed once, in the order found.
+
+    Returns:
+        tuple: The (source file, root) pairs, and the paths that matched nothing.
+    """
+    from flomatic.project import discover_sources, matches_any, module_sources
+    from flomatic.sources import is_archive
+
+    sources = []
+    seen = set()
+    unmatched = []
+
+    def add(source_file, root):
+        key = os.path.abspath(source_file)
+        if key not in seen:
+            seen.add(key)
+            sources.append((source_file, root))
+
+    for path in paths:
+        if glob.has_magic(path):
+            root = glob_root(path)
+            matches = sorted(glob.glob(path, recursive=True))
+        elif os.path.exists(path):
+            root = path
+            matches = [path]
+        else:
+            # Not a path, so maybe a module name
+            modules = module_sources(path, include, exclude)
+            for source_file, module_root in modules:
+                add(source_file, module_root)
+            if not modules:
+                unmatched.append(path)
+            continue
+        found = len(sources)
+        for match in matches:
+            if os.path.isdir(match) or is_archive(match):
+                for source_file in discover_sources(match, include, exclude):
+                    add(source_file, root if root != path else match)
+            elif not matches_any(os.path.relpath(match, root) if root != path else match, exclude):
+                add(match, root)
+        if len(sources) == found and not matches:
+            unmatched.append(path)
+    return sources, unmatched
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="flomatic",
+        description="Generate a flowchart diagram for every function in Python source files.")
+    parser.add_argument("paths", nargs="*", metavar="PATH",
+                        help="source files, directories or .whl/.zip archives to search, glob patterns "
+                             "(quote them, ** is supported), or dotted module names; with --diff, the "
+                             "paths in the repository to compare (default: all)")
+    parser.add_argument("-o", "--output-dir", default="mermaid_diagrams",
+                        help="directory for the diagrams (default: mermaid_diagrams)")
+    parser.add_argument("--include", action="append", metavar="PATTERN",
+                        help="only diagram files matching this glob, by name or relative path "
+                             "(repeatable, default: *.py)")
+    parser.add_argument("--exclude", action="append", default=[], metavar="PATTERN",
+                        help="skip files and directories matching this glob (repeatable)")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("--format", default="mermaid", choices=FORMAT_CHOICES, help="output format")
+    detail = parser.add_mutually_exclusive_group()
+    detail.add_argument("--compact", dest="compact", action="store_true", default=True,
+                        help="only include control flow elements (default)")
+    detail.add_argument("--full", dest="compact", action="store_false",
+                        help="include every AST node")
+    parser.add_argument("--max-label-length", type=int, metavar="N",
+                        help="cut expressions in labels to at most N characters")
+    parser.add_argument("--simplify", action="store_true",
+                        help="remove unreachable nodes, collapse placeholders and merge linear chains")
+    parser.add_argument("--max-nodes", type=int, metavar="N",
+                        help="fold nested blocks and runs of statements of diagrams with more than N nodes "
+                             "into linked sub-diagrams")
+    parser.add_argument("--cache-dir", help="directory of a diagram cache shared between runs")
+    parser.add_argument("--cache-size", type=int, default=256, metavar="MB",
+                        help="maximum size of the cache in MiB (default: 256)")
+    parser.add_argument("--dedupe", action="store_true",
+                        help="store diagrams drawn by several functions once, in the _shared directory, "
+                             "and leave a stub naming it in each function's file")
+    parser.add_argument("--changed-only", action="store_true",
+                        help="only regenerate diagrams of files changed since the last run, "
+                             "and remove those of deleted functions")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running, and update the diagrams of files as they are saved")
+    parser.add_argument("--diff", metavar="BASE[..HEAD]",
+                        help="only diagram the functions changed between two git revisions, or between "
+                             "BASE and the working tree (BASE...HEAD compares HEAD with where it "
+                             "branched off BASE)")
+    parser.add_argument("--stats", nargs="?", const="-", metavar="REPORT",
+                        help="report phase timings and visit counts; with a file name, also write "
+                             "them there as JSON")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only report failures")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.dedupe and (args.watch or args.changed_only or args.diff is not None):
+        parser.error("--dedupe cannot be combined with --watch, --changed-only or --diff")
+    if args.diff is not None:
+        if args.watch or args.changed_only:
+            parser.error("--diff cannot be combined with --watch or --changed-only")
+        return diff(args)
+    if not args.paths:
+        parser.error("the following arguments are required: PATH")
+
+    sources, unmatched = collect_sources(args.paths, args.include or ["*.py"], args.exclude)
+    for path in unmatched:
+        print(f"flomatic: no such file or no match: {path}", file=sys.stderr)
+    if unmatched and not sources:
+        return 1
+
+    if args.watch:
+        return watch(args)
+
+    from flomatic.project import generate_diagrams
+
+    stats = None
+    if args.stats:
+        from flomatic.stats import GeneratorStats
+        stats = GeneratorStats()
+    shared = None
+    if args.dedupe:
+        from flomatic.dedupe import SharedDiagrams
+        shared = SharedDiagrams(args.output_dir)
+    result = generate_diagrams(sources, args.output_dir, jobs=args.jobs, compact=args.compact,
+                               cache_dir=args.cache_dir, cache_size=args.cache_size * 1024 * 1024,
+                               format=args.format, changed_only=args.changed_only, stats=stats,
+                               max_label_length=args.max_label_length, simplify=args.simplify,
+                               max_nodes=args.max_nodes, shared=shared)
+    if shared is not None:
+        shared.prune()
+
+    if not args.quiet:
+        written = sum(len(paths) for paths in result.saved_files.values())
+        removed = sum(len(paths) for paths in result.removed.values())
+        if args.changed_only:
+            print(f"Updated {written} and removed {removed} diagrams in {args.output_dir} "
+                  f"({len(result.unchanged)} of {len(sources)} files unchanged)")
+        else:
+            print(f"Saved {written} diagrams for {len(result.saved_files)} files to {args.output_dir}")
+        if shared is not None:
+            print(shared.summary())
+    if stats is not None:
+        print(stats.summary(), file=sys.stderr)
+        if args.stats != "-":
+            stats.write_json(args.stats)
+    for source_file, error in result.failures.items():
+        print(f"  failed: {source_file}: {error}", file=sys.stderr)
+    return 1 if result.failures or unmatched else 0
+
+
+def diff(args):
+    """Diagram the functions changed between two git revisions, reporting those removed."""
+    from flomatic.code_to_mermaid import FlowchartGenerator
+    from flomatic.gitdiff import generate_diff_diagrams, parse_revisions
+
+    generator = FlowchartGenerator(max_label_length=args.max_label_length, simplify=args.simplify,
+                                   max_nodes=args.max_nodes)
+    try:
+        base, head = parse_revisions(args.diff)
+        result = generate_diff_diagrams(base, head, args.output_dir, args.paths, args.include or ["*.py"],
+                                        args.exclude, generator=generator, compact=args.compact,
+                                        format=args.format)
+    except (OSError, ValueError) as e:
+        print(f"flomatic: {e}", file=sys.stderr)
+        return 1
+
+    if not args.quiet:
+        written = sum(len(paths) for paths in result.saved_files.values())
+        print(f"Saved {written} diagrams of changed functions in {len(result.saved_files)} files "
+              f"to {args.output_dir}")
+        for source_file, names in result.removed.items():
+            print(f"  removed: {source_file}: {', '.join(names)}")
+    for source_file, error in result.failures.items():
+        print(f"  failed: {source_file}: {error}", file=sys.stderr)
+    return 1 if result.failures else 0
+
+
+def watch(args):
+    """Run in watch mode until interrupted, reporting every update."""
+    from flomatic.cache import DiagramCache
+    from flomatic.code_to_mermaid import FlowchartGenerator
+    from flomatic.watch import DiagramWatcher
+
+    include = args.include or ["*.py"]
+    generator = FlowchartGenerator(max_label_length=args.max_label_length, simplify=args.simplify,
+                                   max_nodes=args.max_nodes)
+    cache = DiagramCache(args.cache_dir, args.cache_size * 1024 * 1024) if args.cache_dir else None
+    watcher = DiagramWatcher(lambda: collect_sources(args.paths, include, args.exclude)[0], args.output_dir,
+                             generator, args.compact, args.format, cache)
+
+    def report(result):
+        if not args.quiet:
+            written = sum(len(paths) for paths in result.saved_files.values())
+            removed = sum(len(paths) for paths in result.removed.values())
+            print(f"Updated {written} and removed {removed} diagrams in {args.output_dir}", flush=True)
+        for source_file, error in result.failures.items():
+            print(f"  failed: {source_file}: {error}", file=sys.stderr, flush=True)
+
+    if not args.quiet:
+        print("Watching for changes (press Ctrl+C to stop)", flush=True)
+    try:
+        watcher.run(report)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,366 +1,1376 @@
 import ast
+import itertools
+import json
 import os
 import re
+from collections import namedtuple
 
-class FlowchartGenerator(ast.NodeVisitor):
-    def __init__(self):
-        self.flowchart = ["flowchart TD"]
-        self.node_count = 0
-        self.last_node = "Start"
-        self.loop_start_node = None  # Reference to the current loop start for continue statements
-        self.after_loop_node = None  # Reference to the node after the loop for break statements
-        self.end_node = "End"  # Reference to the End node for terminal nodes
-        self.terminal_nodes = []  # List to track all terminal nodes that should connect to End
+from flomatic.cache import cache_key, normalized_source, source_lines
+from flomatic.function_index import FunctionIndex
+from flomatic.graph import START, FlowGraph
+from flomatic.manifest import Manifest
+from flomatic.serializers import format_suffix, serialize
+from flomatic.simplify import simplify_graph
+from flomatic.sources import read_source, source_mtime
+from flomatic.stats import instrument, uninstrument
+
+# Version of the generated diagrams. Bump it whenever a change alters the output,
+# so that cached diagrams from older versions are no longer used.
+RENDERER_VERSION = 4
+
+
+def diagram_filename(func_name, format="mermaid"):
+    """Return the name of the file a function's diagram is saved to in the given output format."""
+    # Create a safe filename
+    safe_name = re.sub(r'[^\w\-_\.]', '_', func_name)
+    return f"{safe_name}{format_suffix(format)}"
+
+
+def diagram_options(compact=True, format="mermaid", max_label_length=None, simplify=False, max_nodes=None):
+    """Return the hash of the generator options recorded in the manifest with each source file."""
+    return cache_key(RENDERER_VERSION, compact, format, max_label_length, simplify, max_nodes)
+
+
+def write_diagram(file_path, text):
+    """Write a diagram to a file, leaving the file untouched if it already has that content.
+    
+    Text is written as a text file and bytes (binary formats) as a binary file. A link to
+    a diagram shared with other functions (see flomatic.dedupe) is replaced by a file of
+    its own rather than written through.
+    
+    Returns:
+        bool: True if the file was written.
+    """
+    mode = 'b' if isinstance(text, bytes) else ''
+    try:
+        with open(file_path, 'r' + mode) as f:
+            if f.read() == text:
+                return False
+    except FileNotFoundError:
+        pass
+    if os.path.islink(file_path):
+        os.remove(file_path)
+    with open(file_path, 'w' + mode) as f:
+        f.write(text)
+    return True
+
+# A compound statement (or a statement of a body, or a run of statements as a tuple) visited
+# while measuring a flowchart against the node budget: its first node and number of nodes in
+# the graph, and whether it contains a return or raise
+FoldableBlock = namedtuple("FoldableBlock", ["node", "scope", "start", "size", "exits"])
+
+LOOP_TYPES = (ast.For, ast.AsyncFor, ast.While)
+SCOPE_TYPES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)
+
+
+def part_name(name, number):
+    """Return the name of a sub-diagram split off a flowchart, e.g. 'process-2'.
+    
+    Python names cannot contain '-', so part names never clash with function names.
+    """
+    return f"{name}-{number}"
 
-    def add_node(self, label):
-        self.node_count += 1
-        node_name = f"node{self.node_count}"
-        # Proper Mermaid syntax for nodes
-        self.flowchart.append(f"{node_name}[\"{label}\"]")
-        return node_name
 
+def _loop_leavers(root):
+    """Return the nodes under root in which a break or continue belongs to a loop outside them.
+    
+    Args:
+        root (ast.AST or tuple): The node to search, or a tuple of statements.
+    
+    Returns:
+        set: The nodes found, worked out bottom-up in one pass so that nested blocks (e.g. the
+             elifs of a long chain) are not searched again for each block they are nested in.
+    """
+    leavers = set()
+    escapes = set()  # Nodes a break or continue leaves (those of leavers that are not scopes)
+    stack = [(node, False) for node in (root if isinstance(root, tuple) else (root,))]
+    while stack:
+        node, visited = stack.pop()
+        if not visited:
+            stack.append((node, True))
+            stack.extend((child, False) for child in ast.iter_child_nodes(node))
+        elif isinstance(node, (ast.Break, ast.Continue)):
+            escapes.add(node)
+        # The body of a loop is its own; only the else clause can break out of an outer loop
+        elif any(child in escapes for child in (node.orelse if isinstance(node, LOOP_TYPES)
+                                                else ast.iter_child_nodes(node))):
+            leavers.add(node)
+            if not isinstance(node, SCOPE_TYPES):
+                escapes.add(node)
+    return leavers
+
+
+def _within(block, other):
+    """Return True if the nodes of a measured block (or run of statements) are all in another's."""
+    return other.start <= block.start and block.start + block.size <= other.start + other.size
+
+
+def _foldable(visit_block):
+    """Let the node budget measure or fold the compound statements a visitor method handles."""
+    def visit(self, node, context, *args):
+        if context.blocks is None and context.folds is None:
+            return visit_block(self, node, context, *args)
+        return self._visit_foldable(node, context, visit_block, args)
+    visit.__name__ = visit_block.__name__
+    visit.__doc__ = visit_block.__doc__
+    return visit
+
+
+# The settings of a FlowchartGenerator. Immutable, so that one generator can be shared by
+# many threads; use FlowchartGenerator.with_options for a generator with other settings.
+FlowchartOptions = namedtuple("FlowchartOptions", ["max_label_length", "simplify", "max_nodes"],
+                              defaults=(None, False, None))
+
+
+class LabelSource:
+    """The source text a parsed tree's labels are sliced from, and the labels memoized per AST node.
+    
+    Made for each call of the generator and shared by every flowchart it draws from the tree, so
+    that an expression drawn more than once (e.g. when a function is visited again with blocks
+    folded to fit max_nodes) is only rendered once. Never kept on the generator, so that the
+    source and tree are freed after the call and threads sharing a generator do not share it.
+    """
+    __slots__ = ("source_code", "tree", "lines", "labels")
+    
+    def __init__(self, source_code, tree, lines=None):
+        self.source_code = source_code
+        self.tree = tree
+        self.lines = lines  # Split when first needed
+        self.labels = {}
+
+
+class FlowContext:
+    """The state of one flowchart being built, passed to every visitor method.
+    
+    Attributes:
+        graph (FlowGraph): The flowchart being built, with integer node ids.
+        last_node (int): The node the next statement's node is connected from.
+        loop_stack (list): (loop start, after loop) node pairs of the loops being visited, innermost
+                         last: continue statements go to the start of the innermost loop and break
+                         statements after it.
+        terminal_nodes (list): Nodes that are connected to End (returns and raises).
+        folded_exits (list): Summary nodes of folded blocks that contain a return or raise.
+        blocks (list): The compound statements measured against the node budget, or None.
+        bodies (list): The statement lists measured against the node budget, as lists of
+                     FoldableBlock (one per statement), or None.
+        folds (dict): The blocks to fold, and the first statements of the runs of statements to
+                    fold, mapped to the label of their summary node, whether they can return and
+                    the number of statements in the run (None for a block), or None.
+        current_scope (str): The qualified name of the class or function being visited, or None.
+        target_function (str): The qualified name of the only function to visit, or None for all.
+        compact (bool): Whether only control flow elements get nodes.
+        labels (LabelSource): Where labels are sliced from, or None to unparse every expression.
+    """
+    __slots__ = ("graph", "last_node", "loop_stack", "terminal_nodes", "folded_exits", "blocks", "bodies",
+                 "folds", "current_scope", "target_function", "compact", "labels")
+    
+    def __init__(self, target_function=None, compact=True, labels=None, scope=None):
+        # A new graph starts with its Start node
+        self.graph = FlowGraph()
+        self.last_node = START
+        self.loop_stack = []
+        self.terminal_nodes = []
+        self.folded_exits = []
+        self.blocks = None
+        self.bodies = None
+        self.folds = None
+        self.current_scope = scope
+        self.target_function = target_function
+        self.compact = compact
+        self.labels = labels
+    
+    def add_node(self, label):
+        # Nodes are integer ids in the graph; names like node3 are only given by serializers
+        return self.graph.add_node(label)
+    
     def add_connection(self, from_node, to_node):
         # Simple connection between nodes
-        self.flowchart.append(f"{from_node} --> {to_node}")
+        self.graph.add_edge(from_node, to_node)
+
+
+class FlowchartGenerator:
+    """Builds flowcharts of Python source code.
+    
+    A generator only holds its options: everything about the flowchart being built lives in a
+    FlowContext created for each call, so one generator can be reused for any number of
+    diagrams and shared by many threads. Only enable_stats is meant for a single thread.
+    """
+    
+    def __init__(self, max_label_length=None, simplify=False, max_nodes=None, options=None):
+        """Create a generator.
+        
+        Args:
+            max_label_length (int, optional): If provided, the expressions shown in labels (conditions,
+                                            loop targets and iterables, return values) are cut to at
+                                            most this many characters, ending in '...'.
+            simplify (bool, optional): If True, every graph is passed through simplify_graph before
+                                     it is returned or serialized: unreachable nodes are removed,
+                                     placeholders such as 'Then' are collapsed and linear chains
+                                     are merged. Defaults to False.
+            max_nodes (int, optional): A node budget for each diagram. A flowchart with more nodes
+                                     has nested blocks (if, for, while, try, with and match
+                                     statements) folded into summary nodes, labelled with the
+                                     name of a sub-diagram drawn for the block, until it fits.
+                                     Long runs of statements are folded too, into nodes such
+                                     as 'Lines 12-40 (see process-1)'. Sub-diagrams
+                                     are split the same way. The budget is kept in compact mode
+                                     with one exception: statements that break or continue a loop
+                                     outside themselves are never folded, so a loop made of many
+                                     of them can stay over it. In detailed mode, the nodes of a
+                                     single statement's expressions are never folded either, and
+                                     no diagram can be smaller than a block's own nodes (a budget
+                                     under about 8 is not always kept).
+            options (FlowchartOptions, optional): All of the above at once. If provided, the other
+                                                arguments are ignored.
+        """
+        self.options = options if options is not None else FlowchartOptions(max_label_length, simplify, max_nodes)
+        # Visitor methods by AST node type, so dispatching a node is a single dictionary lookup
+        self._visitors = {}
+        for name in dir(type(self)):
+            node_type = getattr(ast, name[len("visit_"):], None) if name.startswith("visit_") else None
+            if isinstance(node_type, type):
+                self._visitors[node_type] = getattr(self, name)
+
+    @property
+    def max_label_length(self):
+        return self.options.max_label_length
+
+    @property
+    def simplify(self):
+        return self.options.simplify
 
-    def generic_visit(self, node):
+    @property
+    def max_nodes(self):
+        return self.options.max_nodes
+
+    def with_options(self, **changes):
+        """Return a new generator with some options changed, e.g. with_options(simplify=True)."""
+        return type(self)(options=self.options._replace(**changes))
+
+    def enable_stats(self, stats=None):
+        """Start recording phase timings, per-node-type visit counts and emitted nodes and edges.
+        
+        The recording is not synchronized, so a generator with stats enabled should only be used
+        by one thread at a time.
+        
+        Args:
+            stats (GeneratorStats, optional): Where to record, e.g. to combine several generators.
+                                            Defaults to a new GeneratorStats.
+            
+        Returns:
+            GeneratorStats: The stats being recorded into.
+        """
+        return instrument(self, stats)
+
+    def disable_stats(self):
+        """Stop recording stats; the generator runs without any instrumentation again."""
+        uninstrument(self)
+
+    # Steps of the generator that are timed as phases when stats are enabled
+
+    def _index_source(self, source_code):
+        return FunctionIndex.from_source(source_code)
+
+    def _parse_source(self, source_code):
+        return ast.parse(source_code)
+
+    def _serialize(self, graph, format):
+        return serialize(graph, format)
+
+    def _label_text(self, node, context):
+        """Return the text of an expression for a label, truncated to max_label_length.
+        
+        The text is sliced from the source by the node's position when the expression is on
+        a single line, and unparsed from the AST otherwise. It is memoized per node in the
+        context's LabelSource.
+        """
+        labels = context.labels
+        label = labels.labels.get(node) if labels is not None else None
+        if label is None:
+            label = self._source_segment(node, labels)
+            if label is None:
+                label = ast.unparse(node)
+            limit = self.options.max_label_length
+            if limit is not None and len(label) > limit:
+                label = label[:max(limit - 3, 0)] + "..."
+            if labels is not None:
+                labels.labels[node] = label
+        return label
+
+    def _source_segment(self, node, labels):
+        """Return the source text of a single-line expression, or None if it cannot be sliced."""
+        if labels is None or getattr(node, "end_lineno", None) != node.lineno:
+            return None
+        if labels.lines is None:
+            labels.lines = source_lines(labels.source_code)
+        line = labels.lines[node.lineno - 1]
+        # Column offsets count UTF-8 bytes, which are characters only for ASCII lines
+        if line.isascii():
+            return line[node.col_offset:node.end_col_offset]
+        return line.encode("utf-8")[node.col_offset:node.end_col_offset].decode("utf-8")
+
+    def _read_source(self, source_file):
+        return read_source(source_file)
+
+    def _write_diagram(self, file_path, text):
+        return write_diagram(file_path, text)
+
+    def visit(self, node, context):
+        """Visit an AST node, adding its part of the flowchart to the context."""
+        visitor = self._visitors.get(type(node))
+        if visitor is None:
+            return self.generic_visit(node, context)
+        return visitor(node, context)
+
+    def _visit_foldable(self, node, context, visit_block, args):
+        """Visit a compound statement while measuring blocks or folding them."""
+        if context.folds is not None:
+            folded = context.folds.get(node)
+            if folded is None:
+                return visit_block(self, node, context, *args)
+            # Stand in for the whole block with one node that names its sub-diagram
+            label, exits, _ = folded
+            self._add_summary(label, exits, context)
+            return
+        
+        start = context.graph.node_count
+        terminals = len(context.terminal_nodes)
+        visit_block(self, node, context, *args)
+        context.blocks.append(FoldableBlock(node, context.current_scope, start, context.graph.node_count - start,
+                                            len(context.terminal_nodes) > terminals))
+
+    def _visit_body(self, statements, context):
+        """Visit a list of statements in order, measuring them or folding runs of them."""
+        if context.bodies is not None:
+            body = []
+            for n in statements:
+                start = context.graph.node_count
+                terminals = len(context.terminal_nodes)
+                self.visit(n, context)
+                body.append(FoldableBlock(n, context.current_scope, start, context.graph.node_count - start,
+                                          len(context.terminal_nodes) > terminals))
+            context.bodies.append(body)
+            return
+        position = 0
+        while position < len(statements):
+            folded = context.folds.get(statements[position]) if context.folds is not None else None
+            if folded is None or folded[2] is None:
+                self.visit(statements[position], context)
+                position += 1
+                continue
+            # Stand in for the whole run with one node that names its sub-diagram
+            label, exits, count = folded
+            self._add_summary(label, exits, context)
+            position += count
+
+    def _add_summary(self, label, exits, context):
+        """Add the summary node of a folded block or run, connected to End if it can return."""
+        summary_node = context.add_node(label)
+        context.add_connection(context.last_node, summary_node)
+        if exits:
+            context.folded_exits.append(summary_node)
+        context.last_node = summary_node
+
+    def generic_visit(self, node, context):
         # If in compact mode, only visit children without creating nodes for non-control flow elements
-        if hasattr(self, 'compact') and self.compact:
+        if context.compact:
             # Just continue visiting children
-            super().generic_visit(node)
+            for child in ast.iter_child_nodes(node):
+                self.visit(child, context)
         else:
             # Provide a fallback for unhandled nodes that logs an info
             node_type = type(node).__name__
-            new_node = self.add_node(f"{node_type}")
-            self.add_connection(self.last_node, new_node)
-            prev_node = self.last_node
-            self.last_node = new_node
-            super().generic_visit(node)
+            new_node = context.add_node(f"{node_type}")
+            context.add_connection(context.last_node, new_node)
+            prev_node = context.last_node
+            context.last_node = new_node
+            for child in ast.iter_child_nodes(node):
+                self.visit(child, context)
             # Restore the previous node as the last node
-            self.last_node = prev_node
+            context.last_node = prev_node
+
+    def visit_Module(self, node, context):
+        # In compact mode the module's statements follow on from Start like a function body's
+        if context.compact:
+            self._visit_body(node.body, context)
+        else:
+            self.generic_visit(node, context)
+
+    def visit_FunctionDef(self, node, context):
+        self._visit_function(node, context, "Function")
 
-    def visit_FunctionDef(self, node):
-        # Determine the full function name
-        if hasattr(self, 'current_class') and self.current_class:
-            full_func_name = f"{self.current_class}.{node.name}"
+    def visit_AsyncFunctionDef(self, node, context):
+        self._visit_function(node, context, "Async Function")
+
+    def _visit_function(self, node, context, kind):
+        # Determine the fully qualified function name
+        if context.current_scope:
+            full_func_name = f"{context.current_scope}.{node.name}"
         else:
             full_func_name = node.name
-            
-        # Store function name if we need it later
-        if hasattr(self, 'function_names'):
-            self.function_names.append(full_func_name)
         
         # If we're targeting a specific function and this isn't it, skip processing its body
-        if hasattr(self, 'target_function') and self.target_function and self.target_function != full_func_name:
+        if context.target_function and context.target_function != full_func_name:
             return
             
         # Always show function definitions, even in compact mode
-        func_node = self.add_node(f"Function {node.name}")
-        self.add_connection(self.last_node, func_node)
-        self.last_node = func_node
-        
-        # Visit the body of the function
-        for n in node.body:
-            self.visit(n)
-
-    def visit_If(self, node):
-        # If condition
-        cond_node = self.add_node(f"If: {ast.unparse(node.test)}")
-        self.add_connection(self.last_node, cond_node)
-        self.last_node = cond_node
-
-        # Then branch
-        then_node = self.add_node("Then")
-        self.add_connection(cond_node, then_node)
-        last_then = self.last_node
-        self.last_node = then_node
-        for n in node.body:
-            self.visit(n)
-        self.last_node = last_then
-
-        # Else branch
-        if node.orelse:
-            else_node = self.add_node("Else")
-            self.add_connection(cond_node, else_node)
-            last_else = self.last_node
-            self.last_node = else_node
-            for n in node.orelse:
-                self.visit(n)
-            self.last_node = last_else
-
-    def visit_For(self, node):
+        func_node = context.add_node(f"{kind} {node.name}")
+        context.add_connection(context.last_node, func_node)
+        context.last_node = func_node
+        
+        # Visit the body of the function, qualifying nested definitions with its name.
+        # Loops around the definition do not contain the body, so it starts a new loop stack.
+        prev_scope = context.current_scope
+        prev_loop_stack = context.loop_stack
+        context.current_scope = full_func_name
+        context.loop_stack = []
+        self._visit_body(node.body, context)
+        context.current_scope = prev_scope
+        context.loop_stack = prev_loop_stack
+
+    @_foldable
+    def visit_If(self, node, context):
+        # An elif chain is walked in a loop rather than recursively, so that long chains do not
+        # exhaust the stack; each elif is still measured and folded as a block of its own
+        first_cond_node = None
+        elifs = []  # (elif, first node, number of terminal nodes before it) of the measured elifs
+        while True:
+            # If condition
+            cond_node = context.add_node(f"If: {self._label_text(node.test, context)}")
+            context.add_connection(context.last_node, cond_node)
+            if first_cond_node is None:
+                first_cond_node = cond_node
+
+            # Then branch
+            then_node = context.add_node("Then")
+            context.add_connection(cond_node, then_node)
+            context.last_node = then_node
+            self._visit_body(node.body, context)
+            if not node.orelse:
+                break
+
+            # Else branch, which is either the next elif or the else clause
+            else_node = context.add_node("Else")
+            context.add_connection(cond_node, else_node)
+            context.last_node = else_node
+            orelse = node.orelse
+            if (len(orelse) == 1 and isinstance(orelse[0], ast.If)
+                    and (context.folds is None or orelse[0] not in context.folds)):
+                node = orelse[0]
+                if context.blocks is not None:
+                    elifs.append((node, context.graph.node_count, len(context.terminal_nodes)))
+                continue
+            self._visit_body(orelse, context)
+            break
+
+        # Innermost first, as if each elif had been visited on its own
+        for elif_node, start, terminals in reversed(elifs):
+            context.blocks.append(FoldableBlock(elif_node, context.current_scope, start,
+                                                context.graph.node_count - start,
+                                                len(context.terminal_nodes) > terminals))
+        context.last_node = first_cond_node
+
+    def visit_For(self, node, context):
+        self._visit_for(node, context, "For")
+
+    def visit_AsyncFor(self, node, context):
+        self._visit_for(node, context, "Async For")
+
+    @_foldable
+    def _visit_for(self, node, context, kind):
         # For loop header
-        iter_str = f"For: {ast.unparse(node.target)} in {ast.unparse(node.iter)}"
-        loop_start_node = self.add_node(iter_str)
-        self.add_connection(self.last_node, loop_start_node)
+        iter_str = f"{kind}: {self._label_text(node.target, context)} in {self._label_text(node.iter, context)}"
+        loop_start_node = context.add_node(iter_str)
+        context.add_connection(context.last_node, loop_start_node)
         
         # Loop body
-        loop_body_node = self.add_node("Loop Body")
-        self.add_connection(loop_start_node, loop_body_node)
+        loop_body_node = context.add_node("Loop Body")
+        context.add_connection(loop_start_node, loop_body_node)
         
-        # Save the current last node and create nodes for break and continue targets
-        self.loop_start_node = loop_start_node  # For continue statements
-        after_loop_node = self.add_node("After Loop")  # For break statements and normal loop exit
-        self.after_loop_node = after_loop_node
+        # Create the node after the loop, and enter the loop's context for break and continue
+        after_loop_node = context.add_node("After Loop")  # For break statements and normal loop exit
+        context.loop_stack.append((loop_start_node, after_loop_node))
         
         # Save the current last node
-        last_before_body = self.last_node
-        self.last_node = loop_body_node
+        last_before_body = context.last_node
+        context.last_node = loop_body_node
         
         # Process the loop body
-        for n in node.body:
-            self.visit(n)
+        self._visit_body(node.body, context)
+        context.loop_stack.pop()
         
         # Connect back to the loop start for iteration (if not broken)
-        self.add_connection(self.last_node, loop_start_node)
+        context.add_connection(context.last_node, loop_start_node)
         
         # Connect loop start to after loop for when the loop ends
-        self.add_connection(loop_start_node, after_loop_node)
+        context.add_connection(loop_start_node, after_loop_node)
         
         # Set the last node to after the loop
-        self.last_node = after_loop_node
+        context.last_node = after_loop_node
         
         # Handle else clause if it exists
         if node.orelse:
-            else_node = self.add_node("Loop Else")
-            self.add_connection(after_loop_node, else_node)
-            last_else = self.last_node
-            self.last_node = else_node
-            for n in node.orelse:
-                self.visit(n)
-            self.last_node = last_else
-        
-        # Clean up loop context
-        self.loop_start_node = None
-        self.after_loop_node = None
-
-    def visit_Return(self, node):
+            else_node = context.add_node("Loop Else")
+            context.add_connection(after_loop_node, else_node)
+            last_else = context.last_node
+            context.last_node = else_node
+            self._visit_body(node.orelse, context)
+            context.last_node = last_else
+
+    def visit_Return(self, node, context):
         # Handle return statements with and without values
         if node.value:
-            return_node = self.add_node(f"Return: {ast.unparse(node.value)}")
+            return_node = context.add_node(f"Return: {self._label_text(node.value, context)}")
         else:
-            return_node = self.add_node("Return")
-        self.add_connection(self.last_node, return_node)
+            return_node = context.add_node("Return")
+        context.add_connection(context.last_node, return_node)
         # Add this return node to terminal nodes list
-        self.terminal_nodes.append(return_node)
-        self.last_node = return_node
+        context.terminal_nodes.append(return_node)
+        context.last_node = return_node
         
-    def visit_While(self, node):
+    @_foldable
+    def visit_While(self, node, context):
         # While loop condition
-        cond_str = f"While: {ast.unparse(node.test)}"
-        loop_start_node = self.add_node(cond_str)
-        self.add_connection(self.last_node, loop_start_node)
+        cond_str = f"While: {self._label_text(node.test, context)}"
+        loop_start_node = context.add_node(cond_str)
+        context.add_connection(context.last_node, loop_start_node)
         
         # Loop body
-        loop_body_node = self.add_node("Loop Body")
-        self.add_connection(loop_start_node, loop_body_node)
+        loop_body_node = context.add_node("Loop Body")
+        context.add_connection(loop_start_node, loop_body_node)
         
-        # Save the current last node and create nodes for break and continue targets
-        self.loop_start_node = loop_start_node  # For continue statements
-        after_loop_node = self.add_node("After Loop")
-        self.after_loop_node = after_loop_node
+        # Create the node after the loop, and enter the loop's context for break and continue
+        after_loop_node = context.add_node("After Loop")
+        context.loop_stack.append((loop_start_node, after_loop_node))
         
         # Process the loop body
-        last_before_body = self.last_node
-        self.last_node = loop_body_node
-        for n in node.body:
-            self.visit(n)
+        last_before_body = context.last_node
+        context.last_node = loop_body_node
+        self._visit_body(node.body, context)
+        context.loop_stack.pop()
         
         # Connect back to the loop start for the next iteration check
-        self.add_connection(self.last_node, loop_start_node)
+        context.add_connection(context.last_node, loop_start_node)
         
         # Connect loop condition to after loop when condition is false
-        self.add_connection(loop_start_node, after_loop_node)
+        context.add_connection(loop_start_node, after_loop_node)
         
         # Set the last node to after the loop
-        self.last_node = after_loop_node
+        context.last_node = after_loop_node
         
         # Handle else clause if it exists
         if node.orelse:
-            else_node = self.add_node("Loop Else")
-            self.add_connection(after_loop_node, else_node)
-            last_else = self.last_node
-            self.last_node = else_node
-            for n in node.orelse:
-                self.visit(n)
-            self.last_node = last_else
-        
-        # Clean up loop context
-        self.loop_start_node = None
-        self.after_loop_node = None
-        
-    def visit_Break(self, node):
-        if self.after_loop_node:
-            break_node = self.add_node("Break")
-            self.add_connection(self.last_node, break_node)
-            self.add_connection(break_node, self.after_loop_node)
+            else_node = context.add_node("Loop Else")
+            context.add_connection(after_loop_node, else_node)
+            last_else = context.last_node
+            context.last_node = else_node
+            self._visit_body(node.orelse, context)
+            context.last_node = last_else
+        
+    def visit_Break(self, node, context):
+        if context.loop_stack:
+            _, after_loop_node = context.loop_stack[-1]
+            break_node = context.add_node("Break")
+            context.add_connection(context.last_node, break_node)
+            context.add_connection(break_node, after_loop_node)
             # Create a new node to continue from after the break
             # This node won't actually be connected to in the normal flow
             # but we need to set last_node to something
-            unreachable_node = self.add_node("Unreachable")
-            self.last_node = unreachable_node
+            unreachable_node = context.add_node("Unreachable")
+            context.last_node = unreachable_node
         else:
             # Handle break outside of loop context (shouldn't happen in valid Python)
-            break_node = self.add_node("Break (Invalid)")
-            self.add_connection(self.last_node, break_node)
-            self.last_node = break_node
+            break_node = context.add_node("Break (Invalid)")
+            context.add_connection(context.last_node, break_node)
+            context.last_node = break_node
     
-    def visit_Continue(self, node):
-        if self.loop_start_node:
-            continue_node = self.add_node("Continue")
-            self.add_connection(self.last_node, continue_node)
-            self.add_connection(continue_node, self.loop_start_node)
+    def visit_Continue(self, node, context):
+        if context.loop_stack:
+            loop_start_node, _ = context.loop_stack[-1]
+            continue_node = context.add_node("Continue")
+            context.add_connection(context.last_node, continue_node)
+            context.add_connection(continue_node, loop_start_node)
             # Create a new node to continue from after the continue
             # This node won't actually be connected to in the normal flow
             # but we need to set last_node to something
-            unreachable_node = self.add_node("Unreachable")
-            self.last_node = unreachable_node
+            unreachable_node = context.add_node("Unreachable")
+            context.last_node = unreachable_node
         else:
             # Handle continue outside of loop context (shouldn't happen in valid Python)
-            continue_node = self.add_node("Continue (Invalid)")
-            self.add_connection(self.last_node, continue_node)
-            self.last_node = continue_node
+            continue_node = context.add_node("Continue (Invalid)")
+            context.add_connection(context.last_node, continue_node)
+            context.last_node = continue_node
+
+    def visit_Raise(self, node, context):
+        # A raise leaves the function like a return does (or reaches a handler of an enclosing try)
+        if node.exc:
+            raise_node = context.add_node(f"Raise: {self._label_text(node.exc, context)}")
+        else:
+            raise_node = context.add_node("Raise")
+        context.add_connection(context.last_node, raise_node)
+        context.terminal_nodes.append(raise_node)
+        context.last_node = raise_node
 
-    def visit_ClassDef(self, node):
-        # Store previous class context if any
-        prev_class = getattr(self, 'current_class', None)
-        # Set current class name
-        self.current_class = node.name
+    def visit_Try(self, node, context):
+        self._visit_try(node, context, "Except")
+
+    def visit_TryStar(self, node, context):
+        self._visit_try(node, context, "Except*")
+
+    @_foldable
+    def _visit_try(self, node, context, except_kind):
+        try_node = context.add_node("Try")
+        context.add_connection(context.last_node, try_node)
+        
+        # Try body
+        context.last_node = try_node
+        self._visit_body(node.body, context)
+        
+        # The else clause runs when the body finishes without an exception
+        if node.orelse:
+            else_node = context.add_node("Try Else")
+            context.add_connection(context.last_node, else_node)
+            context.last_node = else_node
+            self._visit_body(node.orelse, context)
+        branch_ends = [context.last_node]
+        
+        # An exception anywhere in the body can reach each handler
+        for handler in node.handlers:
+            if handler.type is None:
+                handler_label = except_kind
+            elif handler.name:
+                handler_label = f"{except_kind}: {self._label_text(handler.type, context)} as {handler.name}"
+            else:
+                handler_label = f"{except_kind}: {self._label_text(handler.type, context)}"
+            handler_node = context.add_node(handler_label)
+            context.add_connection(try_node, handler_node)
+            context.last_node = handler_node
+            self._visit_body(handler.body, context)
+            branch_ends.append(context.last_node)
+        
+        # Join the branches in the finally clause, or in a node after the try statement.
+        # Branches that ended in a return or raise leave the function instead.
+        join_node = context.add_node("Finally" if node.finalbody else "After Try")
+        for end in branch_ends:
+            if end not in context.terminal_nodes:
+                context.add_connection(end, join_node)
+        context.last_node = join_node
+        self._visit_body(node.finalbody, context)
+
+    def visit_With(self, node, context):
+        self._visit_with(node, context, "With")
+
+    def visit_AsyncWith(self, node, context):
+        self._visit_with(node, context, "Async With")
+
+    @_foldable
+    def _visit_with(self, node, context, kind):
+        # The context managers, then the body runs in sequence
+        items = []
+        for item in node.items:
+            if item.optional_vars is not None:
+                items.append(f"{self._label_text(item.context_expr, context)} as {self._label_text(item.optional_vars, context)}")
+            else:
+                items.append(self._label_text(item.context_expr, context))
+        with_node = context.add_node(f"{kind}: {', '.join(items)}")
+        context.add_connection(context.last_node, with_node)
+        context.last_node = with_node
+        self._visit_body(node.body, context)
+
+    @_foldable
+    def visit_Match(self, node, context):
+        # Match subject, with a branch per case, like an if/elif chain
+        match_node = context.add_node(f"Match: {self._label_text(node.subject, context)}")
+        context.add_connection(context.last_node, match_node)
+        for case in node.cases:
+            case_label = f"Case: {self._label_text(case.pattern, context)}"
+            if case.guard is not None:
+                case_label += f" if {self._label_text(case.guard, context)}"
+            case_node = context.add_node(case_label)
+            context.add_connection(match_node, case_node)
+            context.last_node = case_node
+            self._visit_body(case.body, context)
+        context.last_node = match_node
+
+    def visit_ClassDef(self, node, context):
+        # Store previous scope if any
+        prev_scope = context.current_scope
+        # Set the current scope to the fully qualified class name
+        context.current_scope = f"{prev_scope}.{node.name}" if prev_scope else node.name
         
         # If we're targeting a specific function that belongs to this class
         target_in_this_class = False
-        if hasattr(self, 'target_function') and self.target_function:
-            parts = self.target_function.split('.')
-            if len(parts) > 1 and parts[0] == self.current_class:
-                target_in_this_class = True
+        if context.target_function:
+            target_in_this_class = context.target_function.startswith(f"{context.current_scope}.")
         
         # Only create a class node if we're not targeting a specific function
         # or if the target function is in this class
-        if not hasattr(self, 'target_function') or not self.target_function or target_in_this_class:
+        if not context.target_function or target_in_this_class:
             # Always show class definitions, even in compact mode
-            class_node = self.add_node(f"Class {node.name}")
-            self.add_connection(self.last_node, class_node)
-            self.last_node = class_node
+            class_node = context.add_node(f"Class {node.name}")
+            context.add_connection(context.last_node, class_node)
+            context.last_node = class_node
             
             # Visit all class body elements
-            for n in node.body:
-                self.visit(n)
+            self._visit_body(node.body, context)
         
-        # Restore previous class context
-        if prev_class:
-            self.current_class = prev_class
-        else:
-            self.current_class = None
+        # Restore previous scope
+        context.current_scope = prev_scope
             
-    def generate_mermaid_flowchart(self, source_code, target_function=None, compact=True):
+    def generate_mermaid_flowchart(self, source_code, target_function=None, compact=True, index=None):
         """Generate a Mermaid flowchart for the given source code.
         
         Args:
             source_code (str): The Python source code to generate a diagram for.
             target_function (str, optional): If provided, only generate a flowchart for this specific function.
-                                           Can include class name as prefix (e.g., 'Calculator.multiply').
+                                           Use its fully qualified name (e.g., 'Calculator.multiply',
+                                           'Outer.Inner.method' or 'outer.inner').
             compact (bool, optional): If True, only include control flow elements in the diagram.
                                     If False, include all AST nodes. Defaults to True.
+            index (FunctionIndex, optional): A prebuilt index for source_code. Pass the same index
+                                           when generating flowcharts for many targets so the source
+                                           is parsed and indexed only once.
             
         Returns:
-            str: The generated Mermaid flowchart as a string.
+            str: The generated Mermaid flowchart as a string. With a max_nodes budget, blocks and runs
+                 of statements may be folded into summary nodes; generate_flowchart_parts also
+                 returns their sub-diagrams.
         """
-        self.flowchart = ["flowchart TD"]
-        self.node_count = 0
-        # Create a start node with proper syntax
-        start_node = "Start"
-        self.flowchart.append(f"{start_node}[\"Start\"]")
-        self.last_node = start_node
-        self.function_names = []
-        self.current_class = None
-        self.target_function = target_function
-        self.compact = compact
-        self.terminal_nodes = []  # Reset terminal nodes list
+        return self._serialize(self.generate_flowchart_graph(source_code, target_function, compact, index), "mermaid")
+
+    def generate_flowchart(self, source_code, target_function=None, compact=True, index=None, format="mermaid"):
+        """Generate a flowchart for the given source code in any of the output formats.
         
-        tree = ast.parse(source_code)
+        Takes the same arguments as generate_mermaid_flowchart, plus:
         
-        # If we're targeting a specific function, find it in the AST and only process that
-        if target_function:
-            target_class = None
-            target_method = target_function
+        Args:
+            format (str, optional): The output format: 'mermaid', 'dot', 'json' or 'adjacency'
+                                  (see flomatic.serializers.FORMATS). Defaults to 'mermaid'.
+            
+        Returns:
+            str or bytes: The serialized flowchart; bytes for the binary 'adjacency' format.
+        """
+        return self._serialize(self.generate_flowchart_graph(source_code, target_function, compact, index), format)
+
+    def generate_flowchart_graph(self, source_code, target_function=None, compact=True, index=None):
+        """Generate the flowchart graph for the given source code, without serializing it.
+        
+        Takes the same arguments as generate_mermaid_flowchart.
+        
+        Returns:
+            FlowGraph: The flowchart as a graph of integer nodes and edges.
+        """
+        root, scope, labels = self._flowchart_root(source_code, target_function, index)
+        graph, _ = self._budget_graph(root, scope, target_function, compact, labels, target_function or "module",
+                                      itertools.count(1))
+        return graph
+
+    def generate_code_flowchart(self, function, compact=True, format="mermaid"):
+        """Generate a flowchart for a function that is already loaded, from its bytecode.
+        
+        No source is read or parsed, so this works for installed packages shipped without
+        .py files. The diagram is coarser than one built from source (see flomatic.bytecode),
+        and max_nodes does not apply to it.
+        
+        Args:
+            function (function or code): The function, method or code object to diagram.
+            compact (bool, optional): If True, only include control flow elements in the diagram.
+                                    If False, also add a node for every statement. Defaults to True.
+            format (str, optional): The output format (see generate_flowchart). Defaults to 'mermaid'.
             
-            # Check if it's a class method
-            if '.' in target_function:
-                target_class, target_method = target_function.split('.')
+        Returns:
+            str or bytes: The serialized flowchart.
+        """
+        return self._serialize(self.generate_code_graph(function, compact), format)
+
+    def generate_code_graph(self, function, compact=True):
+        """Generate the flowchart graph for a loaded function from its bytecode, without serializing it.
+        
+        Takes the same arguments as generate_code_flowchart.
+        
+        Returns:
+            FlowGraph: The flowchart as a graph of integer nodes and edges.
+        """
+        # Imported here because only this method needs dis and inspect
+        from flomatic.bytecode import bytecode_graph, code_object
+        
+        graph = bytecode_graph(code_object(function), compact, self.options.max_label_length)
+        if self.options.simplify:
+            graph = simplify_graph(graph)
+        return graph
+
+    def generate_flowchart_parts(self, source_code, target_function=None, compact=True, index=None,
+                                 format="mermaid"):
+        """Generate a flowchart and the sub-diagrams of what was folded to keep it within max_nodes.
+        
+        Takes the same arguments as generate_flowchart.
+        
+        Returns:
+            list: (name, flowchart) tuples. The first is the flowchart itself, named after
+                  target_function (or 'module'); it is followed by a sub-diagram named e.g.
+                  'process-1' for every folded block or run of statements, which its summary
+                  node refers to.
+                  Without max_nodes, or within the budget, the list has a single entry.
+        """
+        root, scope, labels = self._flowchart_root(source_code, target_function, index)
+        return [(name, self._serialize(graph, format))
+                for name, graph in self._generate_parts(root, scope, target_function, compact, labels,
+                                                        target_function or "module")]
+
+    def _flowchart_root(self, source_code, target_function, index):
+        """Return the AST node to visit for a flowchart, the scope it is defined in and its LabelSource."""
+        # If we're targeting a specific function, look it up in the index and only process that
+        if target_function:
+            if index is None:
+                index = self._index_source(source_code)
+            labels = LabelSource(source_code, index.tree)
+            entry = index.get(target_function)
+            if entry:
+                return entry.node, entry.scope, labels
+            return None, None, labels
+        
+        # Process the entire tree
+        tree = index.tree if index is not None else self._parse_source(source_code)
+        return tree, None, LabelSource(source_code, tree)
+
+    def _budget_graph(self, root, scope, target_function, compact, labels, name, numbers):
+        """Build the flowchart of an AST node, folding nested blocks or runs of statements if it exceeds max_nodes.
+        
+        Args:
+            root (ast.AST or tuple): The node to visit, a tuple of statements split off a body, or
+                                   None for an empty flowchart.
+            scope (str): The qualified name of the scope root is defined in.
+            target_function (str): The targeted function, as in generate_flowchart_graph.
+            compact (bool): Whether only control flow elements are included.
+            labels (LabelSource): Where labels are sliced from.
+            name (str): The name sub-diagrams are numbered under.
+            numbers (iterator): Gives the number of each sub-diagram.
             
-            # Find the target function/method in the AST
-            for node in ast.walk(tree):
-                if isinstance(node, ast.ClassDef) and node.name == target_class:
-                    for child in node.body:
-                        if isinstance(child, ast.FunctionDef) and child.name == target_method:
-                            # Process just this method
-                            if target_class:
-                                self.current_class = target_class
-                            self.visit_FunctionDef(child)
-                            break
-                    break
-                elif isinstance(node, ast.FunctionDef) and node.name == target_method and not target_class:
-                    # Process just this function
-                    self.visit_FunctionDef(node)
-                    break
+        Returns:
+            tuple: The graph, and a list of (part name, scope, root) for every folded block or run.
+        """
+        context = self._start_flowchart(target_function, compact, labels, scope)
+        if root is None:
+            return self._finish_graph(context), []
+        if self.options.max_nodes is None:
+            self.visit(root, context)
+            return self._finish_graph(context), []
+        
+        # Visit once measuring the compound statements and statement lists, and stop there
+        # if the graph (with its End node still to come) fits
+        context.blocks = []
+        context.bodies = []
+        self._visit_root(root, context)
+        folded = self._choose_folds(context.blocks, context.bodies, context.graph.node_count + 1, root)
+        if not folded:
+            context.blocks = context.bodies = None
+            return self._finish_graph(context), []
+        
+        # Visit again with the chosen blocks and runs folded, numbering them in source order
+        parts = []
+        folds = {}
+        for block in sorted(folded, key=lambda block: block.start):
+            block_name = part_name(name, next(numbers))
+            if isinstance(block.node, tuple):
+                first, last = block.node[0].lineno, block.node[-1].end_lineno
+                lines = f"Line {first}" if first == last else f"Lines {first}-{last}"
+                folds[block.node[0]] = (f"{lines} (see {block_name})", block.exits, len(block.node))
+            else:
+                folds[block.node] = (f"{context.graph.label(block.start)} (see {block_name})", block.exits, None)
+            parts.append((block_name, block.scope, block.node))
+        context = self._start_flowchart(target_function, compact, labels, scope)
+        context.folds = folds
+        self._visit_root(root, context)
+        return self._finish_graph(context), parts
+
+    def _visit_root(self, root, context):
+        """Visit the root of a flowchart: an AST node, or a run of statements split off a body as a tuple."""
+        if isinstance(root, tuple):
+            self._visit_body(root, context)
         else:
-            # Process the entire tree
-            self.visit(tree)
+            self.visit(root, context)
+
+    def _choose_folds(self, blocks, bodies, node_count, root):
+        """Choose the blocks and runs of statements to fold so that a graph of node_count nodes fits in max_nodes.
+        
+        Folding whole blocks is preferred, as their summary nodes tell what they stand for, unless
+        folding runs of consecutive statements as well needs fewer sub-diagrams, or blocks alone
+        cannot make the graph fit (as in a long function of small statements).
+        """
+        excess = node_count - self.options.max_nodes
+        if excess <= 0:
+            return set()
+        leavers = _loop_leavers(root)
+        candidates = [block for block in blocks if block.node is not root and block.node not in leavers]
+        options = [self._fold_largest(candidates, excess),
+                   self._fold_largest(candidates + self._statement_runs(bodies, node_count, root, leavers),
+                                      excess)]
+        # The fewest nodes over the budget, then the fewest sub-diagrams, preferring blocks alone
+        return min(options, key=lambda option: (max(option[1], 0), len(option[0])))[0]
+
+    def _fold_largest(self, candidates, excess):
+        """Choose folds among candidates until they save excess nodes.
+        
+        Candidates whose own diagram fits in the budget are preferred, largest first, so that as
+        few sub-diagrams as possible are needed and they do not have to be split again. Of the
+        others, the largest is folded too unless it would leave less than half the budget used, in
+        which case the one saving the fewest nodes that are still enough is folded instead (in a
+        long elif chain, folding the first elif would leave a graph of a few nodes and a
+        sub-diagram nearly as big as the chain, to be split the same way elif by elif).
+        
+        Returns:
+            tuple: The set of folds chosen, and the number of nodes still over the budget.
+        """
+        max_nodes = self.options.max_nodes
+        folded = set()
+        
+        def saving(block):
+            # Nodes are numbered contiguously, so the folds nested in a block are those within its nodes
+            if any(_within(block, other) for other in folded):
+                return None, 0
+            nested = [other for other in folded if _within(other, block)]
+            return nested, block.size - 1 - sum(other.size - 1 for other in nested)
+        
+        def fold(block, nested, saved):
+            nonlocal excess
+            folded.difference_update(nested)
+            folded.add(block)
+            excess -= saved
+        
+        for block in sorted((block for block in candidates if block.size <= max_nodes),
+                            key=lambda block: -block.size):
+            if excess <= 0:
+                break
+            nested, saved = saving(block)
+            # The summary node takes the place of one node saved, so saving one more is not worth a sub-diagram
+            if saved >= 2:
+                fold(block, nested, saved)
+        
+        oversized = sorted((block for block in candidates if block.size > max_nodes), key=lambda block: -block.size)
+        while excess > 0:
+            largest = best_fit = None
+            for block in oversized:
+                if block in folded:
+                    continue
+                nested, saved = saving(block)
+                if saved < 2:
+                    continue
+                if largest is None:
+                    largest = (block, nested, saved)
+                if saved >= excess and (best_fit is None or saved < best_fit[2]):
+                    best_fit = (block, nested, saved)
+            if largest is None:
+                break
+            fold(*(best_fit if largest[2] - excess > max_nodes // 2 else largest))
+        return folded, excess
+
+    def _statement_runs(self, bodies, node_count, root, leavers):
+        """Split measured statement lists into runs of consecutive statements that could be folded.
+        
+        A run has at most max_nodes - 2 nodes, so that its own diagram fits with Start and End, or
+        more if the graph would not fit with a summary node for each of the runs of a body (their
+        diagrams are then split again).
+        
+        Returns:
+            list: A FoldableBlock for each run, with a tuple of its statements as its node.
+        """
+        max_nodes = self.options.max_nodes
+        runs = []
+        for body in bodies:
+            if not body:
+                continue
+            size = body[-1].start + body[-1].size - body[0].start
+            limit = max(max_nodes - 2, 1)
+            while True:
+                body_runs, kept = self._split_body(body, limit, root, leavers)
+                if node_count - size + kept + len(body_runs) <= max_nodes or limit >= size:
+                    break
+                limit += -(-limit // 4)
+            runs.extend(body_runs)
+        return runs
+
+    def _split_body(self, body, limit, root, leavers):
+        """Cut a measured statement list into runs of at most limit nodes.
+        
+        Statements that break or continue a loop outside themselves are left out of runs.
+        
+        Returns:
+            tuple: A FoldableBlock for each run, and the number of nodes left out of them.
+        """
+        runs = []
+        kept = 0
         
+        def end_run(run):
+            nonlocal kept
+            if not run:
+                return
+            statements = tuple(statement.node for statement in run)
+            size = run[-1].start + run[-1].size - run[0].start
+            if statements == root:
+                kept += size
+            else:
+                runs.append(FoldableBlock(statements, run[0].scope, run[0].start, size,
+                                          any(statement.exits for statement in run)))
+        
+        run = []
+        for statement in body:
+            if isinstance(statement.node, (ast.Break, ast.Continue)) or statement.node in leavers:
+                kept += statement.size
+                end_run(run)
+                run = []
+                continue
+            if run and statement.start + statement.size - run[0].start > limit:
+                end_run(run)
+                run = []
+            run.append(statement)
+        end_run(run)
+        return runs, kept
+
+    def _generate_parts(self, root, scope, target_function, compact, labels, name):
+        """Build a flowchart and the sub-diagrams of its folded blocks, as (name, graph) tuples."""
+        numbers = itertools.count(1)
+        parts = []
+        pending = [(name, scope, root)]
+        # Sub-diagrams can fold blocks of their own, which are appended as they are found
+        for part, part_scope, part_root in pending:
+            graph, folded = self._budget_graph(part_root, part_scope, target_function, compact, labels, name,
+                                               numbers)
+            parts.append((part, graph))
+            pending.extend(folded)
+        return parts
+
+    def _start_flowchart(self, target_function, compact, labels=None, scope=None):
+        """Return a new FlowContext to build a flowchart in."""
+        return FlowContext(target_function, compact, labels, scope)
+
+    def _finish_graph(self, context):
+        """Add the End node, connect the terminal nodes to it and return the graph."""
         # If the last node isn't already a terminal node, add it to the list
         # This handles functions that end without a return statement
-        if self.last_node not in self.terminal_nodes and self.last_node != "Start":
-            self.terminal_nodes.append(self.last_node)
+        terminal_nodes = context.terminal_nodes
+        if context.last_node not in terminal_nodes and context.last_node != START:
+            terminal_nodes.append(context.last_node)
         
-        # Create an end node with proper syntax
-        self.end_node = "End"
-        self.flowchart.append(f"{self.end_node}[\"End\"]")
+        # Create an end node
+        graph = context.graph
+        end_node = graph.add_end()
         
-        # Connect all terminal nodes to the End node
-        for node in self.terminal_nodes:
-            self.add_connection(node, self.end_node)
+        # Connect all terminal nodes to the End node, and the folded blocks that may return
+        for node in terminal_nodes:
+            graph.add_edge(node, end_node)
+        for node in context.folded_exits:
+            graph.add_edge(node, end_node)
         
-        return "\n".join(self.flowchart)
+        if self.options.simplify:
+            graph = simplify_graph(graph)
+        return graph
+
+    def _generate_function_graph(self, entry, compact, labels=None):
+        """Generate the flowchart graph for a single indexed function."""
+        graph, _ = self._budget_graph(entry.node, entry.scope, entry.name, compact, labels, entry.name,
+                                      itertools.count(1))
+        return graph
+    
+    def _generate_function_flowchart(self, entry, compact, format="mermaid", labels=None):
+        """Generate the flowchart for a single indexed function in the given output format."""
+        return self._serialize(self._generate_function_graph(entry, compact, labels), format)
     
-    def save_mermaid_diagram(self, source_code, output_dir=".", compact=True):
-        """Generate Mermaid flowcharts for each function and save them to files named after the functions.
+    def _generate_function_parts(self, entry, compact, format="mermaid", labels=None):
+        """Generate an indexed function's flowchart and sub-diagrams as (name, flowchart) tuples."""
+        if self.options.max_nodes is None:
+            return [(entry.name, self._generate_function_flowchart(entry, compact, format, labels))]
+        return [(name, self._serialize(graph, format))
+                for name, graph in self._generate_parts(entry.node, entry.scope, entry.name, compact, labels,
+                                                        entry.name)]
+    
+    def iter_function_flowcharts(self, source_code, compact=True, cache=None, format="mermaid"):
+        """Generate a flowchart for every function in the source code, one at a time.
+        
+        Each flowchart is yielded as soon as it has been built, so downstream work can start
+        while the rest of the module is still being visited and only one diagram needs to be
+        held in memory.
+        
+        With a cache, an unchanged file is served from its cached module index without
+        being parsed, and unchanged functions in a changed file are not visited again.
+        
+        Args:
+            source_code (str): The Python source code to generate diagrams for.
+            compact (bool, optional): If True, only include control flow elements in the diagram.
+                                    If False, include all AST nodes. Defaults to True.
+            cache (DiagramCache, optional): If provided, reuse cached diagrams for unchanged
+                                          functions and store newly generated ones.
+            format (str, optional): The output format (see generate_flowchart). Defaults to 'mermaid'.
+            
+        Yields:
+            tuple: (function name, flowchart) in source order. Source without any functions
+                   gives a single empty flowchart named 'unnamed_function'. With a max_nodes
+                   budget, a function's flowchart is followed by the sub-diagrams split off it
+                   (see generate_flowchart_parts).
+        """
+        if cache is not None:
+            module_key = cache_key("module", RENDERER_VERSION, compact, format, *self._options_key(), source_code)
+            cached_index = cache.get_index(module_key)
+            if cached_index is not None:
+                index = None
+                for func_name, key in json.loads(cached_index):
+                    parts = self._cached_parts(func_name, key, cache, format)
+                    if parts is None:
+                        # The diagram was evicted, so parse the source after all (once)
+                        if index is None:
+                            index = self._index_source(source_code)
+                            labels = LabelSource(source_code, index.tree)
+                        parts = self._cached_function_parts(index[func_name], key, compact, cache, format, labels)
+                    yield from parts
+                return
+        
+        # Parse once and index every function in a single traversal
+        index = self._index_source(source_code)
+        lines = source_lines(source_code) if cache is not None else None
+        labels = LabelSource(source_code, index.tree, lines)
+        
+        if not index:
+            # If no functions are found, use an empty diagram under a default name
+            context = self._start_flowchart("unnamed_function", compact)
+            yield "unnamed_function", self._serialize(self._finish_graph(context), format)
+            return
+        
+        if cache is None:
+            for entry in index:
+                yield from self._generate_function_parts(entry, compact, format, labels)
+            return
+        
+        keys = []
+        for entry in index:
+            key = self._function_key(entry, lines, compact, format)
+            keys.append((entry.name, key))
+            yield from self._cached_function_parts(entry, key, compact, cache, format, labels)
+        cache.put_index(module_key, json.dumps(keys))
+    
+    def generate_function_flowcharts(self, source_code, compact=True, cache=None, format="mermaid"):
+        """Generate a flowchart for every function in the source code.
         
         Args:
             source_code (str): The Python source code to generate diagrams for.
-            output_dir (str): Directory where to save the output files. Defaults to current directory.
             compact (bool, optional): If True, only include control flow elements in the diagram.
                                     If False, include all AST nodes. Defaults to True.
+            cache (DiagramCache, optional): If provided, reuse cached diagrams for unchanged
+                                          functions and store newly generated ones.
+            format (str, optional): The output format (see generate_flowchart). Defaults to 'mermaid'.
             
         Returns:
-            list: List of file paths where diagrams were saved.
+            list: (function name, flowchart) tuples in source order, as yielded by
+                  iter_function_flowcharts.
         """
-        # First, get all function names by generating a complete flowchart
-        temp_generator = FlowchartGenerator()
-        temp_generator.generate_mermaid_flowchart(source_code, compact=compact)
-        function_names = temp_generator.function_names.copy()
+        return list(self.iter_function_flowcharts(source_code, compact, cache, format))
+    
+    def write_function_flowcharts(self, source_code, sink, compact=True, cache=None, format="mermaid"):
+        """Pass every function's flowchart to a sink as soon as it has been built.
         
-        if not function_names:
-            # If no function names found, use a default name
-            function_names = ["unnamed_function"]
+        Args:
+            source_code (str): The Python source code to generate diagrams for.
+            sink (callable): Called as sink(function name, flowchart) for each function, in source order.
+            compact (bool, optional): If True, only include control flow elements in the diagram.
+                                    If False, include all AST nodes. Defaults to True.
+            cache (DiagramCache, optional): If provided, reuse cached diagrams for unchanged
+                                          functions and store newly generated ones.
+            format (str, optional): The output format (see generate_flowchart). Defaults to 'mermaid'.
+            
+        Returns:
+            int: The number of flowcharts passed to the sink.
+        """
+        count = 0
+        for func_name, func_flowchart in self.iter_function_flowcharts(source_code, compact, cache, format):
+            sink(func_name, func_flowchart)
+            count += 1
+        return count
+    
+    def _options_key(self):
+        """Return the generator's own options, in the order diagram_options takes them."""
+        return tuple(self.options)
+    
+    def _function_key(self, entry, lines, compact, format="mermaid"):
+        """Return the hash identifying an indexed function's diagram, given the source lines."""
+        return cache_key("function", RENDERER_VERSION, compact, format, *self._options_key(), entry.name,
+                         normalized_source(lines, entry.start_line, entry.end_line))
+    
+    def _cached_function_flowchart(self, entry, key, compact, cache, format="mermaid", labels=None):
+        """Return an indexed function's flowchart from the cache, generating and caching it if needed."""
+        func_flowchart = cache.get(key, format) if cache is not None else None
+        if func_flowchart is None:
+            func_flowchart = self._generate_function_flowchart(entry, compact, format, labels)
+            if cache is not None:
+                cache.put(key, func_flowchart, format)
+        return func_flowchart
+    
+    def _cached_function_parts(self, entry, key, compact, cache, format="mermaid", labels=None):
+        """Return an indexed function's flowchart and sub-diagrams, from the cache if possible.
         
+        Under a node budget, the names and keys of the parts are cached as an index under the
+        function's key, and each part under its own key.
+        """
+        if self.options.max_nodes is None:
+            return [(entry.name, self._cached_function_flowchart(entry, key, compact, cache, format, labels))]
+        parts = self._cached_parts(entry.name, key, cache, format) if cache is not None else None
+        if parts is None:
+            parts = self._generate_function_parts(entry, compact, format, labels)
+            if cache is not None:
+                keys = []
+                for name, flowchart in parts:
+                    keys.append((name, cache_key(key, name)))
+                    cache.put(keys[-1][1], flowchart, format)
+                cache.put_index(key, json.dumps(keys))
+        return parts
+    
+    def _cached_parts(self, func_name, key, cache, format):
+        """Return a function's cached flowchart and sub-diagrams, or None if any are missing."""
+        if self.options.max_nodes is None:
+            func_flowchart = cache.get(key, format)
+            return None if func_flowchart is None else [(func_name, func_flowchart)]
+        part_keys = cache.get_index(key)
+        if part_keys is None:
+            return None
+        parts = []
+        for name, part_key in json.loads(part_keys):
+            part_flowchart = cache.get(part_key, format)
+            if part_flowchart is None:
+                return None
+            parts.append((name, part_flowchart))
+        return parts
+    
+    def save_mermaid_diagram(self, source_code, output_dir=".", compact=True, cache=None, format="mermaid",
+                             shared=None):
+        """Generate flowcharts for each function and save them to files named after the functions.
+        
+        Args:
+            source_code (str): The Python source code to generate diagrams for.
+            output_dir (str): Directory where to save the output files. Defaults to current directory.
+            compact (bool, optional): If True, only include control flow elements in the diagram.
+                                    If False, include all AST nodes. Defaults to True.
+            cache (DiagramCache, optional): If provided, reuse cached diagrams for unchanged
+                                          functions and store newly generated ones.
+            format (str, optional): The output format (see generate_flowchart), which also sets
+                                  the file suffix, e.g. .mmd or .dot. Defaults to 'mermaid'.
+            shared (SharedDiagrams, optional): If provided, save the diagrams through it, so that
+                                             a flowchart already saved for another function is
+                                             stored once (see flomatic.dedupe).
+            
+        Returns:
+            list: List of file paths where diagrams were saved.
+        """
         # Create output directory if it doesn't exist
         os.makedirs(output_dir, exist_ok=True)
         
-        # Save a separate diagram for each function
+        # Save a separate diagram for each function as soon as it has been generated
         saved_files = []
-        for func_name in function_names:
-            # Use a fresh generator for each function to avoid interference between diagrams
-            function_generator = FlowchartGenerator()
-            func_flowchart = function_generator.generate_mermaid_flowchart(source_code, target_function=func_name, compact=compact)
-            
-            # Create a safe filename
-            safe_name = re.sub(r'[^\w\-_\.]', '_', func_name)
-            file_path = os.path.join(output_dir, f"{safe_name}.mmd")
+        for func_name, func_flowchart in self.iter_function_flowcharts(source_code, compact, cache, format):
+            file_path = os.path.join(output_dir, diagram_filename(func_name, format))
             
-            # Write the flowchart to the file
-            with open(file_path, 'w') as f:
-                f.write(func_flowchart)
+            # Write the flowchart to the file, unless it is already up to date
+            if shared is None:
+                self._write_diagram(file_path, func_flowchart)
+            else:
+                shared.save(file_path, func_flowchart, format)
             
             saved_files.append(file_path)
         
         return saved_files
+    
+    def update_mermaid_diagrams(self, source_file, output_dir=".", compact=True, cache=None, manifest=None,
+                                format="mermaid"):
+        """Bring the diagrams for a source file up to date, touching only what changed.
+        
+        A manifest in the output directory records, for each source file, its modification
+        time and hash and the hash and file of every function diagram. A file whose mtime or
+        content has not changed is skipped without being parsed; otherwise only the diagrams
+        of changed functions are rewritten, and the diagrams of removed functions are deleted.
+        
+        Args:
+            source_file (str): Path of the Python source file, or of a member of an archive
+                             (see flomatic.sources).
+            output_dir (str): Directory holding the diagrams and the manifest. Defaults to current directory.
+            compact (bool, optional): If True, only include control flow elements in the diagram.
+                                    If False, include all AST nodes. Defaults to True.
+            cache (DiagramCache, optional): If provided, reuse cached diagrams for changed files.
+            manifest (Manifest, optional): The manifest to read and update. If not provided, the
+                                         manifest in output_dir is loaded and saved by this call.
+            format (str, optional): The output format (see generate_flowchart). Defaults to 'mermaid'.
+            
+        Returns:
+            tuple: Lists of the file paths that were written and of those that were removed.
+        """
+        own_manifest = manifest is None
+        if own_manifest:
+            manifest = Manifest.for_output_dir(output_dir)
+        os.makedirs(output_dir, exist_ok=True)
+        
+        options = diagram_options(compact, format, *self._options_key())
+        mtime = source_mtime(source_file)
+        record = manifest.get(source_file)
+        if record and record["options"] == options:
+            outputs_exist = all(os.path.exists(os.path.join(output_dir, function["file"]))
+                                for function in record["functions"].values())
+            if outputs_exist and record["mtime"] == mtime:
+                return [], []
+        else:
+            outputs_exist = False
+        
+        source_code = self._read_source(source_file)
+        source_hash = cache_key(source_code)
+        if outputs_exist and record["hash"] == source_hash:
+            # Only the mtime changed
+            record["mtime"] = mtime
+            if own_manifest:
+                manifest.save()
+            return [], []
+        
+        previous = record["functions"] if record else {}
+        index = self._index_source(source_code)
+        lines = source_lines(source_code)
+        labels = LabelSource(source_code, index.tree, lines)
+        functions = {}
+        written = []
+        for entry in index:
+            key = self._function_key(entry, lines, compact, format)
+            functions[entry.name] = {"hash": key, "file": diagram_filename(entry.name, format)}
+            if previous.get(entry.name) == functions[entry.name]:
+                # Keep the unchanged function and the sub-diagrams split off it, unless any of
+                # their files is missing
+                prefix = part_name(entry.name, "")
+                kept = {func_name: function for func_name, function in previous.items()
+                        if func_name == entry.name
+                        or (func_name.startswith(prefix) and func_name[len(prefix):].isdigit())}
+                if all(os.path.exists(os.path.join(output_dir, function["file"])) for function in kept.values()):
+                    functions.update(kept)
+                    continue
+            for func_name, func_flowchart in self._cached_function_parts(entry, key, compact, cache, format,
+                                                                         labels):
+                functions[func_name] = {"hash": key, "file": diagram_filename(func_name, format)}
+                file_path = os.path.join(output_dir, functions[func_name]["file"])
+                if self._write_diagram(file_path, func_flowchart):
+                    written.append(file_path)
+        
+        if not index:
+            # If no functions are found, save an empty diagram under a default name
+            functions["unnamed_function"] = {"hash": options, "file": diagram_filename("unnamed_function", format)}
+            context = self._start_flowchart("unnamed_function", compact)
+            file_path = os.path.join(output_dir, functions["unnamed_function"]["file"])
+            if self._write_diagram(file_path, self._serialize(self._finish_graph(context), format)):
+                written.append(file_path)
+        
+        # Delete the diagrams of functions that no longer exist (or that were saved in another
+        # format), unless another source file owns them
+        removed = []
+        for func_name, function in previous.items():
+            if func_name in functions and functions[func_name]["file"] == function["file"]:
+                continue
+            if manifest.claims(function["file"], excluding=source_file):
+                continue
+            file_path = os.path.join(output_dir, function["file"])
+            if os.path.exists(file_path):
+                os.remove(file_path)
+                removed.append(file_path)
+        
+        manifest.set(source_file, {"mtime": mtime, "hash": source_hash, "options": options, "functions": functions})
+        if own_manifest:
+            manifest.save()
+        return written, removed
@@ -0,0 +1,212 @@
+"""
+Storing identical diagrams once.
+
+Trivial getters, setters and delegators often draw the very same flowchart.
+SharedDiagrams fingerprints every diagram saved through it by the structure
+of its graph, independently of how the nodes are numbered and of the name of
+the function it draws (see FlowGraph.fingerprint). The first diagram of each
+flowchart is saved as usual; as soon as another function draws the same
+flowchart, the diagram is moved to the _shared directory of the output
+directory, named after its fingerprint and with the function's name left
+out, and the files of all those functions are replaced by stubs: a diagram
+of a single node that names the function and the shared file, such as
+'Function name (see ../_shared/<fingerprint>.mmd)'. Shared files that no
+stub refers to any more are removed by SharedDiagrams.prune.
+"""
+
+import json
+import os
+import re
+import shutil
+
+from flomatic.code_to_mermaid import write_diagram
+from flomatic.graph import START, FlowGraph
+from flomatic.serializers import FORMATS, format_suffix, read_adjacency, serialize
+from flomatic.svg import parse_flowchart
+
+SHARED_DIR = "_shared"
+
+DOT_NODE = re.compile(r'^  (\w+) \[label="((?:[^"\\]|\\.)*)"(?:, shape=oval)?\];$')
+DOT_EDGE = re.compile(r"^  (\w+) -> (\w+);$")
+# The shared files named in the labels of stubs
+SHARED_REFERENCE = re.compile(re.escape(SHARED_DIR.encode()) + rb"[\\/]+([0-9a-f]{64}\.\w+)")
+
+# The labels that name the function a diagram draws, by the kind of definition
+DEFINITION_KINDS = ("Function", "Async Function")
+
+
+class SharedDiagrams:
+    """Saves diagrams, storing each distinct flowchart once.
+
+    Attributes:
+        output_dir (str): The directory the diagrams are saved under.
+        shared_dir (str): The directory holding the diagrams drawn by more than one function.
+        diagrams (int): The number of diagrams saved.
+        unique (int): The number of distinct flowcharts among them.
+        shared (int): The number of distinct flowcharts drawn by more than one function.
+    """
+
+    def __init__(self, output_dir):
+        """Store the shared diagrams under output_dir/_shared."""
+        self.shared_dir = os.path.join(output_dir, SHARED_DIR)
+        self.diagrams = 0
+        self.output_dir = output_dir
+        self._first = {}  # Fingerprint -> (file, label naming the function) of the first diagram saved with it
+        self._shared = {}  # Fingerprint -> shared file, once a second diagram has it
+
+    @property
+    def unique(self):
+        return len(self._first)
+
+    @property
+    def shared(self):
+        return len(self._shared)
+
+    def ratio(self):
+        """Return the number of diagrams saved per distinct flowchart (1.0 if nothing was shared)."""
+        return self.diagrams / self.unique if self.unique else 1.0
+
+    def summary(self):
+        """Return a one-line report of how many diagrams were stored once."""
+        return (f"Deduplicated {self.diagrams} diagrams to {self.unique} distinct flowcharts "
+                f"(ratio {self.ratio():.2f}, {self.shared} stored in {self.shared_dir})")
+
+    def save(self, file_path, flowchart, format="mermaid"):
+        """Save a diagram, sharing one file between the diagrams of the same flowchart.
+
+        Args:
+            file_path (str): The file the function's diagram is saved to.
+            flowchart (str or bytes): The serialized flowchart.
+            format (str, optional): The format it is serialized in. Defaults to 'mermaid'.
+
+        Returns:
+            str: The file the diagram is stored in: file_path, or a file in shared_dir.
+        """
+        suffix = format_suffix(format)
+        graph = read_flowchart(flowchart, format)
+        # The name of the function drawn, e.g. 'Function name', counts as its kind alone
+        name_label = definition_label(graph)
+        relabel = {name_label: name_label.rsplit(" ", 1)[0]} if name_label else None
+        fingerprint = graph.fingerprint(relabel) + suffix
+        self.diagrams += 1
+        first = self._first.get(fingerprint)
+        if first is None or first[0] == file_path:
+            self._first[fingerprint] = (file_path, name_label or _stem(file_path, suffix))
+            write_diagram(file_path, flowchart)
+            return file_path
+
+        shared_file = self._shared.get(fingerprint)
+        if shared_file is None:
+            shared_file = self._shared[fingerprint] = os.path.join(self.shared_dir, fingerprint)
+            os.makedirs(self.shared_dir, exist_ok=True)
+            if relabel:
+                graph.labels = [relabel.get(label, label) for label in graph.labels]
+            write_diagram(shared_file, serialize(graph, format))
+            _write_stub(first[0], first[1], shared_file, format)
+        _write_stub(file_path, name_label or _stem(file_path, suffix), shared_file, format)
+        return shared_file
+
+    def prune(self):
+        """Remove the shared files that no diagram in the output directory refers to any more.
+
+        Returns:
+            list: The files removed.
+        """
+        if not os.path.isdir(self.shared_dir):
+            return []
+        shared_dir = os.path.realpath(self.shared_dir)
+        used = {os.path.basename(path) for path in self._shared.values()}
+        for directory, subdirectories, files in os.walk(self.output_dir):
+            if os.path.realpath(directory) == shared_dir:
+                subdirectories[:] = []
+                continue
+            for name in files:
+                path = os.path.join(directory, name)
+                if os.path.islink(path):
+                    # Shared by a version that linked to the shared files
+                    used.add(os.path.basename(os.path.realpath(path)))
+                    continue
+                with open(path, "rb") as f:
+                    used.update(name.decode() for name in SHARED_REFERENCE.findall(f.read()))
+        removed = []
+        for entry in os.scandir(self.shared_dir):
+            if entry.is_file(follow_symlinks=False) and entry.name not in used:
+                os.remove(entry.path)
+                removed.append(entry.path)
+        return removed
+
+
+def read_flowchart(flowchart, format="mermaid"):
+    """Read a serialized flowchart back into a graph.
+
+    Returns:
+        FlowGraph: The graph. Its node ids may differ from the original's.
+    """
+    if format == "adjacency":
+        return read_adjacency(flowchart)
+    if format == "json":
+        document = json.loads(flowchart)
+        nodes = {node["id"]: node["label"] for node in document["nodes"]}
+        edges = document["edges"]
+        end = document["end"]
+    elif format == "mermaid":
+        nodes, edges = parse_flowchart(flowchart)
+        end = "End"
+    elif format == "dot":
+        nodes = {}
+        edges = []
+        for line in flowchart.splitlines():
+            match = DOT_NODE.match(line)
+            if match:
+                nodes[match.group(1)] = re.sub(r"\\(.)", r"\1", match.group(2))
+                continue
+            match = DOT_EDGE.match(line)
+            if match:
+                edges.append((match.group(1), match.group(2)))
+        end = "End"
+    else:
+        raise ValueError(f"unknown format {format!r}, expected one of {', '.join(FORMATS)}")
+
+    graph = FlowGraph()
+    ids = {}
+    for node, label in nodes.items():
+        ids[node] = START if not ids else graph.add_node(label)
+    for from_node, to_node in edges:
+        graph.add_edge(ids[from_node], ids[to_node])
+    graph.end = ids.get(end)
+    return graph
+
+
+def definition_label(graph):
+    """Return the label naming the function a graph draws, e.g. 'Function name', or None."""
+    for from_node, to_node in graph.edges():
+        if from_node == START:
+            label = graph.label(to_node)
+            if label.startswith(tuple(kind + " " for kind in DEFINITION_KINDS)):
+                return label
+    return None
+
+
+def _stem(file_path, suffix):
+    name = os.path.basename(file_path)
+    return name[:-len(suffix)] if name.endswith(suffix) else name
+
+
+def _write_stub(file_path, label, shared_file, format):
+    """Replace a diagram with a single node that names it and the shared file drawing it."""
+    stub = FlowGraph()
+    reference = os.path.relpath(shared_file, os.path.dirname(file_path) or ".").replace(os.sep, "/")
+    node = stub.add_node(f"{label} (see {reference})")
+    stub.add_edge(START, node)
+    stub.add_edge(node, stub.add_end())
+    write_diagram(file_path, serialize(stub, format))
+
+
+def link_or_copy(target, path):
+    """Make path a relative symbolic link to target, or a copy of it where links are not supported."""
+    if os.path.lexists(path):
+        os.remove(path)
+    try:
+        os.symlink(os.path.relpath(target, os.path.dirname(path) or "."), path)
+    except (OSError, NotImplementedError):
+        shutil.copyfile(target, path)
@@ -0,0 +1,73 @@
+"""
+Index of the function definitions in a parsed Python module.
+
+A FunctionIndex is built with a single traversal of the AST and maps fully
+qualified names (e.g. 'Outer.Inner.method' or 'outer.inner') to the function
+nodes and their line spans, so that any number of targets can be looked up
+in constant time from one parse of the source.
+"""
+
+import ast
+from collections import namedtuple
+
+# A function found in the module, with the qualified name of its enclosing scope
+# (class or function) and its line span, including any decorators
+IndexedFunction = namedtuple("IndexedFunction", ["name", "node", "scope", "start_line", "end_line"])
+
+
+class FunctionIndex:
+    """Maps the fully qualified name of every function in a module to its AST node.
+
+    Names are built like Python's __qualname__ without the '<locals>' parts:
+    methods are prefixed with their class, nested classes with their outer class
+    and nested functions with their enclosing function. Both def and async def
+    functions are indexed. If a name is defined more than once, the first
+    definition wins.
+    """
+
+    def __init__(self, tree):
+        self.tree = tree
+        self._functions = {}
+        self._collect(tree, None)
+
+    @classmethod
+    def from_source(cls, source_code):
+        """Parse the source code and build an index for it."""
+        return cls(ast.parse(source_code))
+
+    def _collect(self, tree, scope):
+        # Walk the nodes in source order, tracking the qualified name of the enclosing scope. An
+        # explicit stack is used rather than recursion so that deeply nested code (e.g. a long
+        # elif chain) cannot exhaust the interpreter's stack
+        stack = [(tree, scope)]
+        while stack:
+            node, scope = stack.pop()
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                name = f"{scope}.{node.name}" if scope else node.name
+                if name not in self._functions:
+                    start_line = min([node.lineno] + [d.lineno for d in node.decorator_list])
+                    self._functions[name] = IndexedFunction(name, node, scope, start_line, node.end_lineno)
+                scope = name
+            elif isinstance(node, ast.ClassDef):
+                scope = f"{scope}.{node.name}" if scope else node.name
+            stack.extend((child, scope) for child in reversed(list(ast.iter_child_nodes(node))))
+
+    def get(self, name, default=None):
+        """Return the IndexedFunction for a qualified name, or default if there is none."""
+        return self._functions.get(name, default)
+
+    def names(self):
+        """Return the qualified names of all indexed functions, in source order."""
+        return list(self._functions)
+
+    def __getitem__(self, name):
+        return self._functions[name]
+
+    def __contains__(self, name):
+        return name in self._functions
+
+    def __iter__(self):
+        return iter(self._functions.values())
+
+    def __len__(self):
+        return len(self._functions)
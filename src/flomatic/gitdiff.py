@@ -0,0 +1,305 @@
+"""
+Diagramming only the functions changed between two git revisions.
+
+git diff is run without context lines, and the line ranges of its hunks are
+mapped to the functions they touch with a FunctionIndex of each changed file:
+lines added or changed are looked up in the file at the new revision, and
+lines removed in the file at the old one. A line belongs to the innermost
+function around it, and the header of a nested function (its decorators and
+def line) also to the function it is defined in, whose diagram has a node for
+it. Only the flowcharts of those functions are generated, so a review of a
+change to a large repository takes a fraction of a second.
+"""
+
+import importlib.util
+import os
+import re
+import subprocess
+from collections import namedtuple
+
+from flomatic.code_to_mermaid import FlowchartGenerator, diagram_filename, write_diagram
+from flomatic.function_index import FunctionIndex
+from flomatic.project import matches_any
+
+# A source file changed between the revisions: its path at the new revision (None if it was
+# deleted) and at the old one (None if it was added), relative to the top of the repository,
+# and the qualified names of the functions changed in it and of those removed from it, in
+# source order
+ChangedFile = namedtuple("ChangedFile", ["path", "old_path", "functions", "removed"])
+
+# The outcome of a diff run: the diagram files saved for each changed source file, an error
+# message for each one that could not be processed, and the functions removed from each
+DiffResult = namedtuple("DiffResult", ["saved_files", "failures", "removed"])
+
+_HUNK = re.compile(r"@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+_QUOTED = re.compile(rb'\\([0-7]{3}|.)')
+_ESCAPES = {b"a": b"\a", b"b": b"\b", b"t": b"\t", b"n": b"\n", b"v": b"\v", b"f": b"\f", b"r": b"\r"}
+
+
+def parse_revisions(spec, cwd="."):
+    """Return the (base, head) revisions to compare for a revision range, as git diff reads it.
+
+    'BASE..HEAD' compares two revisions, 'BASE...HEAD' compares HEAD with the point where it
+    branched off BASE, and 'BASE' compares BASE with the working tree (head is None).
+    Either side of a range defaults to HEAD.
+    """
+    if "..." in spec:
+        base, _, head = spec.partition("...")
+        head = head or "HEAD"
+        base = _git(["merge-base", base or "HEAD", head], cwd).decode("utf-8", "surrogateescape").strip()
+        return base, head
+    base, separator, head = spec.partition("..")
+    if not separator:
+        return spec, None
+    return base or "HEAD", head or "HEAD"
+
+
+def repository_root(cwd="."):
+    """Return the top directory of the git repository containing cwd.
+
+    Raises:
+        ValueError: If cwd is not in a git repository.
+    """
+    return _git(["rev-parse", "--show-toplevel"], cwd).decode("utf-8", "surrogateescape").rstrip("\n")
+
+
+def functions_in_lines(index, ranges):
+    """Return the qualified names of the functions whose diagrams draw any of the lines.
+
+    Args:
+        index (FunctionIndex): The index of the source the line numbers refer to.
+        ranges (iterable): (first line, last line) pairs, inclusive and numbered from 1.
+
+    Returns:
+        list: The names, in source order.
+    """
+    owners = {}
+    headers = {}
+    # Enclosing functions come before the functions nested in them, which take their lines over
+    for entry in index:
+        for line in range(entry.start_line, entry.end_line + 1):
+            owners[line] = entry.name
+        if entry.scope in index:
+            for line in range(entry.start_line, entry.node.lineno + 1):
+                headers[line] = entry.scope
+    touched = set()
+    for first, last in ranges:
+        for line in range(first, last + 1):
+            touched.add(owners.get(line))
+            touched.add(headers.get(line))
+    return [name for name in index.names() if name in touched]
+
+
+def changed_functions(base, head=None, paths=(), include=("*.py",), exclude=(), cwd="."):
+    """Find the functions changed between two revisions of a git repository.
+
+    Args:
+        base (str): The old revision, e.g. 'main' or 'HEAD~3'.
+        head (str, optional): The new revision. Defaults to None, for the working tree
+                            (files git does not track are left out).
+        paths (sequence, optional): Limit the diff to these paths (git pathspecs).
+        include (sequence, optional): Glob patterns of the files to look at, against their path
+                                    in the repository or their name. Defaults to ('*.py',).
+        exclude (sequence, optional): Glob patterns of files and directories to leave out.
+        cwd (str, optional): A directory inside the repository. Defaults to the current one.
+
+    Returns:
+        list: ChangedFile tuples, in the order git lists the files.
+
+    Raises:
+        ValueError: If git fails, e.g. because a revision does not exist.
+        SyntaxError: If a changed file does not parse at the new revision.
+    """
+    return [changed for changed, _, _ in _changed_files(base, head, paths, include, exclude, cwd)]
+
+
+def generate_diff_diagrams(base, head=None, output_dir="mermaid_diagrams", paths=(), include=("*.py",),
+                           exclude=(), cwd=".", generator=None, compact=True, format="mermaid"):
+    """Generate the diagrams of only the functions changed between two revisions.
+
+    Each changed file's diagrams are generated from its content at head and saved under a
+    directory mirroring its path in the repository (pkg/module.py -> output_dir/pkg/module/),
+    as in a project run. Nothing is generated for the other functions and files.
+
+    Args:
+        base (str): The old revision.
+        head (str, optional): The new revision, or None for the working tree.
+        output_dir (str, optional): Directory where the diagrams are saved. Defaults to 'mermaid_diagrams'.
+        paths, include, exclude, cwd: Which files to look at (see changed_functions).
+        generator (FlowchartGenerator, optional): The generator to use, with its options.
+        compact (bool, optional): If True, only include control flow elements in the diagram.
+                                If False, include all AST nodes. Defaults to True.
+        format (str, optional): The output format (see FlowchartGenerator.generate_flowchart).
+                              Defaults to 'mermaid'.
+
+    Returns:
+        DiffResult: The saved file paths and the failures per source file, and the removed functions.
+    """
+    generator = generator or FlowchartGenerator()
+    saved_files = {}
+    failures = {}
+    removed = {}
+    changes = _changed_files(base, head, paths, include, exclude, cwd, failures)
+    for changed, source_code, index in changes:
+        if changed.removed:
+            removed[changed.path or changed.old_path] = changed.removed
+        if not changed.functions:
+            continue
+        file_dir = os.path.join(output_dir, os.path.splitext(changed.path)[0])
+        os.makedirs(file_dir, exist_ok=True)
+        saved_files[changed.path] = []
+        for name in changed.functions:
+            for func_name, func_flowchart in generator.generate_flowchart_parts(source_code, name, compact, index,
+                                                                                format):
+                file_path = os.path.join(file_dir, diagram_filename(func_name, format))
+                write_diagram(file_path, func_flowchart)
+                saved_files[changed.path].append(file_path)
+    return DiffResult(saved_files, failures, removed)
+
+
+def _changed_files(base, head, paths, include, exclude, cwd, failures=None):
+    """Yield (ChangedFile, source at head, FunctionIndex) for every changed file.
+
+    With failures, a file that cannot be read or parsed at head is recorded in it with its
+    error message and skipped; otherwise the error is raised.
+    """
+    top = repository_root(cwd)
+    diffs = [diff for diff in _diff_ranges(base, head, paths, cwd)
+             if any(matches_any(path, include) and not matches_any(path, exclude)
+                    for path in diff[:2] if path is not None)]
+
+    # Read every file needed from the object database at once
+    specs = []
+    for old_path, path, old_ranges, _ in diffs:
+        if old_path is not None and old_ranges:
+            specs.append(f"{base}:{old_path}")
+        if path is not None and head is not None:
+            specs.append(f"{head}:{path}")
+    blobs = dict(zip(specs, _read_blobs(specs, top)))
+
+    for old_path, path, old_ranges, ranges in diffs:
+        try:
+            if path is None:
+                source_code, index = None, FunctionIndex.from_source("")
+            else:
+                if head is None:
+                    with open(os.path.join(top, path), "rb") as f:
+                        data = f.read()
+                else:
+                    data = blobs[f"{head}:{path}"]
+                source_code = importlib.util.decode_source(data)
+                index = FunctionIndex.from_source(source_code)
+        except (OSError, SyntaxError, UnicodeDecodeError, ValueError, RecursionError) as e:
+            if failures is None:
+                raise
+            failures[path] = f"{type(e).__name__}: {e}"
+            continue
+        functions = set(functions_in_lines(index, ranges))
+        removed = []
+        old_data = blobs.get(f"{base}:{old_path}")
+        if old_data is not None:
+            try:
+                old_index = FunctionIndex.from_source(importlib.util.decode_source(old_data))
+            except (SyntaxError, UnicodeDecodeError, ValueError, RecursionError):
+                # The lines removed cannot be placed, but the lines added still can
+                old_index = FunctionIndex.from_source("")
+            for name in functions_in_lines(old_index, old_ranges):
+                if name in index:
+                    functions.add(name)
+                else:
+                    removed.append(name)
+        yield ChangedFile(path, old_path, [name for name in index.names() if name in functions], removed), \
+            source_code, index
+
+
+def _diff_ranges(base, head, paths, cwd):
+    """Return (old path, new path, old line ranges, new line ranges) for every file changed.
+
+    The paths given are relative to cwd, and those returned to the top of the repository,
+    or None for files added or deleted. Ranges are (first, last) pairs of the lines
+    removed from the old file and added to the new one.
+    """
+    args = ["diff", "--no-color", "--no-ext-diff", "--no-textconv", "--unified=0", "--find-renames",
+            "--src-prefix=a/", "--dst-prefix=b/", base]
+    if head is not None:
+        args.append(head)
+    output = _git(args + ["--"] + list(paths), cwd).decode("utf-8", "surrogateescape")
+
+    diffs = []
+    old_path = None
+    remaining = 0  # Lines of the current hunk still to be skipped
+    for line in output.splitlines():
+        if remaining > 0:
+            if line[:1] in ("-", "+", " "):
+                remaining -= 1
+            continue
+        if line.startswith("--- "):
+            old_path = _diff_path(line[4:], "a/")
+        elif line.startswith("+++ "):
+            diffs.append((old_path, _diff_path(line[4:], "b/"), [], []))
+        elif line.startswith("@@ ") and diffs:
+            match = _HUNK.match(line)
+            old_start, old_count, new_start, new_count = (int(group) if group is not None else 1
+                                                          for group in match.groups())
+            if old_count:
+                diffs[-1][2].append((old_start, old_start + old_count - 1))
+            if new_count:
+                diffs[-1][3].append((new_start, new_start + new_count - 1))
+            remaining = old_count + new_count
+    return diffs
+
+
+def _diff_path(name, prefix):
+    """Return the path named in a ---/+++ line of a diff, or None for /dev/null."""
+    # git adds a tab after names with spaces in them, and quotes names with unusual characters
+    name = name.rstrip("\t")
+    if name.startswith('"'):
+        name = _unquote(name)
+    if name == "/dev/null":
+        return None
+    return name[len(prefix):] if name.startswith(prefix) else name
+
+
+def _unquote(name):
+    def unescape(match):
+        escape = match.group(1)
+        if escape[:1].isdigit():
+            return bytes([int(escape, 8)])
+        return _ESCAPES.get(escape, escape)
+    return _QUOTED.sub(unescape, name[1:-1].encode("utf-8", "surrogateescape")).decode("utf-8", "surrogateescape")
+
+
+def _read_blobs(specs, top):
+    """Return the contents of 'revision:path' specs as bytes (None if missing), with one git process."""
+    if not specs:
+        return []
+    output = _git(["cat-file", "--batch"], top, "".join(f"{spec}\n" for spec in specs).encode("utf-8",
+                                                                                              "surrogateescape"))
+    blobs = []
+    position = 0
+    for _ in specs:
+        end = output.index(b"\n", position)
+        header = output[position:end].split()
+        position = end + 1
+        if len(header) != 3 or not header[2].isdigit():
+            # '<spec> missing', e.g. a file the old revision did not have
+            blobs.append(None)
+            continue
+        size = int(header[2])
+        blobs.append(output[position:position + size] if header[1] == b"blob" else None)
+        position += size + 1
+    return blobs
+
+
+def _git(args, cwd, input=None):
+    """Run a git command in cwd and return its output as bytes.
+
+    Raises:
+        ValueError: If git exits with an error.
+    """
+    process = subprocess.run(["git"] + args, cwd=cwd, input=input, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+    if process.returncode != 0:
+        error = process.stderr.decode("utf-8", "replace").strip()
+        raise ValueError(error or f"git {args[0]} exited with status {process.returncode}")
+    return process.stdout
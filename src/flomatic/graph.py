@@ -0,0 +1,140 @@
+"""
+Compact graph representation of a flowchart.
+
+FlowchartGenerator builds a FlowGraph while it visits the AST. Nodes are
+integer ids, labels are interned so repeated labels ("Then", "Loop Body",
+...) are stored once, and edges are kept in flat arrays. Output formats such
+as Mermaid text are produced by serializers on top of the graph, so other
+consumers (renderers, analytics, tests) can use the graph directly instead of
+parsing text back.
+"""
+
+import hashlib
+from array import array
+
+# Id of the Start node, which every graph has
+START = 0
+
+
+class FlowGraph:
+    """A flowchart as integer nodes with interned labels and array-backed edges.
+
+    Attributes:
+        labels (list): The distinct label strings, indexed by label id.
+        node_labels (array): The label id of every node, indexed by node id.
+        edge_sources (array): The source node of every edge, in the order the edges were added.
+        edge_targets (array): The target node of every edge, in the order the edges were added.
+        edge_positions (array): For every edge, the id of the newest node when it was added,
+                                which lets serializers keep declarations and edges interleaved
+                                in the order they were built.
+        end (int): Id of the End node, or None while the graph is being built.
+    """
+
+    def __init__(self):
+        self.labels = []
+        self._label_ids = {}
+        self.node_labels = array("I")
+        self.edge_sources = array("I")
+        self.edge_targets = array("I")
+        self.edge_positions = array("I")
+        self.end = None
+        self.add_node("Start")
+
+    def add_node(self, label):
+        """Add a node with the given label and return its id."""
+        label_id = self._label_ids.get(label)
+        if label_id is None:
+            label_id = len(self.labels)
+            self._label_ids[label] = label_id
+            self.labels.append(label)
+        self.node_labels.append(label_id)
+        return len(self.node_labels) - 1
+
+    def add_edge(self, from_node, to_node):
+        """Add an edge between two node ids."""
+        self.edge_sources.append(from_node)
+        self.edge_targets.append(to_node)
+        self.edge_positions.append(len(self.node_labels) - 1)
+
+    def add_end(self):
+        """Add the End node and return its id."""
+        self.end = self.add_node("End")
+        return self.end
+
+    @property
+    def node_count(self):
+        """Number of nodes, including Start and End."""
+        return len(self.node_labels)
+
+    @property
+    def edge_count(self):
+        return len(self.edge_sources)
+
+    def label(self, node):
+        """Return the label of a node."""
+        return self.labels[self.node_labels[node]]
+
+    def edges(self):
+        """Return the edges as a list of (from, to) node id pairs, in the order they were added."""
+        return list(zip(self.edge_sources, self.edge_targets))
+
+    def successors(self):
+        """Return a list holding the successor node ids of every node."""
+        successors = [[] for _ in range(self.node_count)]
+        for from_node, to_node in zip(self.edge_sources, self.edge_targets):
+            successors[from_node].append(to_node)
+        return successors
+
+    def node_name(self, node):
+        """Return the name used for a node in text formats: Start, End or node<id>."""
+        if node == START:
+            return "Start"
+        if node == self.end:
+            return "End"
+        return f"node{node}"
+
+    def fingerprint(self, relabel=None):
+        """Return a hash of the graph's labels and edges that does not depend on how its nodes are numbered.
+
+        Nodes are renumbered in depth-first order from Start, following each node's edges in
+        the order they were added, so graphs that differ only in their numbering (or in the
+        order their nodes were declared) get the same fingerprint, and graphs that draw
+        different flowcharts get different ones. Nodes that cannot be reached from Start are
+        numbered afterwards, from the one with the smallest label.
+
+        Args:
+            relabel (dict, optional): Labels to count as other labels, e.g. to leave out a name.
+
+        Returns:
+            str: A hex digest of the renumbered graph.
+        """
+        relabel = relabel or {}
+        labels = [relabel.get(label, label) for label in self.labels]
+        successors = self.successors()
+        order = [None] * self.node_count  # The new number of every node
+        numbered = []
+        root = START
+        while True:
+            stack = [root]
+            while stack:
+                node = stack.pop()
+                if order[node] is None:
+                    order[node] = len(numbered)
+                    numbered.append(node)
+                    stack.extend(reversed(successors[node]))
+            if len(numbered) == self.node_count:
+                break
+            # Continue from an unreachable node that no other unreachable node leads to, if any
+            remaining = [node for node in range(self.node_count) if order[node] is None]
+            reached = {successor for node in remaining for successor in successors[node] if successor != node}
+            root = min([node for node in remaining if node not in reached] or remaining,
+                       key=lambda node: (labels[self.node_labels[node]],
+                                         [order[successor] for successor in successors[node]
+                                          if order[successor] is not None]))
+        digest = hashlib.sha256()
+        for node in numbered:
+            for part in (labels[self.node_labels[node]], "End" if node == self.end else "",
+                         ",".join(str(order[successor]) for successor in successors[node])):
+                digest.update(part.encode("utf-8"))
+                digest.update(b"\0")
+        return digest.hexdigest()
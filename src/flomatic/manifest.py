@@ -0,0 +1,99 @@
+"""
+Manifest of the diagrams generated from each source file.
+
+The manifest is stored alongside the diagrams in the output directory. For each
+source file it records the file's modification time and content hash, and the
+hash and output file of every function diagrammed from it, so that a rerun can
+skip unchanged files, rewrite only the diagrams of changed functions and delete
+the diagrams of functions that were removed.
+"""
+
+import json
+import os
+import tempfile
+
+from flomatic.sources import source_mtime
+
+MANIFEST_NAME = ".flomatic-manifest.json"
+MANIFEST_VERSION = 1
+
+
+class Manifest:
+    """The per-source-file records of a diagram output directory.
+
+    Each record is a dictionary with the keys 'mtime' (nanoseconds), 'hash'
+    (of the source text), 'options' (a hash of the generator options) and
+    'functions', which maps qualified function names to dictionaries with
+    the function's 'hash' and the 'file' name of its diagram.
+    """
+
+    def __init__(self, path, sources=None):
+        self.path = path
+        self.sources = sources if sources is not None else {}
+
+    @classmethod
+    def load(cls, path):
+        """Load the manifest at path, or return an empty one if it is missing or unreadable."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return cls(path)
+        if not isinstance(data, dict) or data.get("version") != MANIFEST_VERSION:
+            return cls(path)
+        return cls(path, data.get("sources", {}))
+
+    @classmethod
+    def for_output_dir(cls, output_dir):
+        """Load the manifest kept in a diagram output directory."""
+        return cls.load(os.path.join(output_dir, MANIFEST_NAME))
+
+    def get(self, source_file):
+        """Return the record for a source file, or None if it has not been seen."""
+        return self.sources.get(os.path.abspath(source_file))
+
+    def set(self, source_file, record):
+        """Replace the record for a source file."""
+        self.sources[os.path.abspath(source_file)] = record
+
+    def remove(self, source_file):
+        """Forget a source file, returning its record (or None)."""
+        return self.sources.pop(os.path.abspath(source_file), None)
+
+    def is_current(self, source_file, options):
+        """Return True if a source file is unchanged since its diagrams were generated with options.
+
+        The file counts as unchanged if its modification time matches the record and every
+        diagram recorded for it still exists next to the manifest. This is the cheap check
+        done before a file is read; see FlowchartGenerator.update_mermaid_diagrams.
+        """
+        record = self.get(source_file)
+        if not record or record["options"] != options:
+            return False
+        try:
+            if source_mtime(source_file) != record["mtime"]:
+                return False
+        except OSError:
+            return False
+        directory = os.path.dirname(self.path)
+        return all(os.path.exists(os.path.join(directory, function["file"]))
+                   for function in record["functions"].values())
+
+    def claims(self, file_name, excluding=None):
+        """Return True if a source file other than excluding has a diagram saved as file_name."""
+        excluding = os.path.abspath(excluding) if excluding else None
+        for source_file, record in self.sources.items():
+            if source_file == excluding:
+                continue
+            if any(function["file"] == file_name for function in record["functions"].values()):
+                return True
+        return False
+
+    def save(self):
+        """Write the manifest atomically."""
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "sources": self.sources}, f, indent=1, sort_keys=True)
+        os.replace(temp_path, self.path)
@@ -0,0 +1,326 @@
+"""
+Whole-project diagram generation.
+
+Discovers the Python files under a root directory and generates the
+per-function diagrams for all of them, fanning the parsing and visiting
+out across a pool of worker processes. Diagrams are written by the parent
+process in sorted file order, so the output does not depend on which
+worker finishes first, and a file that fails is reported without
+aborting the rest of the run.
+
+Sources can also be read from .whl and .zip archives without extracting
+them, and packages can be named by their dotted module name (see
+flomatic.sources).
+
+In changed-only mode each file's output directory keeps a manifest, files
+that have not changed since the last run are skipped before any worker is
+started, and the workers update the diagrams of the remaining files in
+place.
+"""
+
+import fnmatch
+import os
+from collections import namedtuple
+
+from flomatic.cache import DiagramCache
+from flomatic.manifest import Manifest
+from flomatic.sources import archive_members, is_archive, member_path, module_locations, read_source, split_archive_path
+
+# The outcome of a project run: the diagram files saved for each source file, an error
+# message for each source file that could not be processed, the diagram files removed for
+# each source file (changed-only runs) and the source files skipped as unchanged
+ProjectResult = namedtuple("ProjectResult", ["saved_files", "failures", "removed", "unchanged"])
+
+# Per-process state of the pool workers, set up once by _init_worker
+_worker_generator = None
+_worker_cache = None
+_worker_stats = None
+
+
+def matches_any(path, patterns):
+    """Return True if a relative path, or its last component, matches one of the glob patterns."""
+    path = path.replace(os.sep, "/")
+    name = path.rsplit("/", 1)[-1]
+    return any(fnmatch.fnmatch(path, pattern) or fnmatch.fnmatch(name, pattern) for pattern in patterns)
+
+
+def discover_sources(root, include=("*.py",), exclude=()):
+    """Return the paths of the Python files under root, sorted.
+
+    Hidden directories and __pycache__ directories are skipped. If root is
+    itself a file, it is returned as the only source. The files in a .whl or
+    .zip archive, or in a directory inside one, are listed by their member
+    paths (see flomatic.sources) without extracting them.
+
+    Args:
+        root (str): Directory to search, archive, directory inside an archive, or a single source file.
+        include (sequence, optional): Glob patterns a file must match, against its path relative
+                                    to root or its name. Defaults to ('*.py',).
+        exclude (sequence, optional): Glob patterns of files and directories to leave out,
+                                    matched the same way.
+    """
+    if is_archive(root) or not os.path.exists(root):
+        return _discover_archive_sources(root, include, exclude)
+    if os.path.isfile(root):
+        return [root]
+    sources = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        relative_dir = os.path.relpath(dirpath, root)
+        relative_dir = "" if relative_dir == "." else relative_dir
+        dirnames[:] = [d for d in dirnames if not d.startswith(".") and d != "__pycache__"
+                       and not matches_any(os.path.join(relative_dir, d), exclude)]
+        for name in filenames:
+            relative = os.path.join(relative_dir, name)
+            if matches_any(relative, include) and not matches_any(relative, exclude):
+                sources.append(os.path.join(dirpath, name))
+    return sorted(sources)
+
+
+def _discover_archive_sources(root, include, exclude):
+    split = split_archive_path(root)
+    if split is None:
+        return []
+    archive, prefix = split
+    members = archive_members(archive, prefix)
+    if not members and prefix and prefix in archive_members(archive, prefix.rpartition("/")[0]):
+        # A single file inside the archive
+        return [root]
+    sources = []
+    start = len(prefix) + 1 if prefix else 0
+    for member in members:
+        relative = member[start:]
+        directories = relative.split("/")[:-1]
+        if any(d.startswith(".") or d == "__pycache__" for d in directories):
+            continue
+        if any(matches_any("/".join(directories[:depth + 1]), exclude) for depth in range(len(directories))):
+            continue
+        if matches_any(relative, include) and not matches_any(relative, exclude):
+            sources.append(member_path(archive, member))
+    return sorted(sources)
+
+
+def module_sources(name, include=("*.py",), exclude=()):
+    """Return the (source file, root) pairs of a module or package named by its dotted name.
+
+    The module is found without being imported (see flomatic.sources.find_module_spec). The
+    files of a package are discovered as under a directory, and each is paired with the
+    directory or archive its top-level package is in, so that the diagrams of 'pkg.sub'
+    are saved under pkg/sub/ in the output directory.
+
+    Returns:
+        list: The pairs, empty if the module cannot be found or has no Python source.
+    """
+    sources = []
+    for path, root in module_locations(name):
+        sources.extend((source_file, root) for source_file in discover_sources(path, include, exclude))
+    return sources
+
+
+def output_dir_for(source_file, root, output_dir):
+    """Return the directory the diagrams of a source file are saved to.
+
+    Each file gets its own directory, mirroring its path relative to root
+    without the .py suffix (e.g. pkg/module.py -> output_dir/pkg/module).
+    An archive root is treated like a directory.
+    """
+    if os.path.isfile(root) and not is_archive(root):
+        relative = os.path.basename(source_file)
+    else:
+        relative = os.path.relpath(source_file, root)
+    return os.path.join(output_dir, os.path.splitext(relative)[0])
+
+
+def _init_worker(cache_dir, cache_size, collect_stats=False, generator_options=None):
+    from flomatic.code_to_mermaid import FlowchartGenerator
+
+    global _worker_generator, _worker_cache, _worker_stats
+    _worker_generator = FlowchartGenerator(**(generator_options or {}))
+    _worker_cache = DiagramCache(cache_dir, cache_size) if cache_dir else None
+    _worker_stats = _worker_generator.enable_stats() if collect_stats else None
+
+
+def _take_worker_stats():
+    """Return the stats recorded by this worker since the last call (as a dictionary), or None."""
+    if _worker_stats is None:
+        return None
+    recorded = _worker_stats.to_dict()
+    _worker_stats.reset()
+    return recorded
+
+
+def _generate_file(task):
+    """Generate the diagrams for one source file, returning (source_file, diagrams, error, stats)."""
+    source_file, compact, format = task
+    try:
+        source_code = read_source(source_file)
+        diagrams = _worker_generator.generate_function_flowcharts(source_code, compact, _worker_cache, format)
+    except Exception as e:
+        # Anything, even a bug in a visitor, fails this file only
+        return source_file, None, f"{type(e).__name__}: {e}", _take_worker_stats()
+    return source_file, diagrams, None, _take_worker_stats()
+
+
+def _update_file(task):
+    """Update the diagrams of one source file in place, returning (source_file, (written, removed), error, stats)."""
+    source_file, file_dir, compact, format = task
+    try:
+        changes = _worker_generator.update_mermaid_diagrams(source_file, file_dir, compact, _worker_cache,
+                                                            format=format)
+    except Exception as e:
+        # Anything, even a bug in a visitor, fails this file only
+        return source_file, None, f"{type(e).__name__}: {e}", _take_worker_stats()
+    return source_file, changes, None, _take_worker_stats()
+
+
+def _map_tasks(function, tasks, jobs, cache_dir, cache_size, stats, generator_options):
+    """Yield function(task) for every task in order, using a process pool if jobs > 1.
+
+    With stats, the workers' recorded stats are merged into it and left out of the results.
+    """
+    for source_file, outcome, error, recorded in _run_tasks(function, tasks, jobs, cache_dir, cache_size,
+                                                            stats is not None, generator_options):
+        if recorded is not None:
+            stats.merge(recorded)
+        yield source_file, outcome, error
+
+
+def _run_tasks(function, tasks, jobs, cache_dir, cache_size, collect_stats, generator_options):
+    if jobs == 1 or len(tasks) <= 1:
+        _init_worker(cache_dir, cache_size, collect_stats, generator_options)
+        yield from map(function, tasks)
+        return
+
+    # Imported here because it is slow to import and not needed by serial or no-op runs
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                             initargs=(cache_dir, cache_size, collect_stats, generator_options)) as executor:
+        # map yields results in task order, so files are written in sorted order
+        chunksize = max(1, len(tasks) // (jobs * 4))
+        yield from executor.map(function, tasks, chunksize=chunksize)
+
+
+def generate_project_diagrams(root, output_dir, jobs=None, compact=True, cache_dir=None,
+                              cache_size=256 * 1024 * 1024, format="mermaid", include=("*.py",),
+                              exclude=(), changed_only=False, stats=None, max_label_length=None,
+                              simplify=False, max_nodes=None, shared=None):
+    """Generate the per-function diagrams for every Python file under a directory.
+
+    Args:
+        root (str): Directory to search for .py files, a .whl or .zip archive, a single source
+                  file, or the dotted name of a module or package that is not a path.
+        output_dir (str): Directory where the diagrams are saved, one subdirectory per source file.
+        jobs (int, optional): Number of worker processes. Defaults to the number of CPUs.
+                            With 1, everything runs in the calling process.
+        compact (bool, optional): If True, only include control flow elements in the diagram.
+                                If False, include all AST nodes. Defaults to True.
+        cache_dir (str, optional): If provided, a DiagramCache directory shared by the workers.
+        cache_size (int, optional): Maximum size of the cache in bytes.
+        format (str, optional): The output format: 'mermaid', 'dot', 'json' or 'adjacency'.
+                              Defaults to 'mermaid'.
+        include (sequence, optional): Glob patterns of the files to diagram (see discover_sources).
+        exclude (sequence, optional): Glob patterns of files and directories to leave out.
+        changed_only (bool, optional): If True, keep a manifest in each file's output directory
+                                     and only regenerate what changed since the last run
+                                     (see FlowchartGenerator.update_mermaid_diagrams).
+        stats (GeneratorStats, optional): If provided, the workers record their phase timings and
+                                        visit counts, which are merged into it, and the time spent
+                                        writing diagrams is added to its 'write' phase.
+        max_label_length (int, optional): If provided, truncate label expressions to this length
+                                        (see FlowchartGenerator).
+        simplify (bool, optional): If True, simplify every graph (see FlowchartGenerator).
+        max_nodes (int, optional): If provided, split diagrams with more nodes into sub-diagrams
+                                 (see FlowchartGenerator).
+        shared (SharedDiagrams, optional): If provided, diagrams are saved through it, so that
+                                         identical flowcharts are stored once (see flomatic.dedupe).
+                                         Not supported with changed_only.
+
+    Returns:
+        ProjectResult: The saved file paths per source file, and the failures per source file.
+    """
+    if os.path.exists(root) or split_archive_path(root) is not None:
+        sources = [(source_file, root) for source_file in discover_sources(root, include, exclude)]
+    else:
+        sources = module_sources(root, include, exclude)
+    return generate_diagrams(sources, output_dir, jobs, compact, cache_dir, cache_size, format, changed_only,
+                             stats, max_label_length, simplify, max_nodes, shared)
+
+
+def generate_diagrams(sources, output_dir, jobs=None, compact=True, cache_dir=None,
+                      cache_size=256 * 1024 * 1024, format="mermaid", changed_only=False, stats=None,
+                      max_label_length=None, simplify=False, max_nodes=None, shared=None):
+    """Generate the per-function diagrams for a list of source files from one or more roots.
+
+    Args:
+        sources (list): (source file, root) pairs. Each file's diagrams are saved under
+                      output_dir_for(source file, root, output_dir).
+
+    The other arguments are those of generate_project_diagrams.
+
+    Returns:
+        ProjectResult: The outcome of the run.
+    """
+    if changed_only and shared is not None:
+        raise ValueError("shared diagrams are not supported in changed-only runs")
+    jobs = jobs or os.cpu_count() or 1
+    generator_options = {"max_label_length": max_label_length, "simplify": simplify, "max_nodes": max_nodes}
+    if not changed_only:
+        tasks = [(source_file, compact, format) for source_file, _ in sources]
+        results = _map_tasks(_generate_file, tasks, jobs, cache_dir, cache_size, stats, generator_options)
+        return _save_results(results, dict(sources), output_dir, format, stats, shared)
+
+    # Check the manifests first, so that a run where nothing changed starts no workers
+    from flomatic.code_to_mermaid import diagram_options
+
+    options = diagram_options(compact, format, **generator_options)
+    tasks = []
+    unchanged = []
+    for source_file, root in sources:
+        file_dir = output_dir_for(source_file, root, output_dir)
+        if Manifest.for_output_dir(file_dir).is_current(source_file, options):
+            unchanged.append(source_file)
+        else:
+            tasks.append((source_file, file_dir, compact, format))
+
+    saved_files = {}
+    failures = {}
+    removed = {}
+    for source_file, changes, error in _map_tasks(_update_file, tasks, jobs, cache_dir, cache_size, stats,
+                                                  generator_options):
+        if error is not None:
+            failures[source_file] = error
+        else:
+            saved_files[source_file], removed[source_file] = changes
+    return ProjectResult(saved_files, failures, removed, unchanged)
+
+
+def _save_results(results, roots, output_dir, format, stats=None, shared=None):
+    from flomatic.code_to_mermaid import diagram_filename
+
+    saved_files = {}
+    failures = {}
+    for source_file, diagrams, error in results:
+        if error is not None:
+            failures[source_file] = error
+            continue
+        file_dir = output_dir_for(source_file, roots[source_file], output_dir)
+        os.makedirs(file_dir, exist_ok=True)
+        saved_files[source_file] = []
+        for func_name, func_flowchart in diagrams:
+            file_path = os.path.join(file_dir, diagram_filename(func_name, format))
+            if stats is None:
+                _save_diagram(file_path, func_flowchart, format, shared)
+            else:
+                with stats.timer("write"):
+                    _save_diagram(file_path, func_flowchart, format, shared)
+            saved_files[source_file].append(file_path)
+    return ProjectResult(saved_files, failures, {}, [])
+
+
+def _save_diagram(file_path, flowchart, format, shared):
+    if shared is None:
+        from flomatic.code_to_mermaid import write_diagram
+
+        write_diagram(file_path, flowchart)
+    else:
+        shared.save(file_path, flowchart, format)
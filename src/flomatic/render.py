@@ -0,0 +1,246 @@
+"""
+Batched rendering of Mermaid diagrams to images.
+
+Starting the Mermaid CLI (mmdc) launches a headless browser, which costs far
+more than rendering a single diagram. Instead of one mmdc process per diagram,
+the BatchRenderer writes many diagrams into one Markdown document and renders
+them all with a single mmdc run, which renders every ```mermaid block in the
+document to its own numbered image. Several batches can be rendered
+concurrently. Diagrams with the same text, such as those shared between
+functions (see flomatic.dedupe), are rendered once, and the images of the
+others are links to that image.
+
+With --builtin, diagrams are drawn as SVG by flomatic's own layout engine
+(flomatic.svg) instead, which needs neither mmdc nor a browser.
+
+Usage:
+    python -m flomatic.render [--jobs N] [--batch-size N] [--format png] [--builtin] input_dir output_dir
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from flomatic.cache import cache_key
+from flomatic.dedupe import link_or_copy
+from flomatic.svg import flowchart_to_svg
+
+# The outcome of a render: the image paths written, and an error message per failed diagram name
+RenderResult = namedtuple("RenderResult", ["rendered", "failures"])
+
+
+def read_diagram_files(mmd_paths):
+    """Yield a (name, mermaid text) pair for each .mmd file, named after the file."""
+    for path in mmd_paths:
+        with open(path, "r") as f:
+            yield os.path.splitext(os.path.basename(path))[0], f.read()
+
+
+class BatchRenderer:
+    """Renders Mermaid diagrams to images in batches, one renderer process per batch."""
+
+    def __init__(self, command=("mmdc",), output_format="png", batch_size=100, concurrency=1,
+                 extra_args=(), timeout=None):
+        """Configure the renderer.
+
+        Args:
+            command (sequence): The renderer command. It is run as
+                              command + ['-i', document.md, '-o', output.md, '-e', output_format] + extra_args
+                              and must write the image of the n-th diagram (counting from 1) to
+                              output-n.<output_format>, as mmdc does for Markdown input.
+            output_format (str, optional): Image format, 'png', 'svg' or 'pdf'. Defaults to 'png'.
+            batch_size (int, optional): Number of diagrams rendered by one renderer process. Defaults to 100.
+            concurrency (int, optional): Number of renderer processes run at the same time. Defaults to 1.
+            extra_args (sequence, optional): Extra arguments for the renderer, e.g. ('-b', 'transparent').
+            timeout (float, optional): Seconds to wait for a batch before it is reported as failed.
+        """
+        self.command = list(command)
+        self.output_format = output_format
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.extra_args = list(extra_args)
+        self.timeout = timeout
+
+    def render(self, diagrams, output_dir):
+        """Render diagrams to image files named after them.
+
+        Args:
+            diagrams (iterable): (name, mermaid text) pairs. Batches are started as soon as
+                               they fill up, so this can be a stream such as
+                               FlowchartGenerator.iter_function_flowcharts.
+            output_dir (str): Directory where the images are saved as <name>.<output_format>.
+
+        Returns:
+            RenderResult: The image paths written, and an error message per failed diagram name.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        rendered = []
+        failures = {}
+        duplicates = []
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            pending = []
+            batch = []
+            for diagram in _unique_diagrams(diagrams, duplicates):
+                batch.append(diagram)
+                if len(batch) == self.batch_size:
+                    pending.append(executor.submit(self._render_batch, batch, output_dir))
+                    batch = []
+                    # Keep at most a few batches queued per renderer process
+                    if len(pending) >= 2 * self.concurrency:
+                        self._collect(pending.pop(0), rendered, failures)
+            if batch:
+                pending.append(executor.submit(self._render_batch, batch, output_dir))
+            for future in pending:
+                self._collect(future, rendered, failures)
+        _link_duplicates(duplicates, output_dir, self.output_format, rendered, failures)
+        return RenderResult(rendered, failures)
+
+    def render_files(self, mmd_paths, output_dir):
+        """Render .mmd files to images named after the files.
+
+        Returns:
+            RenderResult: The image paths written, and an error message per failed file's name.
+        """
+        return self.render(read_diagram_files(mmd_paths), output_dir)
+
+    def _collect(self, future, rendered, failures):
+        batch_rendered, batch_failures = future.result()
+        rendered.extend(batch_rendered)
+        failures.update(batch_failures)
+
+    def _render_batch(self, batch, output_dir):
+        rendered = []
+        failures = {}
+        work_dir = tempfile.mkdtemp(prefix="flomatic-render-")
+        try:
+            document = os.path.join(work_dir, "batch.md")
+            with open(document, "w") as f:
+                for _, text in batch:
+                    f.write(f"```mermaid\n{text}\n```\n\n")
+
+            output = os.path.join(work_dir, "out.md")
+            args = self.command + ["-i", document, "-o", output, "-e", self.output_format] + self.extra_args
+            try:
+                process = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                         universal_newlines=True, timeout=self.timeout)
+            except (OSError, subprocess.TimeoutExpired) as e:
+                return rendered, {name: f"{type(e).__name__}: {e}" for name, _ in batch}
+            if process.returncode != 0:
+                error = process.stderr.strip() or f"renderer exited with status {process.returncode}"
+                return rendered, {name: error for name, _ in batch}
+
+            for number, (name, _) in enumerate(batch, start=1):
+                image = os.path.join(work_dir, f"out-{number}.{self.output_format}")
+                if not os.path.exists(image):
+                    failures[name] = "renderer produced no image"
+                    continue
+                target = os.path.join(output_dir, f"{name}.{self.output_format}")
+                shutil.move(image, target)
+                rendered.append(target)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        return rendered, failures
+
+
+def render_builtin_svg(diagrams, output_dir):
+    """Render diagrams to SVG files with the built-in layout engine, without mmdc.
+
+    Args:
+        diagrams (iterable): (name, mermaid text) pairs.
+        output_dir (str): Directory where the images are saved as <name>.svg.
+
+    Returns:
+        RenderResult: The image paths written, and an error message per failed diagram name.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    rendered = []
+    duplicates = []
+    for name, text in _unique_diagrams(diagrams, duplicates):
+        target = os.path.join(output_dir, f"{name}.svg")
+        with open(target, "w") as f:
+            f.write(flowchart_to_svg(text))
+        rendered.append(target)
+    _link_duplicates(duplicates, output_dir, "svg", rendered, {})
+    return RenderResult(rendered, {})
+
+
+def _unique_diagrams(diagrams, duplicates):
+    """Yield the diagrams whose text has not been seen before, and collect the others.
+
+    Args:
+        diagrams (iterable): (name, mermaid text) pairs.
+        duplicates (list): Gets a (name, name of the first diagram with the same text) pair
+                         for each diagram left out.
+    """
+    first_names = {}  # Hash of a diagram's text -> name of the first diagram with it
+    for name, text in diagrams:
+        key = cache_key(text)
+        first_name = first_names.setdefault(key, name)
+        if first_name == name:
+            yield name, text
+        else:
+            duplicates.append((name, first_name))
+
+
+def _link_duplicates(duplicates, output_dir, output_format, rendered, failures):
+    """Give every duplicate diagram a link to the image of the diagram it duplicates, or its failure."""
+    for name, first_name in duplicates:
+        if first_name in failures:
+            failures[name] = failures[first_name]
+            continue
+        target = os.path.join(output_dir, f"{name}.{output_format}")
+        link_or_copy(os.path.join(output_dir, f"{first_name}.{output_format}"), target)
+        rendered.append(target)
+
+
+def stale_diagrams(input_dir, output_dir, output_format="png"):
+    """Return the .mmd files in input_dir whose image in output_dir is missing or older, sorted."""
+    stale = []
+    for name in sorted(os.listdir(input_dir)):
+        if not name.endswith(".mmd"):
+            continue
+        path = os.path.join(input_dir, name)
+        image = os.path.join(output_dir, f"{os.path.splitext(name)[0]}.{output_format}")
+        if not os.path.exists(image) or os.path.getmtime(path) > os.path.getmtime(image):
+            stale.append(path)
+    return stale
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render Mermaid diagrams to images in batches.")
+    parser.add_argument("input_dir", help="directory containing .mmd files")
+    parser.add_argument("output_dir", help="directory for the images")
+    parser.add_argument("--format", default="png", choices=["png", "svg", "pdf"], help="image format")
+    parser.add_argument("--jobs", type=int, default=1, help="number of renderer processes run at once")
+    parser.add_argument("--batch-size", type=int, default=100, help="diagrams rendered per renderer process")
+    parser.add_argument("--all", action="store_true", help="render every diagram, not just those newer than their image")
+    parser.add_argument("--command", default="mmdc", help="renderer command")
+    parser.add_argument("--builtin", action="store_true", help="draw SVG with the built-in layout engine instead of mmdc")
+    args = parser.parse_args(argv)
+    if args.builtin and args.format != "svg":
+        parser.error("--builtin only renders svg")
+
+    if args.all:
+        paths = sorted(os.path.join(args.input_dir, name) for name in os.listdir(args.input_dir) if name.endswith(".mmd"))
+    else:
+        paths = stale_diagrams(args.input_dir, args.output_dir, args.format)
+    if args.builtin:
+        result = render_builtin_svg(read_diagram_files(paths), args.output_dir)
+    else:
+        renderer = BatchRenderer(command=args.command.split(), output_format=args.format,
+                                 batch_size=args.batch_size, concurrency=args.jobs)
+        result = renderer.render_files(paths, args.output_dir)
+
+    print(f"Rendered {len(result.rendered)} of {len(paths)} diagrams to {args.output_dir}")
+    for name, error in sorted(result.failures.items()):
+        print(f"  failed: {name}: {error}", file=sys.stderr)
+    return 1 if result.failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+"""
+Serializers that turn a FlowGraph into output formats.
+
+Every format is written straight from the graph, without going through
+Mermaid text: Mermaid, Graphviz DOT, a JSON node/edge document and a
+compact binary adjacency format.
+"""
+
+import json
+import struct
+import sys
+from array import array
+
+from flomatic.graph import START, FlowGraph
+
+ADJACENCY_MAGIC = b"FLOA"
+ADJACENCY_VERSION = 1
+NO_NODE = 0xFFFFFFFF
+
+
+def to_mermaid(graph):
+    """Serialize a flowchart graph as Mermaid flowchart text.
+
+    Node declarations and edges are written in the order they were added to
+    the graph, so the output of a generator run is stable.
+    """
+    lines = ["flowchart TD"]
+    append = lines.append
+    names = [graph.node_name(node) for node in range(graph.node_count)]
+    # Double quotes would end a node's label, so they are written as Mermaid's #quot; entity
+    labels = [label.replace('"', "#quot;") if '"' in label else label for label in graph.labels]
+    node_labels = graph.node_labels
+    positions = graph.edge_positions
+    sources = graph.edge_sources
+    targets = graph.edge_targets
+    edge = 0
+    edge_count = len(sources)
+    for node in range(graph.node_count):
+        append(f'{names[node]}["{labels[node_labels[node]]}"]')
+        # Edges added while this was the newest node
+        while edge < edge_count and positions[edge] == node:
+            append(f"{names[sources[edge]]} --> {names[targets[edge]]}")
+            edge += 1
+    return "\n".join(lines)
+
+
+def _dot_quote(text):
+    return '"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def to_dot(graph):
+    """Serialize a flowchart graph as a Graphviz DOT digraph."""
+    lines = ["digraph flowchart {", "  node [shape=box];"]
+    append = lines.append
+    names = [graph.node_name(node) for node in range(graph.node_count)]
+    for node in range(graph.node_count):
+        shape = ", shape=oval" if node == START or node == graph.end else ""
+        append(f"  {names[node]} [label={_dot_quote(graph.label(node))}{shape}];")
+    for from_node, to_node in zip(graph.edge_sources, graph.edge_targets):
+        append(f"  {names[from_node]} -> {names[to_node]};")
+    append("}")
+    return "\n".join(lines)
+
+
+def to_json(graph):
+    """Serialize a flowchart graph as a JSON document of nodes and edges.
+
+    Nodes are objects with their integer 'id', text 'name' (as used in Mermaid
+    and DOT output) and 'label'; edges are [from, to] pairs of node ids.
+    """
+    nodes = [{"id": node, "name": graph.node_name(node), "label": graph.label(node)}
+             for node in range(graph.node_count)]
+    edges = [[from_node, to_node] for from_node, to_node in zip(graph.edge_sources, graph.edge_targets)]
+    return json.dumps({"nodes": nodes, "edges": edges, "start": START, "end": graph.end}, separators=(",", ":"))
+
+
+def to_adjacency(graph):
+    """Serialize a flowchart graph in a compact binary adjacency format.
+
+    All integers are little-endian unsigned 32-bit values:
+
+    - the magic bytes b'FLOA' and the format version (1),
+    - the node count, the id of the End node (0xFFFFFFFF if none) and the label count,
+    - each label as its UTF-8 byte length followed by its bytes,
+    - the label id of every node,
+    - the adjacency in compressed sparse row form: node count + 1 offsets into
+      the target list, followed by the edge count and the target of every edge,
+      grouped by source node.
+
+    Returns:
+        bytes: The serialized graph. read_adjacency reads it back.
+    """
+    successors = graph.successors()
+    offsets = array("I", [0])
+    targets = array("I")
+    for node_successors in successors:
+        targets.extend(node_successors)
+        offsets.append(len(targets))
+
+    parts = [ADJACENCY_MAGIC, struct.pack("<IIII", ADJACENCY_VERSION, graph.node_count,
+                                          NO_NODE if graph.end is None else graph.end, len(graph.labels))]
+    for label in graph.labels:
+        data = label.encode("utf-8")
+        parts.append(struct.pack("<I", len(data)))
+        parts.append(data)
+    parts.append(_little_endian(graph.node_labels))
+    parts.append(_little_endian(offsets))
+    parts.append(struct.pack("<I", len(targets)))
+    parts.append(_little_endian(targets))
+    return b"".join(parts)
+
+
+def read_adjacency(data):
+    """Read a graph written by to_adjacency.
+
+    Returns:
+        FlowGraph: The graph, with its edges grouped by source node.
+    """
+    if data[:4] != ADJACENCY_MAGIC:
+        raise ValueError("not a flomatic adjacency file")
+    version, node_count, end, label_count = struct.unpack_from("<IIII", data, 4)
+    if version != ADJACENCY_VERSION:
+        raise ValueError(f"unsupported adjacency format version {version}")
+    offset = 20
+    labels = []
+    for _ in range(label_count):
+        (length,) = struct.unpack_from("<I", data, offset)
+        offset += 4
+        labels.append(data[offset:offset + length].decode("utf-8"))
+        offset += length
+    node_labels, offset = _read_array(data, offset, node_count)
+    offsets, offset = _read_array(data, offset, node_count + 1)
+    (edge_count,) = struct.unpack_from("<I", data, offset)
+    targets, offset = _read_array(data, offset + 4, edge_count)
+
+    graph = FlowGraph()
+    graph.labels = labels
+    graph._label_ids = {label: label_id for label_id, label in enumerate(labels)}
+    graph.node_labels = node_labels
+    graph.end = None if end == NO_NODE else end
+    for node in range(node_count):
+        for edge in range(offsets[node], offsets[node + 1]):
+            graph.add_edge(node, targets[edge])
+    return graph
+
+
+def _little_endian(values):
+    values = array("I", values)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values.tobytes()
+
+
+def _read_array(data, offset, count):
+    values = array("I")
+    values.frombytes(data[offset:offset + 4 * count])
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values, offset + 4 * count
+
+
+# Output formats: the serializer for each format and the suffix of the files it is saved to
+FORMATS = {
+    "mermaid": (to_mermaid, ".mmd"),
+    "dot": (to_dot, ".dot"),
+    "json": (to_json, ".json"),
+    "adjacency": (to_adjacency, ".adj"),
+}
+
+# Formats serialized as bytes rather than str
+BINARY_FORMATS = frozenset(["adjacency"])
+
+
+def serialize(graph, format="mermaid"):
+    """Serialize a graph in one of the FORMATS. Binary formats give bytes, the others str."""
+    try:
+        serializer, _ = FORMATS[format]
+    except KeyError:
+        raise ValueError(f"unknown format {format!r}, expected one of {', '.join(FORMATS)}") from None
+    return serializer(graph)
+
+
+def format_suffix(format):
+    """Return the file suffix for an output format."""
+    if format not in FORMATS:
+        raise ValueError(f"unknown format {format!r}, expected one of {', '.join(FORMATS)}")
+    return FORMATS[format][1]
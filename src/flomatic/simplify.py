@@ -0,0 +1,160 @@
+"""
+Simplification pass over flowchart graphs.
+
+The generator emits a few nodes that only structure the diagram: the
+"Unreachable" nodes that follow a break or continue (and anything hanging
+off them), and pass-through placeholders such as "Then" and "Loop Body".
+simplify_graph returns a smaller graph with the same control flow:
+
+- nodes that cannot be reached from Start are removed,
+- placeholders with a single successor are bypassed, and placeholders
+  that lead nowhere are dropped,
+- linear chains (a node whose only successor has no other predecessor)
+  are merged into one node whose label joins theirs with '; ', except
+  for function and class definitions, which stay on their own.
+
+Start and End are always kept. Node ids are renumbered in their original
+order, so serializers still write the graph top to bottom.
+"""
+
+from flomatic.graph import START, FlowGraph
+
+# Labels of the structural nodes that carry no information of their own. "Else" nodes are
+# kept, because they tell the two branches of an if statement apart.
+PLACEHOLDER_LABELS = frozenset(["Then", "Loop Body", "After Loop", "After Try"])
+
+# Separator between the labels of merged nodes
+CHAIN_SEPARATOR = "; "
+
+# Definition nodes head their part of the diagram, so nothing is merged into them
+DEFINITION_PREFIXES = ("Function ", "Async Function ", "Class ")
+
+
+def simplify_graph(graph, prune=True, collapse=True, merge=True):
+    """Return a simplified copy of a completed flowchart graph.
+
+    Args:
+        graph (FlowGraph): The graph, with its End node added.
+        prune (bool, optional): Remove nodes unreachable from Start. Defaults to True.
+        collapse (bool, optional): Bypass pass-through placeholder nodes. Defaults to True.
+        merge (bool, optional): Merge linear chains of nodes. Defaults to True.
+
+    Returns:
+        FlowGraph: The simplified graph.
+    """
+    node_count = graph.node_count
+    labels = [graph.label(node) for node in range(node_count)]
+    successors = [[] for _ in range(node_count)]
+    predecessors = [[] for _ in range(node_count)]
+    for from_node, to_node in zip(graph.edge_sources, graph.edge_targets):
+        if to_node not in successors[from_node]:
+            successors[from_node].append(to_node)
+            predecessors[to_node].append(from_node)
+    alive = [True] * node_count
+    fixed = {START, graph.end}
+
+    if prune:
+        reachable = _reachable(successors)
+        for node in range(node_count):
+            if node not in reachable and node not in fixed:
+                _remove(node, successors, predecessors, alive)
+
+    if collapse:
+        for node in range(node_count):
+            if not alive[node] or node in fixed or labels[node] not in PLACEHOLDER_LABELS:
+                continue
+            targets = successors[node]
+            if len(targets) == 1 and targets[0] != node:
+                _bypass(node, targets[0], successors, predecessors, alive)
+            elif not targets:
+                _remove(node, successors, predecessors, alive)
+
+    if merge:
+        for node in range(node_count):
+            if not alive[node] or node in fixed or labels[node].startswith(DEFINITION_PREFIXES):
+                continue
+            # Absorb the following nodes for as long as the chain continues
+            while len(successors[node]) == 1:
+                follower = successors[node][0]
+                if (follower in fixed or follower == node or len(predecessors[follower]) != 1
+                        or labels[follower].startswith(DEFINITION_PREFIXES)):
+                    break
+                labels[node] += CHAIN_SEPARATOR + labels[follower]
+                _absorb(node, follower, successors, predecessors, alive)
+
+    return _rebuild(graph, labels, successors, alive)
+
+
+def _reachable(successors):
+    seen = {START}
+    stack = [START]
+    while stack:
+        for to_node in successors[stack.pop()]:
+            if to_node not in seen:
+                seen.add(to_node)
+                stack.append(to_node)
+    return seen
+
+
+def _remove(node, successors, predecessors, alive):
+    for to_node in successors[node]:
+        predecessors[to_node].remove(node)
+    for from_node in predecessors[node]:
+        successors[from_node].remove(node)
+    successors[node] = []
+    predecessors[node] = []
+    alive[node] = False
+
+
+def _bypass(node, target, successors, predecessors, alive):
+    # Point every predecessor of node straight at its only successor
+    predecessors[target].remove(node)
+    for from_node in predecessors[node]:
+        edges = successors[from_node]
+        position = edges.index(node)
+        if target in edges:
+            del edges[position]
+        else:
+            edges[position] = target
+            predecessors[target].append(from_node)
+    successors[node] = []
+    predecessors[node] = []
+    alive[node] = False
+
+
+def _absorb(node, follower, successors, predecessors, alive):
+    # node's only successor is follower, whose only predecessor is node
+    successors[node] = successors[follower]
+    for to_node in successors[node]:
+        edges = predecessors[to_node]
+        edges[edges.index(follower)] = node
+    successors[follower] = []
+    predecessors[follower] = []
+    alive[follower] = False
+
+
+def _rebuild(graph, labels, successors, alive):
+    # Surviving nodes keep their order, so their new ids can be worked out up front
+    new_ids = {}
+    for node in range(graph.node_count):
+        if alive[node]:
+            new_ids[node] = len(new_ids)
+
+    # Add each edge right after the later of its two nodes, as the generator does
+    edges_at = [[] for _ in range(len(new_ids))]
+    for node in range(graph.node_count):
+        if alive[node]:
+            for to_node in successors[node]:
+                edge = (new_ids[node], new_ids[to_node])
+                edges_at[max(edge)].append(edge)
+
+    simplified = FlowGraph()
+    for node, new_id in new_ids.items():
+        if new_id != START:
+            if node == graph.end:
+                simplified.add_end()
+            else:
+                simplified.add_node(labels[node])
+        for from_node, to_node in edges_at[new_id]:
+            simplified.add_edge(from_node, to_node)
+    return simplified
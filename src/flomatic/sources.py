@@ -0,0 +1,172 @@
+"""
+Reading sources from files, wheels and zip archives, and finding modules by name.
+
+A member of a .whl or .zip archive is named like zipimport names it: the
+archive's path followed by the member's path inside it, e.g.
+'dist/pkg-1.0-py3-none-any.whl/pkg/module.py'. Such paths can be used
+wherever a source file path is expected; the member is read straight out
+of the archive, without extracting anything to disk.
+
+Modules are found by their dotted name with the import system's finders,
+without importing them or their parent packages.
+"""
+
+import importlib.machinery
+import importlib.util
+import os
+import threading
+import zipfile
+from collections import OrderedDict
+
+ARCHIVE_SUFFIXES = (".whl", ".zip")
+
+# The archives most recently read from, kept open because the members of an archive
+# are usually read one after the other. Worker processes start with an empty cache.
+MAX_OPEN_ARCHIVES = 4
+_archives = OrderedDict()  # Archive path -> (mtime in nanoseconds, ZipFile)
+_archives_pid = None
+_archives_lock = threading.Lock()
+
+
+def is_archive(path):
+    """Return True if path is a .whl or .zip file."""
+    return path.lower().endswith(ARCHIVE_SUFFIXES) and os.path.isfile(path)
+
+
+def split_archive_path(path):
+    """Split the path of a member of an archive into the archive and the member's name in it.
+
+    Returns:
+        tuple: (archive path, member name with '/' separators), or None if path is not inside
+               a zip archive. The member name is '' for the archive itself.
+    """
+    archive = path
+    parts = []
+    while archive and not os.path.exists(archive):
+        archive, part = os.path.split(archive)
+        if not part:
+            return None
+        parts.append(part)
+    if not archive or not os.path.isfile(archive) or not (is_archive(archive) or zipfile.is_zipfile(archive)):
+        return None
+    return archive, "/".join(reversed(parts))
+
+
+def archive_members(archive, prefix=""):
+    """Return the names of the files in an archive under prefix (a directory inside it, or '')."""
+    prefix = prefix.strip("/")
+    prefix = prefix + "/" if prefix else ""
+    with zipfile.ZipFile(archive) as zf:
+        return [name for name in zf.namelist() if name.startswith(prefix) and not name.endswith("/")]
+
+
+def member_path(archive, member):
+    """Return the path naming a member of an archive."""
+    return os.path.join(archive, *member.split("/"))
+
+
+def read_source(source_file):
+    """Return the text of a source file, or of a member of an archive.
+
+    Members are decoded as the interpreter decodes source files (honouring a coding
+    declaration), and files as UTF-8.
+    """
+    if os.path.isfile(source_file):
+        with open(source_file, "r", encoding="utf-8") as f:
+            return f.read()
+    split = split_archive_path(source_file)
+    if split is None or not split[1]:
+        raise FileNotFoundError(f"No such file or archive member: '{source_file}'")
+    archive, member = split
+    try:
+        data = _open_archive(archive).read(member)
+    except KeyError:
+        raise FileNotFoundError(f"No such archive member: '{source_file}'") from None
+    return importlib.util.decode_source(data)
+
+
+def source_mtime(source_file):
+    """Return the modification time of a source file in nanoseconds; for a member, that of its archive.
+
+    Raises:
+        OSError: If the file (or archive) does not exist.
+    """
+    try:
+        return os.stat(source_file).st_mtime_ns
+    except OSError:
+        split = split_archive_path(source_file)
+        if split is None:
+            raise
+        return os.stat(split[0]).st_mtime_ns
+
+
+def _open_archive(archive):
+    global _archives_pid
+    mtime = os.stat(archive).st_mtime_ns
+    with _archives_lock:
+        if _archives_pid != os.getpid():
+            # Forked from a process that had archives open: do not share its file offsets
+            _archives.clear()
+            _archives_pid = os.getpid()
+        opened = _archives.get(archive)
+        if opened is not None and opened[0] == mtime:
+            _archives.move_to_end(archive)
+            return opened[1]
+        _archives[archive] = (mtime, zipfile.ZipFile(archive))
+        if len(_archives) > MAX_OPEN_ARCHIVES:
+            # Closed once the readers still using it are done with it
+            _archives.popitem(last=False)
+        return _archives[archive][1]
+
+
+def find_module_spec(name):
+    """Find the spec of a module or package by its dotted name, without importing anything.
+
+    The parent packages are searched through their spec's submodule_search_locations
+    rather than imported, so none of their code runs.
+
+    Returns:
+        ModuleSpec: The spec, or None if the module cannot be found.
+    """
+    parts = name.split(".")
+    if not all(part.isidentifier() for part in parts):
+        return None
+    try:
+        spec = importlib.util.find_spec(parts[0])
+    except (ImportError, ValueError):
+        return None
+    for position in range(1, len(parts)):
+        if spec is None or spec.submodule_search_locations is None:
+            return None
+        spec = importlib.machinery.PathFinder.find_spec(".".join(parts[:position + 1]),
+                                                        list(spec.submodule_search_locations))
+    return spec
+
+
+def module_locations(name):
+    """Return where the source of a module or package is, by its dotted name.
+
+    Returns:
+        list: (path, root) pairs. Path is the module's .py file, or a directory of the package
+              (possibly inside an archive); root is the directory or archive the top-level
+              package is in, so that paths relative to it follow the package structure.
+              Empty if the module cannot be found or has no Python source.
+    """
+    spec = find_module_spec(name)
+    if spec is None:
+        return []
+    depth = name.count(".") + 1
+    if spec.submodule_search_locations is not None:
+        # A package, possibly a namespace package spread over several directories
+        return [(location, _strip_components(location, depth)) for location in spec.submodule_search_locations]
+    origin = spec.origin
+    if not origin or not origin.endswith(".py"):
+        # Built-in, frozen and extension modules, and modules shipped as .pyc only
+        return []
+    return [(origin, _strip_components(os.path.dirname(origin), depth - 1))]
+
+
+def _strip_components(path, count):
+    for _ in range(count):
+        path = os.path.dirname(path)
+    return path
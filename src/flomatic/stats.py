@@ -0,0 +1,222 @@
+"""
+Opt-in instrumentation for FlowchartGenerator.
+
+instrument(generator, stats) replaces a few of the generator's methods on
+that one instance with timed wrappers that record into a GeneratorStats:
+
+- phase timers for parsing and indexing ('parse'), visiting the AST
+  ('visit'), building labels ('label'), serializing
+  graphs ('serialize'), and reading and writing files ('read', 'write'),
+- the number of visits, total time and self time (excluding nested
+  visits) for every AST node type,
+- the number of graphs, nodes and edges emitted.
+
+Phase times are inclusive, so 'visit' includes the 'label' time spent
+inside it. A generator that was never instrumented runs its ordinary
+methods, so when stats are disabled there is no overhead at all.
+"""
+
+import json
+import time
+from contextlib import contextmanager
+
+# The generator methods wrapped with a phase timer, and the phase they are timed under
+PHASE_METHODS = {
+    "_index_source": "parse",
+    "_parse_source": "parse",
+    "_label_text": "label",
+    "_serialize": "serialize",
+    "_read_source": "read",
+    "_write_diagram": "write",
+}
+
+
+class GeneratorStats:
+    """Timings and counts collected from instrumented generators.
+
+    Attributes:
+        phases (dict): Phase name -> [calls, seconds].
+        node_types (dict): AST node type name -> [visits, seconds, self seconds].
+        graphs (int): Number of flowchart graphs completed.
+        nodes (int): Number of flowchart nodes emitted, including Start and End.
+        edges (int): Number of flowchart edges emitted.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.node_types = {}
+        self.graphs = 0
+        self.nodes = 0
+        self.edges = 0
+
+    def add_phase(self, name, seconds, calls=1):
+        """Add time spent in a phase."""
+        entry = self.phases.get(name)
+        if entry is None:
+            self.phases[name] = [calls, seconds]
+        else:
+            entry[0] += calls
+            entry[1] += seconds
+
+    def add_visit(self, node_type, seconds, self_seconds):
+        """Add one visit of an AST node type, with its total time and its time excluding nested visits."""
+        entry = self.node_types.get(node_type)
+        if entry is None:
+            self.node_types[node_type] = [1, seconds, self_seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] += self_seconds
+
+    def add_graph(self, graph):
+        """Count a completed graph with its nodes and edges."""
+        self.graphs += 1
+        self.nodes += graph.node_count
+        self.edges += graph.edge_count
+
+    @contextmanager
+    def timer(self, name):
+        """Time the body of a with statement as one call of a phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - start)
+
+    def merge(self, other):
+        """Add the counts and timings of another GeneratorStats (or its to_dict form) to this one."""
+        if isinstance(other, GeneratorStats):
+            other = other.to_dict()
+        for name, phase in other["phases"].items():
+            self.add_phase(name, phase["seconds"], phase["calls"])
+        for node_type, visits in other["node_types"].items():
+            entry = self.node_types.setdefault(node_type, [0, 0.0, 0.0])
+            entry[0] += visits["visits"]
+            entry[1] += visits["seconds"]
+            entry[2] += visits["self_seconds"]
+        self.graphs += other["graphs"]
+        self.nodes += other["nodes"]
+        self.edges += other["edges"]
+
+    def reset(self):
+        """Clear all counts and timings."""
+        self.__init__()
+
+    def to_dict(self):
+        """Return the stats as a JSON-serializable dictionary."""
+        return {
+            "phases": {name: {"calls": calls, "seconds": seconds}
+                       for name, (calls, seconds) in sorted(self.phases.items())},
+            "node_types": {name: {"visits": visits, "seconds": seconds, "self_seconds": self_seconds}
+                           for name, (visits, seconds, self_seconds) in sorted(self.node_types.items())},
+            "graphs": self.graphs,
+            "nodes": self.nodes,
+            "edges": self.edges,
+        }
+
+    def to_json(self):
+        """Return the stats as a JSON report."""
+        return json.dumps(self.to_dict(), indent=1)
+
+    def write_json(self, path):
+        """Write the JSON report to a file."""
+        with open(path, "w") as f:
+            f.write(self.to_json())
+
+    def summary(self, top=10):
+        """Return a short human-readable report: phase times and the slowest node types by self time."""
+        lines = [f"{self.graphs} graphs, {self.nodes} nodes, {self.edges} edges"]
+        for name, (calls, seconds) in sorted(self.phases.items(), key=lambda item: -item[1][1]):
+            lines.append(f"  {name:<10} {seconds * 1000:10.1f} ms  {calls:8d} calls")
+        ranked = sorted(self.node_types.items(), key=lambda item: -item[1][2])[:top]
+        for name, (visits, seconds, self_seconds) in ranked:
+            lines.append(f"  {name:<20} {self_seconds * 1000:10.1f} ms self {seconds * 1000:10.1f} ms total"
+                         f"  {visits:8d} visits")
+        return "\n".join(lines)
+
+
+def _timed_phase(function, stats, phase, depth):
+    clock = time.perf_counter
+
+    def timed(*args, **kwargs):
+        # Only the outermost call of a phase is timed, so recursive calls are not counted twice
+        if depth[phase]:
+            return function(*args, **kwargs)
+        depth[phase] += 1
+        start = clock()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            depth[phase] -= 1
+            stats.add_phase(phase, clock() - start)
+    return timed
+
+
+def _timed_visit(function, stats, depth):
+    clock = time.perf_counter
+    # Time spent in nested visits, one entry per visit in progress
+    nested = []
+
+    def visit(node, *args):
+        depth["visit"] += 1
+        nested.append(0.0)
+        start = clock()
+        try:
+            return function(node, *args)
+        finally:
+            elapsed = clock() - start
+            child_time = nested.pop()
+            if nested:
+                nested[-1] += elapsed
+            depth["visit"] -= 1
+            if not depth["visit"]:
+                stats.add_phase("visit", elapsed)
+            stats.add_visit(type(node).__name__, elapsed, elapsed - child_time)
+    return visit
+
+
+def instrument(generator, stats=None):
+    """Record the work of one generator instance into a GeneratorStats.
+
+    Args:
+        generator (FlowchartGenerator): The generator to instrument.
+        stats (GeneratorStats, optional): Where to record. Defaults to a new GeneratorStats.
+
+    Returns:
+        GeneratorStats: The stats being recorded into.
+    """
+    if stats is None:
+        stats = GeneratorStats()
+    uninstrument(generator)
+    originals = {}
+    depth = {phase: 0 for phase in set(PHASE_METHODS.values()) | {"visit"}}
+    for name, phase in PHASE_METHODS.items():
+        originals[name] = generator.__dict__.get(name)
+        setattr(generator, name, _timed_phase(getattr(generator, name), stats, phase, depth))
+
+    originals["visit"] = None
+    generator.visit = _timed_visit(generator.visit, stats, depth)
+
+    finish_graph = generator._finish_graph
+
+    def finish_and_count(*args):
+        graph = finish_graph(*args)
+        stats.add_graph(graph)
+        return graph
+    originals["_finish_graph"] = None
+    generator._finish_graph = finish_and_count
+
+    generator._instrumentation = (stats, originals)
+    return stats
+
+
+def uninstrument(generator):
+    """Restore a generator's ordinary methods, stopping any recording."""
+    instrumentation = generator.__dict__.pop("_instrumentation", None)
+    if instrumentation is None:
+        return
+    for name, original in instrumentation[1].items():
+        if original is None:
+            del generator.__dict__[name]
+        else:
+            setattr(generator, name, original)
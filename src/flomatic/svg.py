@@ -0,0 +1,358 @@
+"""
+Pure-Python SVG rendering of flowcharts.
+
+Lays out a flowchart with a layered (Sugiyama-style) algorithm and draws it
+as SVG, without Node.js, a browser or network access:
+
+1. Cycle removal: edges that close a loop are reversed for the layout.
+2. Ranking: every node is put on the layer after its deepest predecessor.
+3. Edges spanning several layers are split by dummy nodes, one per layer.
+4. Crossing reduction: nodes in each layer are ordered by the barycenter of
+   their neighbours, sweeping down and up, keeping the best ordering found.
+5. Coordinate assignment: nodes are pulled towards their neighbours and then
+   packed so that nodes in a layer never overlap.
+
+Every step is linear or near-linear in the size of the graph (including
+the dummy nodes), so a diagram with a thousand nodes lays out in about a
+second at most.
+"""
+
+import re
+from collections import namedtuple
+from html import escape
+
+NODE_PATTERN = re.compile(r'^(\w+)\["(.*)"\]$')
+EDGE_PATTERN = re.compile(r'^(\w+) --> (\w+)$')
+
+# Font metrics and spacing, in pixels
+FONT_SIZE = 14
+CHAR_WIDTH = 7.8
+NODE_HEIGHT = 36
+NODE_PADDING = 24
+MIN_NODE_WIDTH = 60
+LAYER_GAP = 48
+NODE_GAP = 24
+MARGIN = 16
+DUMMY_WIDTH = 8
+
+CROSSING_SWEEPS = 8
+COORDINATE_ITERATIONS = 8
+
+# Node positions (centers) and sizes, and the points of every edge's polyline
+Layout = namedtuple("Layout", ["positions", "sizes", "edge_points", "width", "height"])
+
+
+def parse_flowchart(mermaid_text):
+    """Read the nodes and edges back from Mermaid text generated by FlowchartGenerator.
+
+    Returns:
+        tuple: A dict mapping node ids to labels, in declaration order, and a list of (from, to) edges.
+    """
+    nodes = {}
+    edges = []
+    for line in mermaid_text.splitlines():
+        match = NODE_PATTERN.match(line)
+        if match:
+            nodes[match.group(1)] = match.group(2).replace("#quot;", '"')
+            continue
+        match = EDGE_PATTERN.match(line)
+        if match:
+            edges.append((match.group(1), match.group(2)))
+    for from_node, to_node in edges:
+        nodes.setdefault(from_node, from_node)
+        nodes.setdefault(to_node, to_node)
+    return nodes, edges
+
+
+def node_width(label):
+    """Return the width of the box drawn for a label."""
+    return max(MIN_NODE_WIDTH, len(label) * CHAR_WIDTH + NODE_PADDING)
+
+
+def layout_graph(nodes, edges):
+    """Compute a layered layout for a graph.
+
+    Args:
+        nodes (dict): Node ids mapped to labels, in a stable order.
+        edges (list): (from, to) node id pairs.
+
+    Returns:
+        Layout: The center and size of every node, the polyline of every edge
+                (in the order of edges) and the size of the drawing.
+    """
+    ids = list(nodes)
+    index = {node: i for i, node in enumerate(ids)}
+    count = len(ids)
+    edge_list = [(index[a], index[b]) for a, b in edges if a != b]
+
+    # 1. Cycle removal: reverse the edges that point back to a node on the DFS stack
+    successors = [[] for _ in range(count)]
+    for number, (a, b) in enumerate(edge_list):
+        successors[a].append((b, number))
+    reversed_edges = set()
+    state = [0] * count  # 0 = unvisited, 1 = on the stack, 2 = done
+    for root in range(count):
+        if state[root]:
+            continue
+        state[root] = 1
+        stack = [(root, iter(successors[root]))]
+        while stack:
+            node, children = stack[-1]
+            for child, number in children:
+                if state[child] == 1:
+                    reversed_edges.add(number)
+                elif state[child] == 0:
+                    state[child] = 1
+                    stack.append((child, iter(successors[child])))
+                    break
+            else:
+                state[node] = 2
+                stack.pop()
+    dag_edges = [(b, a) if number in reversed_edges else (a, b) for number, (a, b) in enumerate(edge_list)]
+
+    # 2. Ranking: longest path from the sources, in topological order
+    out_edges = [[] for _ in range(count)]
+    in_degree = [0] * count
+    for a, b in dag_edges:
+        out_edges[a].append(b)
+        in_degree[b] += 1
+    rank = [0] * count
+    ready = [node for node in range(count) if in_degree[node] == 0]
+    while ready:
+        node = ready.pop()
+        for child in out_edges[node]:
+            rank[child] = max(rank[child], rank[node] + 1)
+            in_degree[child] -= 1
+            if in_degree[child] == 0:
+                ready.append(child)
+
+    # 3. Split long edges with dummy nodes, one per intermediate layer
+    widths = [node_width(nodes[node]) for node in ids]
+    ranks = list(rank)
+    chains = []
+    layer_edges = []
+    for a, b in dag_edges:
+        chain = [a]
+        for layer in range(rank[a] + 1, rank[b]):
+            dummy = len(ranks)
+            ranks.append(layer)
+            widths.append(DUMMY_WIDTH)
+            chain.append(dummy)
+        chain.append(b)
+        chains.append(chain)
+        layer_edges.extend(zip(chain, chain[1:]))
+    total = len(ranks)
+
+    layer_count = max(ranks) + 1 if ranks else 0
+    layers = [[] for _ in range(layer_count)]
+    for node in range(total):
+        layers[ranks[node]].append(node)
+    up = [[] for _ in range(total)]
+    down = [[] for _ in range(total)]
+    for a, b in layer_edges:
+        down[a].append(b)
+        up[b].append(a)
+
+    # 4. Crossing reduction with barycenter sweeps
+    layers = _reduce_crossings(layers, up, down)
+
+    # 5. Coordinate assignment
+    x = _assign_coordinates(layers, up, down, widths)
+
+    left = min((x[node] - widths[node] / 2 for node in range(total)), default=0)
+    right = max((x[node] + widths[node] / 2 for node in range(total)), default=0)
+    shift = MARGIN - left
+    y = [MARGIN + NODE_HEIGHT / 2 + ranks[node] * (NODE_HEIGHT + LAYER_GAP) for node in range(total)]
+    positions = {ids[node]: (x[node] + shift, y[node]) for node in range(count)}
+    sizes = {ids[node]: (widths[node], NODE_HEIGHT) for node in range(count)}
+
+    edge_points = []
+    chain_iter = enumerate(chains)
+    for a, b in edges:
+        if a == b:
+            cx, cy = positions[a]
+            w = widths[index[a]] / 2
+            edge_points.append([(cx + w, cy - 8), (cx + w + 20, cy - 8), (cx + w + 20, cy + 8), (cx + w, cy + 8)])
+            continue
+        number, chain = next(chain_iter)
+        points = [(x[node] + shift, y[node]) for node in chain]
+        if number in reversed_edges:
+            # Draw edges that were reversed for the layout in their original direction
+            points.reverse()
+        # Start at the bottom of the first node and end at the top of the last one when going down
+        (x0, y0), (x1, y1) = points[0], points[-1]
+        half = NODE_HEIGHT / 2
+        points[0] = (x0, y0 + half if y1 > y0 else y0 - half)
+        points[-1] = (x1, y1 - half if y1 > y0 else y1 + half)
+        edge_points.append(points)
+
+    width = right - left + 2 * MARGIN
+    height = 2 * MARGIN + layer_count * NODE_HEIGHT + max(0, layer_count - 1) * LAYER_GAP
+    return Layout(positions, sizes, edge_points, width, height)
+
+
+def _barycenter_order(layer, neighbours, position):
+    keyed = []
+    for i, node in enumerate(layer):
+        adjacent = neighbours[node]
+        if len(adjacent) == 1:
+            # Most nodes (and all dummy nodes) have a single neighbour
+            key = position[adjacent[0]]
+        elif adjacent:
+            key = sum([position[other] for other in adjacent]) / len(adjacent)
+        else:
+            key = i
+        keyed.append((key, i, node))
+    keyed.sort()
+    return [node for _, _, node in keyed]
+
+
+def _count_crossings(upper, lower_size, down, position):
+    """Count the edge crossings between two adjacent layers, using a Fenwick tree."""
+    crossings = 0
+    tree = [0] * (lower_size + 1)
+    seen = 0
+    for node in upper:
+        children = down[node]
+        targets = [position[children[0]]] if len(children) == 1 else sorted([position[child] for child in children])
+        for target in targets:
+            # Crossings with earlier edges that end to the right of this one
+            i = target + 1
+            not_greater = 0
+            while i > 0:
+                not_greater += tree[i]
+                i -= i & -i
+            crossings += seen - not_greater
+            i = target + 1
+            while i <= lower_size:
+                tree[i] += 1
+                i += i & -i
+            seen += 1
+    return crossings
+
+
+def _total_crossings(layers, down, position):
+    return sum(_count_crossings(upper, len(lower), down, position) for upper, lower in zip(layers, layers[1:]))
+
+
+def _reduce_crossings(layers, up, down):
+    position = [0] * sum(len(layer) for layer in layers)
+    for layer in layers:
+        for i, node in enumerate(layer):
+            position[node] = i
+    best = [list(layer) for layer in layers]
+    best_crossings = _total_crossings(layers, down, position)
+    stale_sweeps = 0
+    for sweep in range(CROSSING_SWEEPS):
+        # Stop when there is nothing left to improve or two sweeps in a row did not help
+        if best_crossings == 0 or stale_sweeps == 2:
+            break
+        if sweep % 2 == 0:
+            order, neighbours = range(1, len(layers)), up
+        else:
+            order, neighbours = range(len(layers) - 2, -1, -1), down
+        for number in order:
+            layers[number] = _barycenter_order(layers[number], neighbours, position)
+            for i, node in enumerate(layers[number]):
+                position[node] = i
+        crossings = _total_crossings(layers, down, position)
+        if crossings < best_crossings:
+            best = [list(layer) for layer in layers]
+            best_crossings = crossings
+            stale_sweeps = 0
+        else:
+            stale_sweeps += 1
+    return best
+
+
+def _pack(layer, desired, widths):
+    """Place the nodes of a layer as close to their desired x as possible without overlaps."""
+    placed = []
+    previous_x = None
+    previous_half = 0.0
+    for node, x in zip(layer, desired):
+        half = widths[node] / 2
+        if previous_x is not None:
+            x = max(x, previous_x + previous_half + half + NODE_GAP)
+        placed.append(x)
+        previous_x = x
+        previous_half = half
+    # Shift the layer so it is centred on the desired positions on average
+    if placed:
+        offset = (sum(desired) - sum(placed)) / len(placed)
+        placed = [x + offset for x in placed]
+    return placed
+
+
+def _assign_coordinates(layers, up, down, widths):
+    x = [0.0] * len(widths)
+    for layer in layers:
+        cursor = 0.0
+        for node in layer:
+            x[node] = cursor + widths[node] / 2
+            cursor += widths[node] + NODE_GAP
+    for iteration in range(COORDINATE_ITERATIONS):
+        neighbours = up if iteration % 2 == 0 else down
+        order = layers if iteration % 2 == 0 else layers[::-1]
+        for layer in order:
+            desired = []
+            for node in layer:
+                adjacent = neighbours[node]
+                if len(adjacent) == 1:
+                    desired.append(x[adjacent[0]])
+                elif adjacent:
+                    desired.append(sum([x[other] for other in adjacent]) / len(adjacent))
+                else:
+                    desired.append(x[node])
+            for node, placed in zip(layer, _pack(layer, desired, widths)):
+                x[node] = placed
+    return x
+
+
+def render_svg(nodes, edges):
+    """Draw a graph as an SVG document.
+
+    Args:
+        nodes (dict): Node ids mapped to labels, in a stable order.
+        edges (list): (from, to) node id pairs.
+
+    Returns:
+        str: The SVG document.
+    """
+    layout = layout_graph(nodes, edges)
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{layout.width:.0f}" height="{layout.height:.0f}" '
+        f'viewBox="0 0 {layout.width:.0f} {layout.height:.0f}" font-family="sans-serif" font-size="{FONT_SIZE}">',
+        '<defs><marker id="arrow" viewBox="0 0 10 10" refX="10" refY="5" markerWidth="8" markerHeight="8" '
+        'orient="auto-start-reverse"><path d="M 0 0 L 10 5 L 0 10 z" fill="#333"/></marker></defs>',
+    ]
+    for points in layout.edge_points:
+        path = " ".join(f"{px:.1f},{py:.1f}" for px, py in points)
+        parts.append(f'<polyline points="{path}" fill="none" stroke="#333" marker-end="url(#arrow)"/>')
+    for node, label in nodes.items():
+        cx, cy = layout.positions[node]
+        width, height = layout.sizes[node]
+        radius = height / 2 if node in ("Start", "End") else 4
+        parts.append(
+            f'<rect x="{cx - width / 2:.1f}" y="{cy - height / 2:.1f}" width="{width:.1f}" height="{height:.1f}" '
+            f'rx="{radius:.1f}" fill="#ECECFF" stroke="#9370DB"/>'
+        )
+        parts.append(
+            f'<text x="{cx:.1f}" y="{cy:.1f}" text-anchor="middle" dominant-baseline="central">{escape(label)}</text>'
+        )
+    parts.append("</svg>")
+    return "\n".join(parts)
+
+
+def graph_to_svg(graph):
+    """Render a FlowGraph built by FlowchartGenerator as an SVG document."""
+    names = [graph.node_name(node) for node in range(graph.node_count)]
+    nodes = {names[node]: graph.label(node) for node in range(graph.node_count)}
+    edges = [(names[a], names[b]) for a, b in graph.edges()]
+    return render_svg(nodes, edges)
+
+
+def flowchart_to_svg(mermaid_text):
+    """Render a flowchart generated by FlowchartGenerator as an SVG document."""
+    nodes, edges = parse_flowchart(mermaid_text)
+    return render_svg(nodes, edges)
@@ -0,0 +1,294 @@
+"""
+Watch mode: regenerate diagrams as source files change.
+
+A DiagramWatcher keeps the diagrams of a set of source files up to date
+while they are being edited. Each scan compares the modification times of
+the sources with those seen before; changed files are re-parsed with
+FlowchartGenerator.update_mermaid_diagrams, which rewrites only the
+diagrams of the functions that changed, and the diagrams of deleted files
+are removed. Changes are debounced, so an editor that writes a file in
+several steps triggers a single update.
+
+Between scans the watcher sleeps, or on Linux waits for inotify events on
+the source directories, so that a save shows up in its diagram straight
+away without polling the whole tree many times a second.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+from flomatic.code_to_mermaid import FlowchartGenerator
+from flomatic.manifest import Manifest
+from flomatic.project import ProjectResult, discover_sources, output_dir_for
+from flomatic.sources import source_mtime
+
+# inotify events that mean a file in a watched directory was written, created, removed or renamed
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+INOTIFY_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+# Flags the kernel adds to events: the watch was removed (e.g. its directory was deleted), the name is a directory
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+
+# struct inotify_event: watch descriptor, mask, cookie and name length, followed by the name
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class InotifyWaker:
+    """Waits for changes in a set of directories with Linux inotify.
+
+    Only used to decide when to scan: the watcher still compares modification
+    times to find what changed, so events for unrelated files cost one scan.
+    A directory created in (or moved into) a watched directory is watched as
+    soon as its event is read, so files saved in it wake the waiter too.
+    """
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        # IN_NONBLOCK and IN_CLOEXEC have the values of O_NONBLOCK and O_CLOEXEC
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self._watched = {}  # Directory -> watch descriptor
+        self._directories = {}  # Watch descriptor -> directory
+
+    def watch(self, directory):
+        """Start watching a directory (once; watching it again does nothing)."""
+        if directory in self._watched:
+            return
+        descriptor = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), INOTIFY_MASK)
+        if descriptor >= 0:
+            self._watched[directory] = descriptor
+            self._directories[descriptor] = directory
+
+    def watch_tree(self, directory):
+        """Watch a directory and the directories under it, except hidden and __pycache__ directories."""
+        for dirpath, dirnames, _ in os.walk(directory):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".") and d != "__pycache__"]
+            self.watch(dirpath)
+
+    def wait(self, timeout):
+        """Wait up to timeout seconds for a change, returning True if there was one."""
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return False
+        # Drain the queued events; only new and removed directories matter
+        try:
+            while True:
+                data = os.read(self._fd, 65536)
+                if not data:
+                    break
+                self._handle_events(data)
+        except BlockingIOError:
+            pass
+        return True
+
+    def _handle_events(self, data):
+        offset = 0
+        while offset < len(data):
+            descriptor, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            name = data[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + length].rstrip(b"\0")
+            offset += INOTIFY_EVENT.size + length
+            directory = self._directories.get(descriptor)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:
+                # The directory is gone, so it is watched afresh if it is created again
+                del self._directories[descriptor]
+                if self._watched.get(directory) == descriptor:
+                    del self._watched[directory]
+            elif mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                name = os.fsdecode(name)
+                if not name.startswith(".") and name != "__pycache__":
+                    self.watch_tree(os.path.join(directory, name))
+
+    def close(self):
+        os.close(self._fd)
+
+
+def inotify_waker():
+    """Return an InotifyWaker, or None where inotify is not available."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        return InotifyWaker()
+    except (OSError, AttributeError):
+        return None
+
+
+def sources_under(root, include=("*.py",), exclude=()):
+    """Return a function listing the (source file, root) pairs under root, for DiagramWatcher."""
+    return lambda: [(source_file, root) for source_file in discover_sources(root, include, exclude)]
+
+
+def remove_source_diagrams(source_file, file_dir):
+    """Delete the diagrams recorded for a source file in its output directory's manifest.
+
+    Returns:
+        list: The paths of the removed diagram files.
+    """
+    manifest = Manifest.for_output_dir(file_dir)
+    record = manifest.remove(source_file)
+    if record is None:
+        return []
+    removed = []
+    for function in record["functions"].values():
+        if manifest.claims(function["file"]):
+            continue
+        file_path = os.path.join(file_dir, function["file"])
+        if os.path.exists(file_path):
+            os.remove(file_path)
+            removed.append(file_path)
+    manifest.save()
+    return removed
+
+
+class DiagramWatcher:
+    """Keeps the per-function diagrams of changing source files up to date.
+
+    Each source file's diagrams are saved under output_dir_for(source file, root, output_dir),
+    with a manifest, as in a changed-only project run.
+    """
+
+    def __init__(self, find_sources, output_dir, generator=None, compact=True, format="mermaid", cache=None,
+                 interval=0.25, debounce=0.1, rescan_interval=5.0, use_inotify=True):
+        """Create a watcher.
+
+        Args:
+            find_sources (callable): Returns the (source file, root) pairs to watch. Called on every
+                                   scan, so files added under a root are picked up; see sources_under.
+            output_dir (str): Directory the diagrams are saved under.
+            generator (FlowchartGenerator, optional): The generator to use, e.g. one created with
+                                                    max_label_length. Defaults to a new FlowchartGenerator.
+            compact (bool, optional): If True, only include control flow elements in the diagrams.
+                                    Defaults to True.
+            format (str, optional): The output format (see FlowchartGenerator.generate_flowchart).
+                                  Defaults to 'mermaid'.
+            cache (DiagramCache, optional): A diagram cache to reuse diagrams from.
+            interval (float, optional): Seconds between scans when polling. Defaults to 0.25.
+            debounce (float, optional): Seconds a changed file must stay unchanged before its diagrams
+                                      are updated. Defaults to 0.1.
+            rescan_interval (float, optional): With inotify, the longest time between scans when no
+                                             event arrives. Defaults to 5.0.
+            use_inotify (bool, optional): Wait for inotify events where available instead of polling.
+                                        Defaults to True.
+        """
+        self.find_sources = find_sources
+        self.output_dir = output_dir
+        self.generator = generator if generator is not None else FlowchartGenerator()
+        self.compact = compact
+        self.format = format
+        self.cache = cache
+        self.interval = interval
+        self.debounce = debounce
+        self.rescan_interval = rescan_interval
+        self.use_inotify = use_inotify
+        self._seen = {}  # Source file -> (root, mtime in nanoseconds) at the last update
+
+    def scan(self):
+        """Return a dictionary of the current source files and their (root, mtime in nanoseconds)."""
+        current = {}
+        for source_file, root in self.find_sources():
+            try:
+                current[source_file] = (root, source_mtime(source_file))
+            except OSError:
+                # Deleted since it was listed
+                continue
+        return current
+
+    def sync(self):
+        """Update the diagrams of the files changed, added or deleted since the last sync.
+
+        The first sync brings every file's diagrams up to date (files whose manifest shows
+        them current are skipped without being parsed).
+
+        Returns:
+            ProjectResult: The diagram files written and removed per changed source file, the
+                           failures, and no unchanged files (they are not listed).
+        """
+        current = self.scan()
+        changed = [source_file for source_file, seen in current.items() if self._seen.get(source_file) != seen]
+        deleted = [source_file for source_file in self._seen if source_file not in current]
+        if changed:
+            current.update(self._settle(changed, current))
+
+        saved_files = {}
+        failures = {}
+        removed = {}
+        for source_file in changed:
+            root, _ = current[source_file]
+            file_dir = output_dir_for(source_file, root, self.output_dir)
+            try:
+                saved_files[source_file], removed[source_file] = self.generator.update_mermaid_diagrams(
+                    source_file, file_dir, self.compact, self.cache, format=self.format)
+            except Exception as e:
+                # Anything, from a half-typed edit to a bug in a visitor, fails this file only
+                failures[source_file] = f"{type(e).__name__}: {e}"
+        for source_file in deleted:
+            root, _ = self._seen[source_file]
+            removed[source_file] = remove_source_diagrams(source_file,
+                                                          output_dir_for(source_file, root, self.output_dir))
+        self._seen = current
+        return ProjectResult(saved_files, failures, removed, [])
+
+    def _settle(self, changed, current):
+        """Wait until the changed files stop changing, and return their latest (root, mtime)."""
+        latest = {source_file: current[source_file] for source_file in changed}
+        # Give up waiting after a few rounds, so a file that is written continuously is still updated
+        for _ in range(5):
+            time.sleep(self.debounce)
+            settled = True
+            for source_file, (root, mtime) in latest.items():
+                try:
+                    seen = (root, source_mtime(source_file))
+                except OSError:
+                    continue
+                if seen != (root, mtime):
+                    settled = False
+                    latest[source_file] = seen
+            if settled:
+                break
+        return latest
+
+    def run(self, report=None, stop=None):
+        """Sync, then keep syncing whenever a source changes, until stop is set or on KeyboardInterrupt.
+
+        Args:
+            report (callable, optional): Called with the ProjectResult of every sync that wrote,
+                                       removed or failed anything.
+            stop (threading.Event, optional): Set it to stop watching, e.g. from another thread.
+        """
+        waker = inotify_waker() if self.use_inotify else None
+        try:
+            while stop is None or not stop.is_set():
+                result = self.sync()
+                if report is not None and (any(result.saved_files.values()) or any(result.removed.values())
+                                           or result.failures):
+                    report(result)
+                if waker is None:
+                    if stop is not None:
+                        stop.wait(self.interval)
+                    else:
+                        time.sleep(self.interval)
+                    continue
+                # Watch the directories of the sources, and the roots for new files and directories
+                for source_file, (root, _) in self._seen.items():
+                    waker.watch(os.path.dirname(os.path.abspath(source_file)))
+                    waker.watch(os.path.abspath(root if os.path.isdir(root) else os.path.dirname(root) or "."))
+                # Wake up regularly while stopping is possible, to notice the stop event
+                timeout = self.rescan_interval if stop is None else min(self.rescan_interval, self.interval)
+                waker.wait(timeout)
+        finally:
+            if waker is not None:
+                waker.close()
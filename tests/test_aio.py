@@ -0,0 +1,167 @@
+"""
+Unit tests for the asyncio API.
+"""
+
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from flomatic import aio
+from flomatic.aio import INDEX_CACHE_SIZE, AsyncFlowchartService
+from flomatic.code_to_mermaid import FlowchartGenerator
+
+SOURCE = """
+def first(x):
+    if x:
+        return 1
+    return 2
+
+def second(items):
+    for item in items:
+        print(item)
+"""
+
+
+async def serve_diagrams(service, source_code):
+    """A stand-in for the documentation server: answers a function name per line with its diagram."""
+    async def handle(reader, writer):
+        name = (await reader.readline()).decode().strip()
+        flowchart = await service.generate(source_code, target_function=name)
+        writer.write(flowchart.encode() + b"\n\n")
+        await writer.drain()
+        writer.close()
+    return await asyncio.start_server(handle, "127.0.0.1", 0)
+
+
+async def request(port, name):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(name.encode() + b"\n")
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return response.decode().rstrip("\n")
+
+
+class TestAsyncFlowchartService:
+    """Test cases for AsyncFlowchartService."""
+
+    def test_generate_matches_the_generator(self):
+        """Test that the service returns the same flowcharts as FlowchartGenerator."""
+        async def run():
+            async with AsyncFlowchartService() as service:
+                return (await service.generate(SOURCE, target_function="first"),
+                        await service.generate(SOURCE, format="dot"),
+                        await service.generate_all(SOURCE))
+
+        flowchart, dot, functions = asyncio.run(run())
+        generator = FlowchartGenerator()
+        assert flowchart == generator.generate_mermaid_flowchart(SOURCE, target_function="first")
+        assert dot == generator.generate_flowchart(SOURCE, format="dot")
+        assert functions == generator.generate_function_flowcharts(SOURCE)
+
+    def test_concurrent_requests_are_coalesced(self):
+        """Test that concurrent requests for the same diagram share one computation."""
+        async def run():
+            service = AsyncFlowchartService()
+            results = await asyncio.gather(*[service.generate(SOURCE, target_function="first") for _ in range(5)])
+            return service, results
+
+        service, results = asyncio.run(run())
+        assert len(set(results)) == 1
+        assert service.stats() == {"hits": 0, "misses": 1, "coalesced": 4, "entries": 1, "pending": 0}
+
+    def test_recent_results_are_kept_in_an_lru(self):
+        """Test that repeated requests are served from memory, least recently used evicted first."""
+        async def run():
+            service = AsyncFlowchartService(cache_size=2)
+            for name in ["first", "second", "first", "module", "second"]:
+                await service.generate(SOURCE, target_function=None if name == "module" else name)
+            return service
+
+        service = asyncio.run(run())
+        # 'second' was evicted by the module diagram, as 'first' had been used more recently
+        assert service.stats() == {"hits": 1, "misses": 4, "coalesced": 0, "entries": 2, "pending": 0}
+
+    def test_errors_reach_every_caller_and_are_not_cached(self):
+        """Test that a failed computation raises in every waiting caller and is retried next time."""
+        async def run():
+            service = AsyncFlowchartService()
+            results = await asyncio.gather(service.generate("def broken(:"), service.generate("def broken(:"),
+                                           return_exceptions=True)
+            with pytest.raises(SyntaxError):
+                await service.generate("def broken(:")
+            return service, results
+
+        service, results = asyncio.run(run())
+        assert all(isinstance(result, SyntaxError) for result in results)
+        assert service.stats()["misses"] == 2
+
+    def test_source_indexes_are_reused_and_bounded(self, monkeypatch):
+        """Test that requests for other functions of a source reuse its index, and few indexes are kept."""
+        indexed = []
+        index_source = FlowchartGenerator._index_source
+        monkeypatch.setattr(FlowchartGenerator, "_index_source",
+                            lambda self, source_code: indexed.append(source_code) or index_source(self, source_code))
+        monkeypatch.setattr(aio, "_indexes", OrderedDict())
+        sources = [SOURCE + f"\nvalue = {i}\n" for i in range(INDEX_CACHE_SIZE + 2)]
+
+        async def run():
+            async with AsyncFlowchartService() as service:
+                for source_code in sources:
+                    await service.generate(source_code, target_function="first")
+                    await service.generate(source_code, target_function="second")
+
+        asyncio.run(run())
+        assert indexed == sources
+        assert len(aio._indexes) == INDEX_CACHE_SIZE
+
+    def test_event_loop_keeps_running(self):
+        """Test that other coroutines run while a large file is being diagrammed."""
+        source = "\n".join(f"def f{n}(x):\n    if x:\n        return {n}\n    return -x\n" for n in range(2000))
+
+        async def run():
+            service = AsyncFlowchartService()
+            ticks = 0
+            task = asyncio.ensure_future(service.generate_all(source))
+            while not task.done():
+                ticks += 1
+                await asyncio.sleep(0)
+            return ticks, await task
+
+        ticks, functions = asyncio.run(run())
+        assert len(functions) == 2000
+        assert ticks > 1
+
+    def test_stand_in_app(self, tmp_path):
+        """Test serving diagrams from an asyncio server, and from files."""
+        source_file = tmp_path / "module.py"
+        source_file.write_text(SOURCE)
+
+        async def run():
+            async with AsyncFlowchartService() as service:
+                server = await serve_diagrams(service, SOURCE)
+                port = server.sockets[0].getsockname()[1]
+                async with server:
+                    responses = await asyncio.gather(request(port, "first"), request(port, "second"),
+                                                     request(port, "first"))
+                from_file = await service.generate_file(str(source_file), target_function="second")
+                return responses, from_file, service.stats()
+
+        responses, from_file, stats = asyncio.run(run())
+        generator = FlowchartGenerator()
+        assert responses[0] == responses[2] == generator.generate_mermaid_flowchart(SOURCE, target_function="first")
+        assert responses[1] == from_file == generator.generate_mermaid_flowchart(SOURCE, target_function="second")
+        assert stats["misses"] == 2
+
+    def test_process_pool_and_generator_options(self):
+        """Test that a process pool executor and generator options can be used."""
+        async def run():
+            async with AsyncFlowchartService(ProcessPoolExecutor(1), generator_options={"max_label_length": 4}) \
+                    as service:
+                return await service.generate(SOURCE, target_function="second")
+
+        flowchart = asyncio.run(run())
+        assert flowchart == FlowchartGenerator(max_label_length=4).generate_mermaid_flowchart(
+            SOURCE, target_function="second")
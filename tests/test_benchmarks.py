@@ -0,0 +1,38 @@
+"""
+Smoke tests for the benchmark runner.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+BENCHMARKS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks")
+sys.path.insert(0, BENCHMARKS)
+
+from run_benchmarks import REQUIRED_CORPORA, failed_corpora  # noqa: E402
+
+
+class TestBenchmarks:
+    """Test cases for run_benchmarks.py."""
+
+    def test_synthetic_corpora_run(self, temp_test_dir):
+        """Test that a small run of the synthetic corpora generates every module and succeeds."""
+        output = os.path.join(temp_test_dir, "results.json")
+        subprocess.run([sys.executable, os.path.join(BENCHMARKS, "run_benchmarks.py"), "--scale", "0.01",
+                        "--repeat", "1", "--no-stdlib", "--output", output],
+                       stdout=subprocess.DEVNULL, check=True)
+        with open(output) as f:
+            results = json.load(f)
+        assert sorted(results["corpora"]) == sorted(REQUIRED_CORPORA)
+        for result in results["corpora"].values():
+            assert result["modules"] > 0
+            assert result["errors"] == {}
+        assert failed_corpora(results) == []
+
+    def test_failed_corpora(self):
+        """Test that skipped modules fail a required corpus but not the standard library."""
+        results = {"corpora": {"long_elif_chain": {"errors": {"long_elif_chain": "RecursionError: ..."}},
+                               "deep_nesting": {"errors": {}},
+                               "stdlib": {"errors": {"lib2to3/tests/data/bom.py": "SyntaxError: ..."}}}}
+        assert failed_corpora(results) == ["long_elif_chain"]
@@ -0,0 +1,221 @@
+"""
+Unit tests for flowcharts built from bytecode.
+"""
+
+import functools
+import os
+import subprocess
+import sys
+
+import pytest
+
+from flomatic.bytecode import bytecode_graph, code_name, code_object
+from flomatic.code_to_mermaid import FlowchartGenerator
+from flomatic.graph import START
+
+
+def labels(graph):
+    return [graph.label(node) for node in range(graph.node_count)]
+
+
+def labelled_edges(graph):
+    return {(graph.label(from_node), graph.label(to_node)) for from_node, to_node in graph.edges()}
+
+
+def branches(items, limit):
+    total = 0
+    for item in items:
+        if item is None:
+            continue
+        total += item
+    while total > limit:
+        total -= limit
+    return total
+
+
+def first(items):
+    for item in items:
+        return item
+
+
+def first_plus_one(xs):
+    for x in xs:
+        return x + 1
+
+
+def position(items):
+    for i, item in enumerate(items):
+        if item:
+            return i
+
+
+def checks(value, options):
+    if not isinstance(value, int):
+        raise TypeError("value")
+    for key, setting in options.items():
+        print(key, setting)
+    return value
+
+
+def defines():
+    import os
+
+    def helper():
+        return os.sep
+
+    class Local:
+        pass
+    return helper
+
+
+async def waits(source):
+    await source.ready()
+    async for item in source:
+        print(item)
+
+
+def decorated(function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        return function(*args, **kwargs)
+    return wrapper
+
+
+class Shapes:
+    @decorated
+    def area(self, width, height):
+        if width < 0 or height < 0:
+            return 0
+        return width * height
+
+
+class TestBytecodeGraph:
+    """Test cases for bytecode_graph."""
+
+    def test_loops_and_conditions(self):
+        """Test that loops and conditions get the labels a flowchart from source gives them."""
+        graph = bytecode_graph(code_object(branches))
+        assert labels(graph) == ["Start", "Function branches", "For: item in items", "If: item is None",
+                                 "While: total > limit", "Return: total", "End"]
+        edges = labelled_edges(graph)
+        assert ("Start", "Function branches") in edges
+        assert ("If: item is None", "For: item in items") in edges
+        assert ("While: total > limit", "While: total > limit") in edges
+        assert ("For: item in items", "While: total > limit") in edges
+        assert ("Return: total", "End") in edges
+        assert graph.end == graph.node_count - 1
+
+    def test_return_in_loop(self):
+        """Test that a return inside a loop is labelled with its own value, not the loop's iterable."""
+        assert "Return: item" in labels(bytecode_graph(code_object(first)))
+        assert "Return: x + 1" in labels(bytecode_graph(code_object(first_plus_one)))
+        assert "Return: i" in labels(bytecode_graph(code_object(position)))
+
+    def test_raise_and_calls(self):
+        """Test that raises end at End and call expressions are rebuilt for labels."""
+        graph = bytecode_graph(code_object(checks))
+        assert "If: not isinstance(value, int)" in labels(graph)
+        assert "For: key, setting in options.items()" in labels(graph)
+        assert ("Raise: TypeError('value')", "End") in labelled_edges(graph)
+
+    def test_detailed_mode_adds_statements(self):
+        """Test that statements become nodes only in detailed mode."""
+        compact = bytecode_graph(code_object(branches))
+        detailed = bytecode_graph(code_object(branches), compact=False)
+        assert "Assign" not in labels(compact)
+        assert labels(detailed).count("AugAssign") == 2
+        assert labels(detailed)[2] == "Assign"
+
+    def test_definitions(self):
+        """Test that nested functions and classes are shown, and imports only in detailed mode."""
+        assert labels(bytecode_graph(code_object(defines))) == [
+            "Start", "Function defines", "Function helper", "Class Local", "Return: helper", "End"]
+        assert "Import" in labels(bytecode_graph(code_object(defines), compact=False))
+
+    def test_async_function(self):
+        """Test that awaits are not drawn as loops and async for loops are."""
+        graph = bytecode_graph(code_object(waits))
+        assert labels(graph) == ["Start", "Async Function waits", "Async For: item in source", "End"]
+        assert labelled_edges(graph) == {("Start", "Async Function waits"),
+                                         ("Async Function waits", "Async For: item in source"),
+                                         ("Async For: item in source", "Async For: item in source"),
+                                         ("Async For: item in source", "End")}
+
+    def test_empty_function_and_endless_loop(self):
+        """Test that a function without control flow goes straight to End, and 'while True' gets a node."""
+        def empty():
+            pass
+
+        def forever():
+            while True:
+                pass
+        assert labelled_edges(bytecode_graph(code_object(empty))) == {("Start", "Function empty"),
+                                                                     ("Function empty", "End")}
+        assert ("While: True", "While: True") in labelled_edges(bytecode_graph(code_object(forever)))
+
+    def test_label_length(self):
+        """Test that label expressions are truncated to max_label_length."""
+        graph = bytecode_graph(code_object(checks), max_label_length=10)
+        assert "If: not isi..." in labels(graph)
+        assert graph.label(START) == "Start"
+
+
+class TestCodeObjects:
+    """Test cases for resolving functions to code objects and names."""
+
+    def test_methods_and_decorators(self):
+        """Test that methods, bound methods and wrapped functions resolve to the function's code."""
+        assert code_object(Shapes.area) is code_object(Shapes().area)
+        assert code_object(Shapes.area).co_name == "area"
+        assert code_object(code_object(checks)) is checks.__code__
+        assert code_name(Shapes().area) == "Shapes.area"
+        assert code_name(code_object(checks)) == "checks"
+
+    def test_nested_names_drop_locals(self):
+        """Test that names of nested functions are qualified as in the FunctionIndex."""
+        assert code_name(defines()) == "defines.helper"
+
+    def test_builtin_has_no_bytecode(self):
+        """Test that a builtin function is rejected."""
+        with pytest.raises(TypeError):
+            code_object(len)
+
+
+class TestGenerator:
+    """Test cases for FlowchartGenerator.generate_code_flowchart."""
+
+    def test_generate_code_flowchart(self):
+        """Test that the generator serializes bytecode flowcharts in every format."""
+        generator = FlowchartGenerator()
+        flowchart = generator.generate_code_flowchart(Shapes.area)
+        assert flowchart.startswith("flowchart TD")
+        assert 'node1["Function area"]' in flowchart
+        assert "Return: width * height" in flowchart
+        assert generator.generate_code_flowchart(Shapes.area, format="dot").startswith("digraph")
+
+    def test_matches_source_labels(self):
+        """Test that the node labels of a simple function match those built from source."""
+        source = (
+            "def checks(value, options):\n"
+            "    if not isinstance(value, int):\n"
+            "        raise TypeError('value')\n"
+            "    for key, setting in options.items():\n"
+            "        print(key, setting)\n"
+            "    return value\n")
+        from_source = FlowchartGenerator().generate_flowchart_graph(source, "checks")
+        from_bytecode = FlowchartGenerator().generate_code_graph(checks)
+        assert set(labels(from_bytecode)) <= set(labels(from_source))
+
+    def test_options_apply(self):
+        """Test that max_label_length and simplify apply to bytecode flowcharts."""
+        graph = FlowchartGenerator(max_label_length=8, simplify=True).generate_code_graph(branches, compact=False)
+        assert "For: item in items" in labels(graph)
+        assert "While: total..." in labels(graph)
+        assert "Assign" in labels(graph)
+
+    def test_bytecode_module_is_imported_lazily(self):
+        """Test that importing the generator does not import the bytecode module (with dis and inspect)."""
+        code = "import sys, flomatic.code_to_mermaid; print('flomatic.bytecode' in sys.modules)"
+        env = dict(os.environ, PYTHONPATH=os.path.join(os.path.dirname(__file__), "..", "src"))
+        process = subprocess.run([sys.executable, "-c", code], env=env, stdout=subprocess.PIPE, check=True)
+        assert process.stdout.strip() == b"False"
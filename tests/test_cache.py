@@ -0,0 +1,141 @@
+"""
+Unit tests for the DiagramCache class.
+"""
+
+import os
+from unittest.mock import patch
+
+from flomatic.cache import DiagramCache, cache_key, normalized_source, source_lines
+from flomatic.code_to_mermaid import FlowchartGenerator
+
+CLASS_EXAMPLE = """
+class Calculator:
+    def add(self, x):
+        self.value += x
+        return self.value
+
+    def multiply(self, x):
+        if x == 0:
+            return 0
+        self.value *= x
+        return self.value
+"""
+
+
+class TestDiagramCache:
+    """Test cases for the DiagramCache class."""
+
+    def test_put_and_get(self, temp_test_dir):
+        """Test that stored diagrams are returned and counted as hits."""
+        cache = DiagramCache(temp_test_dir)
+        assert cache.get("missing") is None
+        cache.put("key", "flowchart TD")
+        assert cache.get("key") == "flowchart TD"
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_entries_per_format(self, temp_test_dir):
+        """Test that entries are stored with the suffix of their format, and binary ones returned as bytes."""
+        cache = DiagramCache(temp_test_dir)
+        cache.put("key", b"FLOA\x00\xff", "adjacency")
+        cache.put("key", "digraph flowchart {}", "dot")
+        assert cache.get("key") is None
+        assert cache.get("key", "adjacency") == b"FLOA\x00\xff"
+        assert cache.get("key", "dot") == "digraph flowchart {}"
+        assert sorted(os.listdir(temp_test_dir)) == ["key.adj", "key.dot"]
+        assert len(DiagramCache(temp_test_dir)) == 2
+
+    def test_entry_evicted_while_read(self, temp_test_dir):
+        """Test that an entry removed by another process just after it was read is still returned."""
+        cache = DiagramCache(temp_test_dir)
+        cache.put("key", "flowchart TD")
+        with patch("os.utime", side_effect=FileNotFoundError):
+            assert cache.get("key") == "flowchart TD"
+
+    def test_entries_persist_between_instances(self, temp_test_dir):
+        """Test that a new cache over the same directory sees earlier entries."""
+        DiagramCache(temp_test_dir).put("key", "flowchart TD")
+        cache = DiagramCache(temp_test_dir)
+        assert len(cache) == 1
+        assert cache.get("key") == "flowchart TD"
+
+    def test_least_recently_used_entry_is_evicted(self, temp_test_dir):
+        """Test that exceeding max_size evicts the least recently used entry."""
+        cache = DiagramCache(temp_test_dir, max_size=20)
+        cache.put("a", "x" * 8)
+        cache.put("b", "y" * 8)
+        cache.get("a")
+        cache.put("c", "z" * 8)
+        assert cache.evictions == 1
+        assert cache.get("b") is None
+        assert cache.get("a") == "x" * 8
+        assert cache.get("c") == "z" * 8
+        assert sorted(os.listdir(temp_test_dir)) == ["a.mmd", "c.mmd"]
+
+    def test_instances_sharing_a_directory_stay_within_max_size(self, temp_test_dir):
+        """Test that caches writing to the same directory evict each other's entries too."""
+        caches = [DiagramCache(temp_test_dir, max_size=1600) for _ in range(4)]
+        for i in range(40):
+            caches[i % 4].put(f"key{i}", "x" * 100)
+        size = sum(entry.stat().st_size for entry in os.scandir(temp_test_dir))
+        assert size <= 1600 + 4 * 100
+        assert caches[3].get("key39") == "x" * 100
+        assert caches[0].get("key0") is None
+
+    def test_key_depends_on_every_part(self):
+        """Test that keys differ when any of their parts differ."""
+        assert cache_key("f", True) == cache_key("f", True)
+        assert cache_key("f", True) != cache_key("f", False)
+        assert cache_key("ab", "c") != cache_key("a", "bc")
+
+    def test_normalized_source_ignores_indentation(self):
+        """Test that re-indenting a function does not change its normalized source."""
+        nested = source_lines("class A:\n    def f(self):  \n        return 1\n")
+        top_level = source_lines("def f(self):\n    return 1\n")
+        assert normalized_source(nested, 2, 3) == normalized_source(top_level, 1, 2)
+
+
+class TestSaveWithCache:
+    """Test cases for save_mermaid_diagram with a cache."""
+
+    def test_cached_output_matches_uncached(self, temp_test_dir):
+        """Test that a cached run writes the same diagrams as an uncached run."""
+        cache = DiagramCache(os.path.join(temp_test_dir, "cache"))
+        uncached_dir = os.path.join(temp_test_dir, "uncached")
+        cached_dir = os.path.join(temp_test_dir, "cached")
+        expected = FlowchartGenerator().save_mermaid_diagram(CLASS_EXAMPLE, uncached_dir)
+        for _ in range(2):
+            files = FlowchartGenerator().save_mermaid_diagram(CLASS_EXAMPLE, cached_dir, cache=cache)
+        assert [os.path.basename(path) for path in files] == [os.path.basename(path) for path in expected]
+        for cached_path, expected_path in zip(files, expected):
+            with open(cached_path) as f, open(expected_path) as g:
+                assert f.read() == g.read()
+        assert (cache.hits, cache.misses) == (2, 2)
+
+    def test_unchanged_file_is_not_parsed(self, temp_test_dir):
+        """Test that an unchanged file is served from its cached module index."""
+        cache = DiagramCache(temp_test_dir)
+        generator = FlowchartGenerator()
+        generator.save_mermaid_diagram(CLASS_EXAMPLE, os.path.join(temp_test_dir, "out"), cache=cache)
+        with patch("flomatic.code_to_mermaid.FunctionIndex.from_source") as from_source:
+            generator.save_mermaid_diagram(CLASS_EXAMPLE, os.path.join(temp_test_dir, "out"), cache=cache)
+        from_source.assert_not_called()
+
+    def test_only_changed_functions_are_regenerated(self, temp_test_dir):
+        """Test that editing one function leaves the other served from the cache."""
+        cache = DiagramCache(os.path.join(temp_test_dir, "cache"))
+        generator = FlowchartGenerator()
+        generator.save_mermaid_diagram(CLASS_EXAMPLE, os.path.join(temp_test_dir, "out"), cache=cache)
+        changed = CLASS_EXAMPLE.replace("if x == 0:", "if x == 1:")
+        generator.save_mermaid_diagram(changed, os.path.join(temp_test_dir, "out"), cache=cache)
+        assert (cache.hits, cache.misses) == (1, 3)
+        with open(os.path.join(temp_test_dir, "out", "Calculator.multiply.mmd")) as f:
+            assert "If: x == 1" in f.read()
+
+    def test_evicted_diagram_is_regenerated(self, temp_test_dir):
+        """Test that a diagram evicted from a cached module is regenerated from the source."""
+        cache = DiagramCache(temp_test_dir)
+        generator = FlowchartGenerator()
+        expected = generator.generate_function_flowcharts(CLASS_EXAMPLE, cache=cache)
+        evicted = [name for name in os.listdir(temp_test_dir) if name.endswith(".mmd")][0]
+        os.remove(os.path.join(temp_test_dir, evicted))
+        assert generator.generate_function_flowcharts(CLASS_EXAMPLE, cache=cache) == expected
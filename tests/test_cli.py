@@ -0,0 +1,159 @@
+"""
+Unit tests for the command-line interface.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import zipfile
+
+import pytest
+
+from flomatic.cli import collect_sources, glob_root, main
+
+MODULE = """
+def first(x):
+    if x:
+        return 1
+    return 2
+"""
+
+
+def make_tree(root):
+    for name in ["a.py", os.path.join("pkg", "b.py"), os.path.join("pkg", "test_b.py"),
+                 os.path.join("build", "c.py"), "notes.txt"]:
+        path = os.path.join(root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(MODULE)
+
+
+class TestCollectSources:
+    """Test cases for expanding paths, directories and globs."""
+
+    def test_directory_with_include_and_exclude(self, temp_test_dir):
+        """Test that directories are searched with the include and exclude patterns."""
+        make_tree(temp_test_dir)
+        sources, unmatched = collect_sources([temp_test_dir], exclude=["build", "test_*"])
+        assert [os.path.relpath(source, temp_test_dir) for source, _ in sources] == \
+            ["a.py", os.path.join("pkg", "b.py")]
+        assert all(root == temp_test_dir for _, root in sources)
+        assert unmatched == []
+
+    def test_glob_keeps_paths_relative_to_its_root(self, temp_test_dir):
+        """Test that files matched by a glob are rooted at the glob's fixed prefix."""
+        make_tree(temp_test_dir)
+        pattern = os.path.join(temp_test_dir, "**", "*b.py")
+        sources, _ = collect_sources([pattern])
+        assert sources == [(os.path.join(temp_test_dir, "pkg", "b.py"), temp_test_dir),
+                           (os.path.join(temp_test_dir, "pkg", "test_b.py"), temp_test_dir)]
+        assert glob_root("src/**/*.py") == "src"
+        assert glob_root("*.py") == "."
+
+    def test_files_are_listed_once(self, temp_test_dir):
+        """Test that a file named twice, or also found in a directory, is listed once."""
+        make_tree(temp_test_dir)
+        a = os.path.join(temp_test_dir, "a.py")
+        sources, _ = collect_sources([a, a, os.path.join(temp_test_dir, "*.py")])
+        assert [source for source, _ in sources] == [a]
+
+    def test_archives_and_module_names(self, temp_test_dir, monkeypatch):
+        """Test that archives are searched like directories and module names are looked up."""
+        archive = os.path.join(temp_test_dir, "pkg-1.0.whl")
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("flomatic_cli_pkg/__init__.py", "")
+            zf.writestr("flomatic_cli_pkg/a.py", MODULE)
+            zf.writestr("flomatic_cli_pkg/notes.txt", MODULE)
+        monkeypatch.syspath_prepend(archive)
+        sources, unmatched = collect_sources([os.path.join(temp_test_dir, "*.whl"), "flomatic_cli_pkg.a",
+                                              "json.nosuch"])
+        assert sources == [(os.path.join(archive, "flomatic_cli_pkg", "__init__.py"), temp_test_dir),
+                           (os.path.join(archive, "flomatic_cli_pkg", "a.py"), temp_test_dir)]
+        assert unmatched == ["json.nosuch"]
+
+    def test_unmatched_paths_are_reported(self, temp_test_dir):
+        """Test that missing files and empty globs are reported."""
+        missing = os.path.join(temp_test_dir, "missing.py")
+        empty = os.path.join(temp_test_dir, "*.pyx")
+        assert collect_sources([missing, empty]) == ([], [missing, empty])
+
+
+class TestMain:
+    """Test cases for running the command."""
+
+    def test_generates_diagrams(self, temp_test_dir, capsys):
+        """Test that a run saves each file's diagrams in the chosen format."""
+        root = os.path.join(temp_test_dir, "src")
+        output_dir = os.path.join(temp_test_dir, "out")
+        make_tree(root)
+        assert main([root, "-o", output_dir, "-j", "1", "--format", "dot", "--exclude", "build"]) == 0
+        assert os.path.exists(os.path.join(output_dir, "pkg", "b", "first.dot"))
+        assert not os.path.exists(os.path.join(output_dir, "build"))
+        assert "Saved 3 diagrams for 3 files" in capsys.readouterr().out
+
+    def test_changed_only(self, temp_test_dir, capsys):
+        """Test that --changed-only skips unchanged files on the next run."""
+        root = os.path.join(temp_test_dir, "src")
+        output_dir = os.path.join(temp_test_dir, "out")
+        make_tree(root)
+        args = [root, "-o", output_dir, "-j", "1", "--changed-only", "--full"]
+        assert main(args) == 0
+        assert "Updated 4 and removed 0" in capsys.readouterr().out
+        assert main(args) == 0
+        assert "(4 of 4 files unchanged)" in capsys.readouterr().out
+
+    def test_max_nodes_splits_diagrams(self, temp_test_dir, capsys):
+        """Test that --max-nodes saves the sub-diagrams split off a diagram next to it."""
+        make_tree(temp_test_dir)
+        output_dir = os.path.join(temp_test_dir, "out")
+        assert main([os.path.join(temp_test_dir, "a.py"), "-o", output_dir, "--max-nodes", "6"]) == 0
+        assert sorted(os.listdir(os.path.join(output_dir, "a"))) == ["first-1.mmd", "first.mmd"]
+        with open(os.path.join(output_dir, "a", "first.mmd")) as f:
+            assert '["If: x (see first-1)"]' in f.read()
+
+    def test_dedupe(self, temp_test_dir, capsys):
+        """Test that --dedupe stores the diagrams shared by several files once and reports the ratio."""
+        root = os.path.join(temp_test_dir, "src")
+        output_dir = os.path.join(temp_test_dir, "out")
+        make_tree(root)
+        assert main([root, "-o", output_dir, "-j", "1", "--dedupe"]) == 0
+        assert len(os.listdir(os.path.join(output_dir, "_shared"))) == 1
+        with open(os.path.join(output_dir, "a", "first.mmd")) as f:
+            assert "Function first (see ../_shared/" in f.read()
+        assert "Deduplicated 4 diagrams to 1 distinct flowcharts (ratio 4.00" in capsys.readouterr().out
+
+    @pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+    def test_diff(self, temp_test_dir, monkeypatch, capsys):
+        """Test that --diff only diagrams the functions changed since a revision."""
+        make_tree(temp_test_dir)
+        git = ["git", "-c", "user.name=Test", "-c", "user.email=test@example.com"]
+        subprocess.run(git + ["init", "-q"], cwd=temp_test_dir, check=True)
+        subprocess.run(git + ["add", "."], cwd=temp_test_dir, check=True)
+        subprocess.run(git + ["commit", "-q", "-m", "first"], cwd=temp_test_dir, check=True)
+        with open(os.path.join(temp_test_dir, "pkg", "b.py"), "a") as f:
+            f.write("\ndef second(items):\n    for item in items:\n        print(item)\n")
+        monkeypatch.chdir(temp_test_dir)
+
+        assert main(["--diff", "HEAD", "-o", "out", "--exclude", "build"]) == 0
+        assert sorted(os.listdir("out")) == ["pkg"]
+        assert os.listdir(os.path.join("out", "pkg", "b")) == ["second.mmd"]
+        assert "Saved 1 diagrams of changed functions in 1 files" in capsys.readouterr().out
+        assert main(["--diff", "nosuch", "-o", "out"]) == 1
+        assert "bad revision" in capsys.readouterr().err
+
+    def test_missing_path_fails(self, temp_test_dir, capsys):
+        """Test that a path matching nothing gives a non-zero exit status."""
+        assert main([os.path.join(temp_test_dir, "missing.py")]) == 1
+        assert "no such file" in capsys.readouterr().err
+
+    def test_runs_as_module(self, temp_test_dir):
+        """Test that the command runs with python -m flomatic."""
+        make_tree(temp_test_dir)
+        output_dir = os.path.join(temp_test_dir, "out")
+        env = dict(os.environ, PYTHONPATH=os.path.join(os.path.dirname(__file__), "..", "src"))
+        process = subprocess.run([sys.executable, "-m", "flomatic", os.path.join(temp_test_dir, "a.py"),
+                                  "-o", output_dir, "-q"], env=env, stdout=subprocess.PIPE)
+        assert process.returncode == 0
+        assert process.stdout == b""
+        assert os.path.exists(os.path.join(output_dir, "a", "first.mmd"))
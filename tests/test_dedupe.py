@@ -0,0 +1,153 @@
+"""
+Unit tests for storing identical diagrams once.
+"""
+
+import json
+import os
+
+import pytest
+
+from flomatic.code_to_mermaid import FlowchartGenerator
+from flomatic.dedupe import SHARED_DIR, SharedDiagrams, read_flowchart
+from flomatic.project import generate_project_diagrams
+from flomatic.graph import START, FlowGraph
+from flomatic.serializers import FORMATS, format_suffix, serialize
+
+GETTERS = """
+class Point:
+    def __init__(self):
+        pass
+
+class Size:
+    def __init__(self):
+        pass
+
+class Line:
+    def __init__(self):
+        pass
+
+    def length(self):
+        if self:
+            return 1
+        return 0
+"""
+
+
+DELEGATORS = """
+def first(self):
+    return self
+
+async def second(self):
+    return self
+
+def third(self):
+    return self
+"""
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+class TestSharedDiagrams:
+    """Test cases for the SharedDiagrams class."""
+
+    def test_identical_diagrams_are_stored_once(self, temp_test_dir):
+        """Test that the second copy of a flowchart moves it to the shared directory and leaves stubs."""
+        output_dir = os.path.join(temp_test_dir, "out")
+        shared = SharedDiagrams(output_dir)
+        saved = FlowchartGenerator().save_mermaid_diagram(GETTERS, output_dir, shared=shared)
+
+        init_files = [os.path.join(output_dir, f"{name}.__init__.mmd") for name in ["Point", "Size", "Line"]]
+        assert saved == init_files + [os.path.join(output_dir, "Line.length.mmd")]
+        [shared_file] = os.listdir(os.path.join(output_dir, SHARED_DIR))
+        assert shared_file.endswith(".mmd")
+        assert 'Function"]' in read(os.path.join(output_dir, SHARED_DIR, shared_file))
+        for path in init_files:
+            assert f'["Function __init__ (see {SHARED_DIR}/{shared_file})"]' in read(path)
+        assert "Return: 1" in read(os.path.join(output_dir, "Line.length.mmd"))
+        assert (shared.diagrams, shared.unique, shared.shared) == (4, 2, 1)
+        assert shared.ratio() == 2.0
+        assert "Deduplicated 4 diagrams to 2 distinct flowcharts" in shared.summary()
+
+    @pytest.mark.parametrize("format", ["mermaid", "dot", "json", "adjacency"])
+    def test_names_are_left_out_of_the_comparison(self, temp_test_dir, format):
+        """Test that functions drawing the same flowchart under different names share it."""
+        output_dir = os.path.join(temp_test_dir, "out")
+        shared = SharedDiagrams(output_dir)
+        FlowchartGenerator().save_mermaid_diagram(DELEGATORS, output_dir, format=format, shared=shared)
+        # An async function is drawn differently, as 'Async Function second'
+        assert (shared.diagrams, shared.unique, shared.shared) == (3, 2, 1)
+        [shared_file] = os.listdir(os.path.join(output_dir, SHARED_DIR))
+        for name in ["first", "third"]:
+            with open(os.path.join(output_dir, name + format_suffix(format)), "rb") as f:
+                assert f"Function {name} (see {SHARED_DIR}/{shared_file})".encode() in f.read()
+
+    def test_files_that_stop_sharing_are_rewritten(self, temp_test_dir):
+        """Test that a diagram that no longer matches the others replaces its stub with the diagram."""
+        output_dir = os.path.join(temp_test_dir, "out")
+        FlowchartGenerator().save_mermaid_diagram(GETTERS, output_dir, shared=SharedDiagrams(output_dir))
+        changed = GETTERS.replace("class Size:\n    def __init__(self):\n        pass",
+                                  "class Size:\n    def __init__(self):\n        return self")
+        FlowchartGenerator().save_mermaid_diagram(changed, output_dir)
+
+        assert "Return: self" in read(os.path.join(output_dir, "Size.__init__.mmd"))
+        assert "Return" not in read(os.path.join(output_dir, "Point.__init__.mmd"))
+
+    def test_prune_removes_shared_files_no_longer_referred_to(self, temp_test_dir):
+        """Test that pruning removes the shared files of flowcharts that changed, and keeps the others."""
+        output_dir = os.path.join(temp_test_dir, "out")
+        FlowchartGenerator().save_mermaid_diagram(GETTERS, output_dir, shared=SharedDiagrams(output_dir))
+        [old_file] = os.listdir(os.path.join(output_dir, SHARED_DIR))
+        changed = GETTERS.replace("    def __init__(self):\n        pass", "    def __init__(self):\n        return self")
+        shared = SharedDiagrams(output_dir)
+        FlowchartGenerator().save_mermaid_diagram(changed, output_dir, shared=shared)
+
+        assert shared.prune() == [os.path.join(output_dir, SHARED_DIR, old_file)]
+        [new_file] = os.listdir(os.path.join(output_dir, SHARED_DIR))
+        assert new_file != old_file
+        assert f"{SHARED_DIR}/{new_file}" in read(os.path.join(output_dir, "Point.__init__.mmd"))
+        assert SharedDiagrams(output_dir).prune() == []
+
+    def test_project_run(self, temp_test_dir):
+        """Test that a project run shares diagrams across files, and that changed-only runs refuse to."""
+        root = os.path.join(temp_test_dir, "src")
+        os.makedirs(root)
+        for name in ["a.py", "b.py"]:
+            with open(os.path.join(root, name), "w") as f:
+                f.write(GETTERS)
+        output_dir = os.path.join(temp_test_dir, "out")
+        shared = SharedDiagrams(output_dir)
+        generate_project_diagrams(root, output_dir, jobs=1, format="json", shared=shared)
+        assert (shared.diagrams, shared.unique, shared.shared) == (8, 2, 2)
+        for name in ["a", "b"]:
+            stub = json.loads(read(os.path.join(output_dir, name, "Line.length.json")))
+            assert stub["nodes"][1]["label"].startswith(f"Function length (see ../{SHARED_DIR}/")
+
+        with pytest.raises(ValueError):
+            generate_project_diagrams(root, output_dir, jobs=1, changed_only=True, shared=shared)
+
+
+class TestReadFlowchart:
+    """Test cases for reading serialized flowcharts back."""
+
+    @pytest.mark.parametrize("format", list(FORMATS))
+    def test_round_trip(self, format):
+        """Test that every format reads back to a graph with the same labels and edges."""
+        graph = FlowGraph()
+        node = graph.add_node('say "hi" \\ there')
+        loop = graph.add_node("While: x")
+        end = graph.add_end()
+        for from_node, to_node in [(START, loop), (loop, node), (node, loop), (loop, end)]:
+            graph.add_edge(from_node, to_node)
+        copy = read_flowchart(serialize(graph, format), format)
+        assert [copy.label(n) for n in range(copy.node_count)] == [graph.label(n) for n in range(graph.node_count)]
+        assert copy.end == graph.end
+        assert copy.successors() == graph.successors()
+        assert copy.fingerprint() == graph.fingerprint()
+
+    def test_unknown_format(self):
+        """Test that an unknown format is rejected."""
+        with pytest.raises(ValueError):
+            read_flowchart("", "svg")
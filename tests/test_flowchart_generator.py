@@ -2,9 +2,19 @@
 Unit tests for the FlowchartGenerator class.
 """
 
+import ast
+import gc
 import os
+import sys
+import threading
+import weakref
+from unittest.mock import patch
 import pytest
-from flomatic.code_to_mermaid import FlowchartGenerator
+from flomatic.code_to_mermaid import FlowchartGenerator, FlowchartOptions, FlowContext
+from flomatic.function_index import FunctionIndex
+from flomatic.graph import START
+from flomatic.serializers import to_mermaid
+from flomatic.svg import parse_flowchart
 
 # Test code snippets
 IF_EXAMPLE = """
@@ -71,25 +81,31 @@ class TestFlowchartGenerator:
     def test_initialization(self):
         """Test that the FlowchartGenerator initializes correctly."""
         generator = FlowchartGenerator()
-        assert generator.flowchart == ["flowchart TD"]
-        assert generator.node_count == 0
-        assert generator.last_node == "Start"
-        assert generator.loop_start_node is None
-        assert generator.after_loop_node is None
+        assert generator.options == FlowchartOptions(max_label_length=None, simplify=False, max_nodes=None)
+        context = generator._start_flowchart(None, True)
+        assert context.graph.node_count == 1
+        assert context.graph.label(START) == "Start"
+        assert context.graph.edge_count == 0
+        assert context.last_node == START
+        assert context.loop_stack == []
 
     def test_add_node(self):
         """Test that add_node creates a node with the correct label."""
-        generator = FlowchartGenerator()
-        node_name = generator.add_node("Test Node")
-        assert node_name == "node1"
-        assert generator.node_count == 1
-        assert generator.flowchart[1] == 'node1["Test Node"]'
+        context = FlowContext()
+        node_id = context.add_node("Test Node")
+        assert node_id == 1
+        assert context.graph.node_count == 2
+        assert context.graph.label(node_id) == "Test Node"
+        assert to_mermaid(context.graph).split("\n")[2] == 'node1["Test Node"]'
 
     def test_add_connection(self):
         """Test that add_connection creates a connection between nodes."""
-        generator = FlowchartGenerator()
-        generator.add_connection("nodeA", "nodeB")
-        assert generator.flowchart[1] == "nodeA --> nodeB"
+        context = FlowContext()
+        node_a = context.add_node("A")
+        node_b = context.add_node("B")
+        context.add_connection(node_a, node_b)
+        assert context.graph.edges() == [(node_a, node_b)]
+        assert to_mermaid(context.graph).split("\n")[-1] == "node1 --> node2"
 
     def test_generate_if_statement_flowchart(self):
         """Test generating a flowchart for code with an if statement."""
@@ -270,3 +286,452 @@ class TestFlowchartGenerator:
             assert f"{nodes['Return: i']} --> End" in flowchart
         if "Return: -1" in nodes:
             assert f"{nodes['Return: -1']} --> End" in flowchart
+
+    def test_save_mermaid_diagram_matches_targeted_flowcharts(self, temp_test_dir):
+        """Test that single-pass saving produces the same diagrams as targeting each function."""
+        generator = FlowchartGenerator()
+        file_paths = generator.save_mermaid_diagram(CLASS_EXAMPLE, output_dir=temp_test_dir)
+        
+        expected_names = ["Calculator.__init__", "Calculator.add", "Calculator.subtract", "Calculator.multiply"]
+        assert [os.path.basename(path) for path in file_paths] == [f"{name}.mmd" for name in expected_names]
+        
+        for name, file_path in zip(expected_names, file_paths):
+            with open(file_path, 'r') as f:
+                content = f.read()
+            expected = FlowchartGenerator().generate_mermaid_flowchart(CLASS_EXAMPLE, target_function=name)
+            assert content == expected
+
+    def test_save_mermaid_diagram_without_functions(self, temp_test_dir):
+        """Test that source without functions is saved as a single empty diagram."""
+        generator = FlowchartGenerator()
+        file_paths = generator.save_mermaid_diagram("x = 1\n", output_dir=temp_test_dir)
+        
+        assert file_paths == [os.path.join(temp_test_dir, "unnamed_function.mmd")]
+        with open(file_paths[0], 'r') as f:
+            assert f.read() == 'flowchart TD\nStart["Start"]\nEnd["End"]'
+
+    def test_target_nested_class_method(self):
+        """Test that methods of nested classes and nested functions can be targeted by qualified name."""
+        source = """
+class Outer:
+    class Inner:
+        def method(self, x):
+            if x:
+                return 1
+            return 2
+
+def method():
+    def inner(y):
+        while y:
+            y -= 1
+    return inner
+"""
+        generator = FlowchartGenerator()
+        flowchart = generator.generate_mermaid_flowchart(source, target_function="Outer.Inner.method")
+        assert "Function method" in flowchart
+        assert "If: x" in flowchart
+        assert "Function inner" not in flowchart
+
+        flowchart = generator.generate_mermaid_flowchart(source, target_function="method.inner")
+        assert "Function inner" in flowchart
+        assert "While: y" in flowchart
+        assert "If: x" not in flowchart
+
+    def test_target_functions_with_shared_index(self):
+        """Test that many targets can be generated from one prebuilt index."""
+        index = FunctionIndex.from_source(CLASS_EXAMPLE)
+        generator = FlowchartGenerator()
+        for name in index.names():
+            shared = generator.generate_mermaid_flowchart(CLASS_EXAMPLE, target_function=name, index=index)
+            assert shared == FlowchartGenerator().generate_mermaid_flowchart(CLASS_EXAMPLE, target_function=name)
+
+    def test_iter_function_flowcharts_is_lazy(self):
+        """Test that flowcharts are yielded one at a time, before later functions are visited."""
+        generator = FlowchartGenerator()
+        visited = []
+        original = generator._generate_function_flowchart
+        generator._generate_function_flowchart = lambda entry, *args: visited.append(entry.name) or original(entry, *args)
+        
+        flowcharts = generator.iter_function_flowcharts(CLASS_EXAMPLE)
+        name, flowchart = next(flowcharts)
+        assert name == "Calculator.__init__"
+        assert "Function __init__" in flowchart
+        assert visited == ["Calculator.__init__"]
+        
+        assert [name for name, _ in flowcharts] == ["Calculator.add", "Calculator.subtract", "Calculator.multiply"]
+        assert len(visited) == 4
+
+    def test_write_function_flowcharts_to_sink(self):
+        """Test that every flowchart is passed to the sink in source order."""
+        received = []
+        count = FlowchartGenerator().write_function_flowcharts(IF_EXAMPLE + FOR_EXAMPLE, lambda name, text: received.append((name, text)))
+        assert count == 2
+        assert [name for name, _ in received] == ["example", "process_list"]
+        assert received[1][1] == FlowchartGenerator().generate_mermaid_flowchart(FOR_EXAMPLE, target_function="process_list")
+
+    def test_labels_use_source_text(self):
+        """Test that labels show single-line expressions as written, and unparse multi-line ones."""
+        source = '''
+def check(name, items):
+    if name == "ünïcode" and  len(items) > 2:
+        return (name,
+                items)
+    for key, value in items:
+        pass
+'''
+        flowchart = FlowchartGenerator().generate_mermaid_flowchart(source, target_function="check")
+        assert 'If: name == #quot;ünïcode#quot; and  len(items) > 2' in flowchart
+        assert "Return: (name, items)" in flowchart
+        assert "For: key, value in items" in flowchart
+
+    def test_labels_are_memoized_per_node(self):
+        """Test that an expression drawn several times by one call is rendered once."""
+        source = ("def f(x):\n    if x:\n        return [\n            x]\n    for i in x:\n"
+                  "        if i:\n            print(i)\n        else:\n            print(-i)\n    return x\n")
+        generator = FlowchartGenerator(max_nodes=6)
+        with patch("flomatic.code_to_mermaid.ast.unparse", wraps=ast.unparse) as unparse:
+            # The function is visited again once blocks are folded to fit the budget
+            parts = generator.generate_flowchart_parts(source, "f")
+        assert len(parts) > 1 and any("Return: [x]" in flowchart for _, flowchart in parts)
+        assert unparse.call_count == 1
+
+    def test_max_label_length(self):
+        """Test that long expressions are truncated in labels."""
+        source = "def f(x):\n    return some_function_with_a_long_name(x, x, x)\n"
+        flowchart = FlowchartGenerator(max_label_length=12).generate_mermaid_flowchart(source)
+        assert '["Return: some_func..."]' in flowchart
+        assert FlowchartGenerator().generate_mermaid_flowchart(source) != flowchart
+
+    def test_async_function_with_async_for_and_with(self):
+        """Test that async definitions, loops and context managers get their own nodes."""
+        source = '''
+async def fetch(session, urls):
+    async with session.lock() as lock, timer:
+        async for url in session.get(urls):
+            if url:
+                break
+'''
+        flowchart = FlowchartGenerator().generate_mermaid_flowchart(source, target_function="fetch")
+        assert '["Async Function fetch"]' in flowchart
+        assert '["Async With: session.lock() as lock, timer"]' in flowchart
+        assert '["Async For: url in session.get(urls)"]' in flowchart
+        assert '["Break"]' in flowchart
+
+    def test_try_except_else_finally(self):
+        """Test that try statements branch to each handler and join in the finally clause."""
+        source = '''
+def load(path):
+    try:
+        data = read(path)
+    except OSError as e:
+        raise RuntimeError(path) from e
+    except ValueError:
+        return None
+    else:
+        data = clean(data)
+    finally:
+        log(path)
+    return data
+'''
+        graph = FlowchartGenerator().generate_flowchart_graph(source, target_function="load")
+        nodes = {graph.label(node): node for node in range(graph.node_count)}
+        edges = set(graph.edges())
+        try_node = nodes["Try"]
+        assert (try_node, nodes["Except: OSError as e"]) in edges
+        assert (try_node, nodes["Except: ValueError"]) in edges
+        assert (try_node, nodes["Try Else"]) in edges
+        assert (nodes["Try Else"], nodes["Finally"]) in edges
+        # Handlers that raise or return leave the function instead of reaching the join
+        assert (nodes["Except: OSError as e"], nodes["Raise: RuntimeError(path)"]) in edges
+        assert (nodes["Raise: RuntimeError(path)"], graph.end) in edges
+        assert (nodes["Return: None"], graph.end) in edges
+        assert (nodes["Raise: RuntimeError(path)"], nodes["Finally"]) not in edges
+        assert (nodes["Finally"], nodes["Return: data"]) in edges
+
+    def test_try_without_finally_joins_after_try(self):
+        """Test that a try statement without finally joins its branches in an After Try node."""
+        source = "def f():\n    try:\n        g()\n    except:\n        h()\n    raise\n"
+        graph = FlowchartGenerator().generate_flowchart_graph(source)
+        labels = [graph.label(node) for node in range(graph.node_count)]
+        assert labels[2:] == ["Try", "Except", "After Try", "Raise", "End"]
+        assert set(graph.edges()) == {(0, 1), (1, 2), (2, 4), (2, 3), (3, 4), (4, 5), (5, 6)}
+
+    @pytest.mark.skipif(sys.version_info < (3, 10), reason="match statements need Python 3.10")
+    def test_match_statement(self):
+        """Test that each case of a match statement is a branch of the subject."""
+        source = '''
+def describe(command):
+    match command.split():
+        case ["go", direction] if direction in DIRECTIONS:
+            return direction
+        case ["quit"]:
+            raise SystemExit
+        case _:
+            pass
+    return None
+'''
+        graph = FlowchartGenerator().generate_flowchart_graph(source, target_function="describe")
+        nodes = {graph.label(node): node for node in range(graph.node_count)}
+        match_node = nodes["Match: command.split()"]
+        cases = ['Case: ["go", direction] if direction in DIRECTIONS', 'Case: ["quit"]', "Case: _"]
+        assert all((match_node, nodes[case]) in graph.edges() for case in cases)
+        assert (nodes['Case: ["quit"]'], nodes["Raise: SystemExit"]) in graph.edges()
+        assert (match_node, nodes["Return: None"]) in graph.edges()
+
+    @pytest.mark.skipif(sys.version_info < (3, 11), reason="except* needs Python 3.11")
+    def test_try_star(self):
+        """Test that except* handlers are labelled as such."""
+        source = "def f():\n    try:\n        g()\n    except* ValueError:\n        h()\n"
+        flowchart = FlowchartGenerator().generate_mermaid_flowchart(source)
+        assert '["Except*: ValueError"]' in flowchart
+
+    def test_nested_loop_break_and_continue(self):
+        """Test that break and continue after an inner loop refer to the enclosing loop."""
+        source = '''
+def scan(rows):
+    for row in rows:
+        while row.busy():
+            if row.done:
+                break
+            continue
+        if row.last:
+            break
+        continue
+    else:
+        for retry in rows:
+            break
+    return rows
+'''
+        graph = FlowchartGenerator().generate_flowchart_graph(source, target_function="scan")
+        labels = [graph.label(node) for node in range(graph.node_count)]
+        assert "Break (Invalid)" not in labels and "Continue (Invalid)" not in labels
+        outer, inner, retry = (labels.index(label) for label in ["For: row in rows", "While: row.busy()",
+                                                                 "For: retry in rows"])
+        afters = [node for node, label in enumerate(labels) if label == "After Loop"]
+        outer_after, inner_after, retry_after = afters
+        targets = {}
+        for from_node, to_node in graph.edges():
+            if labels[from_node] in ("Break", "Continue"):
+                targets.setdefault(labels[from_node], []).append(to_node)
+        assert targets["Break"] == [inner_after, outer_after, retry_after]
+        assert targets["Continue"] == [inner, outer]
+
+    def test_loop_around_nested_function(self):
+        """Test that a loop around a nested definition is not a break target inside it."""
+        source = "def f(items):\n    for item in items:\n        def g():\n            break\n"
+        flowchart = FlowchartGenerator().generate_mermaid_flowchart(source)
+        assert '["Break (Invalid)"]' in flowchart
+
+
+BUDGET_EXAMPLE = """
+def big(items):
+    total = 0
+    for item in items:
+        if item > 10:
+            for x in range(item):
+                if x % 2:
+                    total += x
+                elif x % 3:
+                    continue
+        elif item < 0:
+            try:
+                total -= item
+            except ValueError:
+                raise
+        while total > 100:
+            total -= 7
+            if total == 3:
+                return total
+    with open("f") as f:
+        if total:
+            return 1
+    return total
+"""
+
+
+class TestNodeBudget:
+    """Test cases for splitting flowcharts over the max_nodes budget into sub-diagrams."""
+
+    def test_within_budget_is_unchanged(self):
+        """Test that a flowchart within the budget has no parts and is unchanged."""
+        plain = FlowchartGenerator().generate_mermaid_flowchart(BUDGET_EXAMPLE, target_function="big")
+        generator = FlowchartGenerator(max_nodes=1000)
+        assert generator.generate_mermaid_flowchart(BUDGET_EXAMPLE, target_function="big") == plain
+        assert generator.generate_flowchart_parts(BUDGET_EXAMPLE, target_function="big") == [("big", plain)]
+
+    def test_folds_blocks_into_linked_parts(self):
+        """Test that an over-budget flowchart folds blocks into summary nodes naming their parts."""
+        generator = FlowchartGenerator(max_nodes=12)
+        parts = generator.generate_flowchart_parts(BUDGET_EXAMPLE, target_function="big")
+        names = [name for name, _ in parts]
+        assert names[0] == "big"
+        assert names[1:] == [f"big-{number}" for number in range(1, len(names))]
+
+        main = parts[0][1]
+        assert main == generator.generate_mermaid_flowchart(BUDGET_EXAMPLE, target_function="big")
+        assert '["For: item in items (see big-1)"]' in main
+        assert '["With: open(#quot;f#quot;) as f (see big-2)"]' in main
+        # Every part is referred to by exactly one summary node in another part
+        for name in names[1:]:
+            assert sum(f"(see {name})" in flowchart for _, flowchart in parts) == 1
+
+    def test_parts_fit_the_budget(self):
+        """Test that every part fits the budget when its blocks can be folded."""
+        graph = FlowchartGenerator().generate_flowchart_graph(BUDGET_EXAMPLE, target_function="big")
+        generator = FlowchartGenerator(max_nodes=15)
+        for name, flowchart in generator.generate_flowchart_parts(BUDGET_EXAMPLE, target_function="big"):
+            assert flowchart.count('["') <= 15
+        assert graph.node_count > 15
+
+    def test_folded_block_that_returns_reaches_end(self):
+        """Test that the summary node of a block containing a return is connected to End."""
+        graph = FlowchartGenerator(max_nodes=12).generate_flowchart_graph(BUDGET_EXAMPLE, target_function="big")
+        labels = {graph.label(node): node for node in range(graph.node_count)}
+        summary = labels["For: item in items (see big-1)"]
+        assert (summary, graph.end) in graph.edges()
+
+    def test_blocks_leaving_a_loop_are_not_folded(self):
+        """Test that a block that breaks out of an enclosing loop stays in the loop's diagram."""
+        source = ("def f(items):\n    for item in items:\n"
+                  + "".join(f"        if item == {n}:\n            print({n})\n            break\n"
+                            for n in range(6)))
+        parts = FlowchartGenerator(max_nodes=8).generate_flowchart_parts(source, target_function="f")
+        assert [name for name, _ in parts] == ["f", "f-1"]
+        assert parts[1][1].count('["Break"]') == 6
+
+    def test_long_flat_function_fits_the_budget(self):
+        """Test that runs of small statements are folded until every part fits the budget."""
+        source = "def big(x):\n" + "".join(f"    if x == {n}:\n        y = {n}\n        z(y)\n" for n in range(150))
+        for target_function, name in [("big", "big"), (None, "module")]:
+            parts = FlowchartGenerator(max_nodes=50).generate_flowchart_parts(source, target_function)
+            for _, flowchart in parts:
+                assert len(parse_flowchart(flowchart)[0]) <= 50
+            # Runs of statements are folded rather than every if statement on its own
+            assert len(parts) < 10
+            assert f'["Lines 2-73 (see {name}-1)"]' in parts[0][1]
+
+    @pytest.mark.parametrize("max_nodes", [8, 10, 13, 17, 24, 32, 40])
+    def test_every_part_fits_the_budget(self, max_nodes):
+        """Test that every compact part fits the budget when no block leaves an outer loop."""
+        source = BUDGET_EXAMPLE.replace("continue", "pass")
+        generator = FlowchartGenerator(max_nodes=max_nodes)
+        for target_function in ["big", None]:
+            for _, flowchart in generator.generate_flowchart_parts(source, target_function):
+                assert len(parse_flowchart(flowchart)[0]) <= max_nodes
+
+    def test_long_elif_chain(self):
+        """Test that a long elif chain neither exhausts the stack nor splits into a part per elif."""
+        source = ("def f(x):\n    if x == 0:\n        return 0\n"
+                  + "".join(f"    elif x == {n}:\n        return {n}\n" for n in range(1, 1000)))
+        flowchart = FlowchartGenerator().generate_mermaid_flowchart(source, target_function="f")
+        assert flowchart.count('["If: ') == 1000
+        parts = FlowchartGenerator(max_nodes=50).generate_flowchart_parts(source, target_function="f")
+        for _, flowchart in parts:
+            assert len(parse_flowchart(flowchart)[0]) <= 50
+        assert len(parts) < 100
+        # Every elif is drawn once, besides the summary nodes linking the parts
+        conditions = [line for _, flowchart in parts for line in flowchart.splitlines()
+                      if '["If: ' in line and "(see " not in line]
+        assert len(conditions) == 1000
+
+    def test_saved_and_updated_parts(self, temp_test_dir):
+        """Test that parts are saved as files of their own and kept while the function is unchanged."""
+        generator = FlowchartGenerator(max_nodes=12)
+        saved = generator.save_mermaid_diagram(BUDGET_EXAMPLE, output_dir=temp_test_dir)
+        assert "big-1.mmd" in [os.path.basename(path) for path in saved]
+
+        source_file = os.path.join(temp_test_dir, "big.py")
+        with open(source_file, "w") as f:
+            f.write(BUDGET_EXAMPLE)
+        output_dir = os.path.join(temp_test_dir, "out")
+        written, _ = generator.update_mermaid_diagrams(source_file, output_dir)
+        assert [os.path.basename(path) for path in written] == [os.path.basename(path) for path in saved]
+
+        # Touching the file keeps every part; shrinking the function removes them
+        with open(source_file, "a") as f:
+            f.write("\n")
+        assert generator.update_mermaid_diagrams(source_file, output_dir) == ([], [])
+        # A deleted part is written again, and only that part
+        os.remove(os.path.join(output_dir, "big-1.mmd"))
+        written, _ = generator.update_mermaid_diagrams(source_file, output_dir)
+        assert written == [os.path.join(output_dir, "big-1.mmd")]
+        assert generator.update_mermaid_diagrams(source_file, output_dir) == ([], [])
+        with open(source_file, "w") as f:
+            f.write("def big():\n    return 1\n")
+        written, removed = generator.update_mermaid_diagrams(source_file, output_dir)
+        assert [os.path.basename(path) for path in written] == ["big.mmd"]
+        assert len(removed) == len(saved) - 1
+
+    def test_parts_are_cached(self, temp_test_dir):
+        """Test that cached parts are served without visiting the function again."""
+        from flomatic.cache import DiagramCache
+        cache = DiagramCache(os.path.join(temp_test_dir, "cache"))
+        generator = FlowchartGenerator(max_nodes=12)
+        parts = generator.generate_function_flowcharts(BUDGET_EXAMPLE, cache=cache)
+        with patch.object(generator, "_budget_graph") as budget_graph:
+            assert generator.generate_function_flowcharts(BUDGET_EXAMPLE, cache=cache) == parts
+            # A changed file only serves its functions' parts from the cache
+            assert generator.generate_function_flowcharts(BUDGET_EXAMPLE + "\n\n", cache=cache) == parts
+        budget_graph.assert_not_called()
+
+
+class TestSharedGenerator:
+    """Test cases for the immutable options and per-call state of FlowchartGenerator."""
+
+    def test_options_are_immutable(self):
+        """Test that options cannot be changed, and with_options gives a new generator."""
+        generator = FlowchartGenerator(max_label_length=10)
+        with pytest.raises(AttributeError):
+            generator.options.max_label_length = 20
+        with pytest.raises(AttributeError):
+            generator.max_label_length = 20
+        simplified = generator.with_options(simplify=True)
+        assert simplified.options == FlowchartOptions(max_label_length=10, simplify=True)
+        assert generator.options == FlowchartOptions(max_label_length=10)
+        assert FlowchartGenerator(options=simplified.options).simplify
+
+    def test_run_state_is_not_kept_on_the_generator(self):
+        """Test that generating leaves no per-run state on the instance."""
+        generator = FlowchartGenerator()
+        attributes = set(vars(generator))
+        generator.generate_mermaid_flowchart(CLASS_EXAMPLE, target_function="Calculator.multiply")
+        generator.generate_function_flowcharts(BREAK_CONTINUE_EXAMPLE)
+        assert set(vars(generator)) == attributes
+        assert FlowContext.__slots__ and not hasattr(FlowContext(), "__dict__")
+
+        # Nothing from the last run, such as its source or tree, is still referenced
+        index = FunctionIndex.from_source(CLASS_EXAMPLE)
+        tree = weakref.ref(index.tree)
+        generator.generate_mermaid_flowchart(CLASS_EXAMPLE, target_function="Calculator.multiply", index=index)
+        generator.generate_flowchart_parts(CLASS_EXAMPLE, "Calculator.add", index=index)
+        del index
+        gc.collect()
+        assert tree() is None
+        assert not any(CLASS_EXAMPLE in (value, getattr(value, "source_code", None))
+                       for value in vars(generator).values())
+
+    def test_concurrent_use_from_many_threads(self):
+        """Test that one generator gives the same diagrams when shared by many threads."""
+        sources = [IF_EXAMPLE, FOR_EXAMPLE, BREAK_CONTINUE_EXAMPLE, WHILE_EXAMPLE, CLASS_EXAMPLE]
+        generator = FlowchartGenerator(max_label_length=30)
+        expected = [FlowchartGenerator(max_label_length=30).generate_function_flowcharts(source)
+                    for source in sources]
+        results = {}
+        errors = []
+
+        def work(worker):
+            try:
+                for round in range(20):
+                    position = (worker + round) % len(sources)
+                    result = generator.generate_function_flowcharts(sources[position])
+                    if result != expected[position]:
+                        results[worker] = result
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work, args=(worker,)) for worker in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == [] and results == {}
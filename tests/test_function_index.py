@@ -0,0 +1,71 @@
+"""
+Unit tests for the FunctionIndex class.
+"""
+
+import ast
+import pytest
+from flomatic.function_index import FunctionIndex
+
+NESTED_EXAMPLE = """
+class Outer:
+    class Inner:
+        @staticmethod
+        def method(x):
+            return x
+
+    def method(self):
+        def helper():
+            return 1
+        return helper()
+
+async def fetch(url):
+    return url
+
+def outer():
+    def inner():
+        pass
+    return inner
+"""
+
+
+class TestFunctionIndex:
+    """Test cases for the FunctionIndex class."""
+
+    def test_qualified_names_in_source_order(self):
+        """Test that every def and async def is indexed under its qualified name."""
+        index = FunctionIndex.from_source(NESTED_EXAMPLE)
+        assert index.names() == [
+            "Outer.Inner.method",
+            "Outer.method",
+            "Outer.method.helper",
+            "fetch",
+            "outer",
+            "outer.inner",
+        ]
+        assert len(index) == 6
+
+    def test_lookup_returns_node_and_scope(self):
+        """Test that lookups return the function node and its enclosing scope."""
+        index = FunctionIndex.from_source(NESTED_EXAMPLE)
+        entry = index["Outer.Inner.method"]
+        assert isinstance(entry.node, ast.FunctionDef)
+        assert entry.node.name == "method"
+        assert entry.scope == "Outer.Inner"
+        assert isinstance(index["fetch"].node, ast.AsyncFunctionDef)
+        assert "outer.inner" in index
+        assert index.get("missing") is None
+        with pytest.raises(KeyError):
+            index["missing"]
+
+    def test_line_spans_include_decorators(self):
+        """Test that line spans start at the first decorator and end at the last line of the body."""
+        index = FunctionIndex.from_source(NESTED_EXAMPLE)
+        entry = index["Outer.Inner.method"]
+        assert (entry.start_line, entry.end_line) == (4, 6)
+        assert (index["Outer.method"].start_line, index["Outer.method"].end_line) == (8, 11)
+
+    def test_first_definition_wins(self):
+        """Test that a repeated name keeps its first definition."""
+        index = FunctionIndex.from_source("def f():\n    return 1\n\ndef f():\n    return 2\n")
+        assert index.names() == ["f"]
+        assert index["f"].start_line == 1
@@ -0,0 +1,152 @@
+"""
+Unit tests for diagramming the functions changed between git revisions.
+"""
+
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from flomatic.function_index import FunctionIndex
+from flomatic.gitdiff import changed_functions, functions_in_lines, generate_diff_diagrams, parse_revisions
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+
+MODULE = """import os
+
+
+def first(x):
+    if x:
+        return 1
+    return 2
+
+
+def outer(items):
+    @staticmethod
+    def inner(item):
+        return item * 2
+    for item in items:
+        print(inner(item))
+
+
+class Shape:
+    def area(self):
+        return 0
+
+    def gone(self):
+        while True:
+            break
+"""
+
+
+def git(repo, *args):
+    subprocess.run(["git", "-c", "user.name=Test", "-c", "user.email=test@example.com"] + list(args),
+                   cwd=repo, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def write(repo, name, text):
+    path = os.path.join(repo, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+@pytest.fixture
+def repo(temp_test_dir):
+    """A repository whose first commit has pkg/mod.py and pkg/old.py."""
+    git(temp_test_dir, "init", "-q")
+    write(temp_test_dir, "pkg/mod.py", MODULE)
+    write(temp_test_dir, "pkg/old.py", "def legacy():\n    return 1\n")
+    git(temp_test_dir, "add", ".")
+    git(temp_test_dir, "commit", "-q", "-m", "first")
+    return temp_test_dir
+
+
+class TestFunctionsInLines:
+    """Test cases for mapping line ranges to functions."""
+
+    def test_innermost_function_and_nested_headers(self):
+        """Test that a line belongs to the innermost function, and a nested header also to its parent."""
+        index = FunctionIndex.from_source(MODULE)
+        assert functions_in_lines(index, [(6, 6)]) == ["first"]
+        assert functions_in_lines(index, [(13, 13)]) == ["outer.inner"]
+        # The decorator of the nested function is drawn in outer's diagram too
+        assert functions_in_lines(index, [(11, 11)]) == ["outer", "outer.inner"]
+        assert functions_in_lines(index, [(15, 15), (1, 2)]) == ["outer"]
+        # Class bodies outside methods are in no function's diagram
+        assert functions_in_lines(index, [(18, 18), (21, 21)]) == []
+
+
+class TestChangedFunctions:
+    """Test cases for finding the functions changed between revisions."""
+
+    def test_changed_added_and_removed(self, repo):
+        """Test that edited functions are found in the new file and removed ones in the old one."""
+        write(repo, "pkg/mod.py", MODULE.replace("return item * 2", "return item * 3")
+              .replace("        return 1\n", "        return 5\n")
+              .replace("    def gone(self):\n        while True:\n            break\n", ""))
+        write(repo, "pkg/new.py", "def fresh(x):\n    return x\n")
+        os.remove(os.path.join(repo, "pkg", "old.py"))
+        git(repo, "add", "-A")
+        git(repo, "commit", "-q", "-m", "second")
+
+        changes = changed_functions("HEAD~1", "HEAD", cwd=repo)
+        assert changes == [("pkg/mod.py", "pkg/mod.py", ["first", "outer.inner"], ["Shape.gone"]),
+                           ("pkg/new.py", None, ["fresh"], []),
+                           (None, "pkg/old.py", [], ["legacy"])]
+
+    def test_deleted_lines_belong_to_their_function(self, repo):
+        """Test that a function that only lost lines is found through the old file."""
+        write(repo, "pkg/mod.py", MODULE.replace("        while True:\n            break\n", "        pass\n")
+              .replace("    if x:\n        return 1\n", ""))
+        changes = changed_functions("HEAD", cwd=repo)
+        assert changes == [("pkg/mod.py", "pkg/mod.py", ["first", "Shape.gone"], [])]
+
+    def test_renamed_file_with_unusual_name(self, repo):
+        """Test that renames are followed and quoted file names are read back."""
+        name = "pkg/módulo con espacio.py"
+        git(repo, "mv", "pkg/mod.py", name)
+        write(repo, name, MODULE.replace("return 0", "return 1"))
+        git(repo, "add", "-A")
+        changes = changed_functions("HEAD", cwd=os.path.join(repo, "pkg"))
+        assert changes == [(name, "pkg/mod.py", ["Shape.area"], [])]
+
+    def test_paths_include_and_exclude(self, repo):
+        """Test that the diff is limited to the paths given and the files matching the patterns."""
+        write(repo, "pkg/mod.py", MODULE.replace("return 0", "return 1"))
+        write(repo, "pkg/old.py", "def legacy():\n    return 2\n")
+        assert [c.path for c in changed_functions("HEAD", paths=["pkg/old.py"], cwd=repo)] == ["pkg/old.py"]
+        assert [c.path for c in changed_functions("HEAD", exclude=["old.py"], cwd=repo)] == ["pkg/mod.py"]
+
+    def test_bad_revision(self, repo):
+        """Test that a revision git does not know is reported as a ValueError."""
+        with pytest.raises(ValueError):
+            changed_functions("nosuch", cwd=repo)
+
+    def test_parse_revisions(self, repo):
+        """Test that revision ranges are split as git diff reads them."""
+        assert parse_revisions("main") == ("main", None)
+        assert parse_revisions("main..topic") == ("main", "topic")
+        assert parse_revisions("main..") == ("main", "HEAD")
+        base, head = parse_revisions("HEAD...HEAD", repo)
+        assert len(base) == 40 and head == "HEAD"
+
+
+class TestGenerateDiffDiagrams:
+    """Test cases for generating the diagrams of changed functions."""
+
+    def test_only_changed_functions_are_diagrammed(self, repo, temp_test_dir):
+        """Test that diagrams are saved for the changed functions only, from the new revision."""
+        write(repo, "pkg/mod.py", MODULE.replace("    if x:", "    if x > 1:"))
+        write(repo, "pkg/old.py", "def legacy(:\n")
+        git(repo, "commit", "-q", "-a", "-m", "second")
+        output_dir = os.path.join(temp_test_dir, "out")
+
+        result = generate_diff_diagrams("HEAD~1", "HEAD", output_dir, cwd=repo)
+        diagram = os.path.join(output_dir, "pkg", "mod", "first.mmd")
+        assert result.saved_files == {"pkg/mod.py": [diagram]}
+        assert "SyntaxError" in result.failures["pkg/old.py"]
+        assert os.listdir(os.path.join(output_dir, "pkg", "mod")) == ["first.mmd"]
+        with open(diagram) as f:
+            assert "If: x > 1" in f.read()
@@ -0,0 +1,108 @@
+"""
+Unit tests for the FlowGraph representation and the Mermaid serializer.
+"""
+
+from flomatic.code_to_mermaid import FlowchartGenerator
+from flomatic.graph import START, FlowGraph
+from flomatic.serializers import to_mermaid
+
+
+class TestFlowGraph:
+    """Test cases for the FlowGraph class."""
+
+    def test_new_graph_has_start_node(self):
+        """Test that a new graph holds only the Start node."""
+        graph = FlowGraph()
+        assert graph.node_count == 1
+        assert graph.label(START) == "Start"
+        assert graph.end is None
+
+    def test_labels_are_interned(self):
+        """Test that repeated labels are stored once."""
+        graph = FlowGraph()
+        first = graph.add_node("Then")
+        second = graph.add_node("Then")
+        assert first != second
+        assert graph.labels == ["Start", "Then"]
+        assert graph.node_labels[first] == graph.node_labels[second]
+
+    def test_edges_and_successors(self):
+        """Test that edges are kept in order and grouped by source."""
+        graph = FlowGraph()
+        a = graph.add_node("A")
+        b = graph.add_node("B")
+        graph.add_edge(START, a)
+        graph.add_edge(a, b)
+        graph.add_edge(START, b)
+        assert graph.edges() == [(START, a), (a, b), (START, b)]
+        assert graph.successors() == [[a, b], [b], []]
+
+    def test_node_names(self):
+        """Test that text formats name nodes Start, End and node<id>."""
+        graph = FlowGraph()
+        node = graph.add_node("A")
+        end = graph.add_end()
+        assert [graph.node_name(n) for n in (START, node, end)] == ["Start", "node1", "End"]
+
+    def test_fingerprint_ignores_numbering(self):
+        """Test that graphs differing only in node numbering share a fingerprint, and others do not."""
+        def build(order, labels=("A", "B"), unreachable=None):
+            graph = FlowGraph()
+            ids = {}
+            for name in order:
+                ids[name] = graph.add_node(labels[0] if name == "a" else labels[1])
+            if unreachable is not None:
+                ids["u"] = graph.add_node(unreachable)
+            end = graph.add_end()
+            graph.add_edge(START, ids["a"])
+            graph.add_edge(ids["a"], ids["b"])
+            graph.add_edge(ids["a"], end)
+            graph.add_edge(ids["b"], ids["a"])
+            if unreachable is not None:
+                graph.add_edge(ids["u"], end)
+            return graph
+
+        fingerprint = build("ab").fingerprint()
+        assert build("ba").fingerprint() == fingerprint
+        assert build("ab", labels=("A", "C")).fingerprint() != fingerprint
+        assert build("ab", labels=("A", "C")).fingerprint({"C": "B"}) == fingerprint
+        assert build("ab", unreachable="U").fingerprint() == build("ba", unreachable="U").fingerprint()
+        assert build("ab", unreachable="U").fingerprint() != fingerprint
+        # The order of a node's edges is part of the flowchart
+        swapped = FlowGraph()
+        a, b = swapped.add_node("A"), swapped.add_node("B")
+        end = swapped.add_end()
+        for from_node, to_node in [(START, a), (a, end), (a, b), (b, a)]:
+            swapped.add_edge(from_node, to_node)
+        assert swapped.fingerprint() != fingerprint
+
+
+class TestMermaidSerializer:
+    """Test cases for the Mermaid serializer."""
+
+    def test_declarations_and_edges_keep_build_order(self):
+        """Test that edges follow the node that was newest when they were added."""
+        graph = FlowGraph()
+        a = graph.add_node("A")
+        graph.add_edge(START, a)
+        b = graph.add_node("B")
+        graph.add_edge(a, b)
+        end = graph.add_end()
+        graph.add_edge(b, end)
+        assert to_mermaid(graph) == "\n".join([
+            "flowchart TD",
+            'Start["Start"]',
+            'node1["A"]',
+            "Start --> node1",
+            'node2["B"]',
+            "node1 --> node2",
+            'End["End"]',
+            "node2 --> End",
+        ])
+
+    def test_generator_output_matches_serialized_graph(self):
+        """Test that the Mermaid text is the serialized graph of the same run."""
+        source = "def f(x):\n    if x:\n        return 1\n    return 2\n"
+        generator = FlowchartGenerator()
+        graph = generator.generate_flowchart_graph(source)
+        assert generator.generate_mermaid_flowchart(source) == to_mermaid(graph)
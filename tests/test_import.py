@@ -33,3 +33,139 @@ def test_import_examples():
         assert True
     except ImportError:
         assert False, "Failed to import examples module"
+
+def test_import_function_index():
+    """Test that the FunctionIndex class can be imported."""
+    try:
+        from flomatic.function_index import FunctionIndex
+        assert True
+    except ImportError:
+        assert False, "Failed to import FunctionIndex class"
+
+def test_import_cache():
+    """Test that the DiagramCache class can be imported."""
+    try:
+        from flomatic.cache import DiagramCache
+        assert True
+    except ImportError:
+        assert False, "Failed to import DiagramCache class"
+
+def test_import_manifest():
+    """Test that the Manifest class can be imported."""
+    try:
+        from flomatic.manifest import Manifest
+        assert True
+    except ImportError:
+        assert False, "Failed to import Manifest class"
+
+def test_import_project():
+    """Test that the project module can be imported."""
+    try:
+        from flomatic.project import generate_project_diagrams
+        assert True
+    except ImportError:
+        assert False, "Failed to import generate_project_diagrams"
+
+def test_import_render():
+    """Test that the BatchRenderer class can be imported."""
+    try:
+        from flomatic.render import BatchRenderer
+        assert True
+    except ImportError:
+        assert False, "Failed to import BatchRenderer class"
+
+def test_import_svg():
+    """Test that the svg module can be imported."""
+    try:
+        from flomatic.svg import flowchart_to_svg
+        assert True
+    except ImportError:
+        assert False, "Failed to import flowchart_to_svg"
+
+def test_import_graph():
+    """Test that the FlowGraph class can be imported."""
+    try:
+        from flomatic.graph import FlowGraph
+        assert True
+    except ImportError:
+        assert False, "Failed to import FlowGraph class"
+
+def test_import_serializers():
+    """Test that the serializers can be imported."""
+    try:
+        from flomatic.serializers import FORMATS, to_adjacency, to_dot, to_json, to_mermaid
+        assert True
+    except ImportError:
+        assert False, "Failed to import serializers"
+
+def test_import_cli():
+    """Test that the command-line entry point can be imported."""
+    try:
+        from flomatic.cli import main
+        assert True
+    except ImportError:
+        assert False, "Failed to import the command-line interface"
+
+def test_import_stats():
+    """Test that the GeneratorStats class can be imported."""
+    try:
+        from flomatic.stats import GeneratorStats
+        assert True
+    except ImportError:
+        assert False, "Failed to import GeneratorStats class"
+
+def test_import_simplify():
+    """Test that the simplify_graph function can be imported."""
+    try:
+        from flomatic.simplify import simplify_graph
+        assert True
+    except ImportError:
+        assert False, "Failed to import simplify_graph function"
+
+def test_import_watch():
+    """Test that the DiagramWatcher class can be imported."""
+    try:
+        from flomatic.watch import DiagramWatcher
+        assert True
+    except ImportError:
+        assert False, "Failed to import DiagramWatcher class"
+
+def test_import_aio():
+    """Test that the AsyncFlowchartService class can be imported."""
+    try:
+        from flomatic.aio import AsyncFlowchartService
+        assert True
+    except ImportError:
+        assert False, "Failed to import AsyncFlowchartService class"
+
+def test_import_bytecode():
+    """Test that the bytecode_graph function can be imported."""
+    try:
+        from flomatic.bytecode import bytecode_graph
+        assert True
+    except ImportError:
+        assert False, "Failed to import bytecode_graph function"
+
+def test_import_sources():
+    """Test that the read_source function can be imported."""
+    try:
+        from flomatic.sources import read_source
+        assert True
+    except ImportError:
+        assert False, "Failed to import read_source function"
+
+def test_import_gitdiff():
+    """Test that the generate_diff_diagrams function can be imported."""
+    try:
+        from flomatic.gitdiff import generate_diff_diagrams
+        assert True
+    except ImportError:
+        assert False, "Failed to import generate_diff_diagrams function"
+
+def test_import_dedupe():
+    """Test that the SharedDiagrams class can be imported."""
+    try:
+        from flomatic.dedupe import SharedDiagrams
+        assert True
+    except ImportError:
+        assert False, "Failed to import SharedDiagrams class"
@@ -0,0 +1,125 @@
+"""
+Unit tests for manifest-driven incremental regeneration.
+"""
+
+import os
+from unittest.mock import patch
+
+from flomatic.code_to_mermaid import FlowchartGenerator
+from flomatic.manifest import MANIFEST_NAME, Manifest
+
+SOURCE = """
+def first(x):
+    if x:
+        return 1
+    return 2
+
+def second(items):
+    for item in items:
+        print(item)
+"""
+
+
+def write_source(path, text, mtime_ns):
+    with open(path, 'w') as f:
+        f.write(text)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+class TestManifest:
+    """Test cases for the Manifest class."""
+
+    def test_missing_manifest_is_empty(self, temp_test_dir):
+        """Test that loading a missing manifest gives an empty one."""
+        manifest = Manifest.for_output_dir(temp_test_dir)
+        assert manifest.sources == {}
+        assert manifest.get("example.py") is None
+
+    def test_save_and_load(self, temp_test_dir):
+        """Test that saved records are loaded again."""
+        manifest = Manifest.for_output_dir(temp_test_dir)
+        record = {"mtime": 1, "hash": "h", "options": "o", "functions": {"f": {"hash": "x", "file": "f.mmd"}}}
+        manifest.set("example.py", record)
+        manifest.save()
+        assert Manifest.load(os.path.join(temp_test_dir, MANIFEST_NAME)).get("example.py") == record
+
+    def test_claims_ignores_excluded_source(self, temp_test_dir):
+        """Test that claims only considers other source files."""
+        manifest = Manifest.for_output_dir(temp_test_dir)
+        manifest.set("a.py", {"mtime": 1, "hash": "h", "options": "o", "functions": {"f": {"hash": "x", "file": "f.mmd"}}})
+        assert manifest.claims("f.mmd")
+        assert not manifest.claims("f.mmd", excluding="a.py")
+
+
+class TestUpdateMermaidDiagrams:
+    """Test cases for FlowchartGenerator.update_mermaid_diagrams."""
+
+    def setup_method(self):
+        self.generator = FlowchartGenerator()
+
+    def test_first_run_writes_all_diagrams(self, temp_test_dir):
+        """Test that the first run writes a diagram per function and a manifest."""
+        source_file = os.path.join(temp_test_dir, "example.py")
+        output_dir = os.path.join(temp_test_dir, "out")
+        write_source(source_file, SOURCE, 10**18)
+        written, removed = self.generator.update_mermaid_diagrams(source_file, output_dir)
+        assert sorted(os.path.basename(path) for path in written) == ["first.mmd", "second.mmd"]
+        assert removed == []
+        assert os.path.exists(os.path.join(output_dir, MANIFEST_NAME))
+        with open(os.path.join(output_dir, "first.mmd")) as f:
+            assert f.read() == self.generator.generate_mermaid_flowchart(SOURCE, target_function="first")
+
+    def test_unchanged_file_is_not_read(self, temp_test_dir):
+        """Test that a file with an unchanged mtime is skipped without being parsed."""
+        source_file = os.path.join(temp_test_dir, "example.py")
+        output_dir = os.path.join(temp_test_dir, "out")
+        write_source(source_file, SOURCE, 10**18)
+        self.generator.update_mermaid_diagrams(source_file, output_dir)
+        with patch("flomatic.code_to_mermaid.FunctionIndex.from_source") as from_source:
+            assert self.generator.update_mermaid_diagrams(source_file, output_dir) == ([], [])
+        from_source.assert_not_called()
+
+    def test_touched_file_with_same_content_writes_nothing(self, temp_test_dir):
+        """Test that a new mtime with identical content rewrites no diagrams."""
+        source_file = os.path.join(temp_test_dir, "example.py")
+        output_dir = os.path.join(temp_test_dir, "out")
+        write_source(source_file, SOURCE, 10**18)
+        self.generator.update_mermaid_diagrams(source_file, output_dir)
+        write_source(source_file, SOURCE, 2 * 10**18)
+        assert self.generator.update_mermaid_diagrams(source_file, output_dir) == ([], [])
+        assert Manifest.for_output_dir(output_dir).get(source_file)["mtime"] == 2 * 10**18
+
+    def test_only_changed_functions_are_rewritten(self, temp_test_dir):
+        """Test that editing one function rewrites only its diagram."""
+        source_file = os.path.join(temp_test_dir, "example.py")
+        output_dir = os.path.join(temp_test_dir, "out")
+        write_source(source_file, SOURCE, 10**18)
+        self.generator.update_mermaid_diagrams(source_file, output_dir)
+        write_source(source_file, SOURCE.replace("if x:", "if not x:"), 2 * 10**18)
+        written, removed = self.generator.update_mermaid_diagrams(source_file, output_dir)
+        assert [os.path.basename(path) for path in written] == ["first.mmd"]
+        assert removed == []
+
+    def test_removed_functions_are_deleted(self, temp_test_dir):
+        """Test that the diagrams of removed functions are deleted."""
+        source_file = os.path.join(temp_test_dir, "example.py")
+        output_dir = os.path.join(temp_test_dir, "out")
+        write_source(source_file, SOURCE, 10**18)
+        self.generator.update_mermaid_diagrams(source_file, output_dir)
+        write_source(source_file, SOURCE[:SOURCE.index("def second")], 2 * 10**18)
+        written, removed = self.generator.update_mermaid_diagrams(source_file, output_dir)
+        assert written == []
+        assert [os.path.basename(path) for path in removed] == ["second.mmd"]
+        assert not os.path.exists(os.path.join(output_dir, "second.mmd"))
+
+    def test_changed_options_regenerate_diagrams(self, temp_test_dir):
+        """Test that switching to detailed mode regenerates the diagrams that differ."""
+        source_file = os.path.join(temp_test_dir, "example.py")
+        output_dir = os.path.join(temp_test_dir, "out")
+        write_source(source_file, SOURCE, 10**18)
+        self.generator.update_mermaid_diagrams(source_file, output_dir)
+        written, _ = self.generator.update_mermaid_diagrams(source_file, output_dir, compact=False)
+        # first has no statements outside control flow, so its detailed diagram is unchanged
+        assert [os.path.basename(path) for path in written] == ["second.mmd"]
+        with open(os.path.join(output_dir, "second.mmd")) as f:
+            assert "Expr" in f.read()
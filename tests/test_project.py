@@ -0,0 +1,113 @@
+"""
+Unit tests for whole-project diagram generation.
+"""
+
+import os
+import subprocess
+import sys
+
+from flomatic.code_to_mermaid import FlowchartGenerator
+from flomatic.project import discover_sources, generate_project_diagrams
+
+MODULE_A = """
+def first(x):
+    if x:
+        return 1
+    return 2
+"""
+
+MODULE_B = """
+class Counter:
+    def count(self, items):
+        for item in items:
+            self.total += item
+"""
+
+
+def make_project(root):
+    files = {
+        "a.py": MODULE_A,
+        os.path.join("pkg", "__init__.py"): "",
+        os.path.join("pkg", "b.py"): MODULE_B,
+        os.path.join("pkg", "broken.py"): "def broken(:\n",
+        os.path.join(".hidden", "skipped.py"): MODULE_A,
+        "notes.txt": "not python",
+    }
+    for name, text in files.items():
+        path = os.path.join(root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(text)
+
+
+class TestProject:
+    """Test cases for generate_project_diagrams."""
+
+    def test_discover_sources(self, temp_test_dir):
+        """Test that Python files are found in sorted order, skipping hidden directories."""
+        make_project(temp_test_dir)
+        relative = [os.path.relpath(path, temp_test_dir) for path in discover_sources(temp_test_dir)]
+        assert relative == ["a.py", os.path.join("pkg", "__init__.py"),
+                            os.path.join("pkg", "b.py"), os.path.join("pkg", "broken.py")]
+
+    def test_diagrams_are_saved_per_file(self, temp_test_dir):
+        """Test that each file's diagrams are saved in a directory mirroring its path."""
+        root = os.path.join(temp_test_dir, "project")
+        output_dir = os.path.join(temp_test_dir, "out")
+        make_project(root)
+        result = generate_project_diagrams(root, output_dir, jobs=1)
+
+        saved = {os.path.relpath(source, root): [os.path.relpath(path, output_dir) for path in paths]
+                 for source, paths in result.saved_files.items()}
+        assert saved == {
+            "a.py": [os.path.join("a", "first.mmd")],
+            os.path.join("pkg", "__init__.py"): [os.path.join("pkg", "__init__", "unnamed_function.mmd")],
+            os.path.join("pkg", "b.py"): [os.path.join("pkg", "b", "Counter.count.mmd")],
+        }
+        with open(os.path.join(output_dir, "a", "first.mmd")) as f:
+            assert f.read() == FlowchartGenerator().generate_mermaid_flowchart(MODULE_A, target_function="first")
+
+    def test_failures_are_reported_per_file(self, temp_test_dir):
+        """Test that a file that cannot be parsed is reported without aborting the run."""
+        root = os.path.join(temp_test_dir, "project")
+        make_project(root)
+        result = generate_project_diagrams(root, os.path.join(temp_test_dir, "out"), jobs=1)
+        assert list(result.failures) == [os.path.join(root, "pkg", "broken.py")]
+        assert result.failures[os.path.join(root, "pkg", "broken.py")].startswith("SyntaxError")
+
+    def test_unexpected_errors_are_reported_per_file(self, temp_test_dir, monkeypatch):
+        """Test that any exception raised for a file, not just a parse error, fails that file only."""
+        root = os.path.join(temp_test_dir, "project")
+        make_project(root)
+        generate = FlowchartGenerator.generate_function_flowcharts
+
+        def generate_or_fail(self, source_code, *args):
+            if source_code == MODULE_A:
+                raise AttributeError("visitor bug")
+            return generate(self, source_code, *args)
+        monkeypatch.setattr(FlowchartGenerator, "generate_function_flowcharts", generate_or_fail)
+        result = generate_project_diagrams(root, os.path.join(temp_test_dir, "out"), jobs=1)
+        assert result.failures[os.path.join(root, "a.py")] == "AttributeError: visitor bug"
+        assert os.path.join(root, "pkg", "broken.py") in result.failures
+        assert result.saved_files
+
+    def test_process_pool_matches_serial_run(self, temp_test_dir):
+        """Test that a run with several workers produces the same output as a serial run."""
+        root = os.path.join(temp_test_dir, "project")
+        make_project(root)
+        serial = generate_project_diagrams(root, os.path.join(temp_test_dir, "serial"), jobs=1)
+        parallel = generate_project_diagrams(root, os.path.join(temp_test_dir, "parallel"), jobs=2,
+                                             cache_dir=os.path.join(temp_test_dir, "cache"))
+        assert list(parallel.saved_files) == list(serial.saved_files)
+        assert parallel.failures.keys() == serial.failures.keys()
+        for source, paths in serial.saved_files.items():
+            for serial_path, parallel_path in zip(paths, parallel.saved_files[source]):
+                with open(serial_path) as f, open(parallel_path) as g:
+                    assert f.read() == g.read()
+
+    def test_generator_module_is_imported_lazily(self):
+        """Test that importing the project module does not import the generator module."""
+        code = "import sys, flomatic.project; print('flomatic.code_to_mermaid' in sys.modules)"
+        env = dict(os.environ, PYTHONPATH=os.path.join(os.path.dirname(__file__), "..", "src"))
+        process = subprocess.run([sys.executable, "-c", code], env=env, stdout=subprocess.PIPE, check=True)
+        assert process.stdout.strip() == b"False"
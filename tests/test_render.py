@@ -0,0 +1,121 @@
+"""
+Unit tests for batched Mermaid rendering, using a local stand-in for mmdc.
+"""
+
+import os
+import sys
+import time
+
+import pytest
+from flomatic.render import BatchRenderer, main, stale_diagrams
+
+# Behaves like mmdc with Markdown input: writes the n-th mermaid block of the input
+# document to <output>-n.<format>, and logs each invocation so batching can be checked
+STAND_IN_RENDERER = r'''
+import os
+import re
+import sys
+
+args = sys.argv[1:]
+source = args[args.index("-i") + 1]
+output = args[args.index("-o") + 1]
+output_format = args[args.index("-e") + 1]
+with open(source) as f:
+    blocks = re.findall(r"```mermaid\n(.*?)\n```", f.read(), re.S)
+with open(os.environ["RENDER_LOG"], "a") as log:
+    log.write(f"{len(blocks)}\n")
+for number, block in enumerate(blocks, start=1):
+    if "FAIL" in block:
+        continue
+    with open(f"{os.path.splitext(output)[0]}-{number}.{output_format}", "w") as f:
+        f.write(block)
+'''
+
+
+@pytest.fixture
+def stand_in(temp_test_dir, monkeypatch):
+    script = os.path.join(temp_test_dir, "stand_in_mmdc.py")
+    with open(script, "w") as f:
+        f.write(STAND_IN_RENDERER)
+    log = os.path.join(temp_test_dir, "render.log")
+    monkeypatch.setenv("RENDER_LOG", log)
+    return (sys.executable, script), log
+
+
+def read_log(log):
+    with open(log) as f:
+        return [int(line) for line in f]
+
+
+class TestBatchRenderer:
+    """Test cases for the BatchRenderer class."""
+
+    def test_diagrams_are_rendered_in_batches(self, temp_test_dir, stand_in):
+        """Test that each batch of diagrams is rendered by a single renderer process."""
+        command, log = stand_in
+        renderer = BatchRenderer(command=command, batch_size=3)
+        diagrams = [(f"diagram{i}", f"flowchart TD\nStart --> node{i}") for i in range(7)]
+        output_dir = os.path.join(temp_test_dir, "png")
+        result = renderer.render(iter(diagrams), output_dir)
+
+        assert result.failures == {}
+        assert result.rendered == [os.path.join(output_dir, f"diagram{i}.png") for i in range(7)]
+        assert read_log(log) == [3, 3, 1]
+        with open(os.path.join(output_dir, "diagram5.png")) as f:
+            assert f.read() == "flowchart TD\nStart --> node5"
+
+    def test_concurrent_batches(self, temp_test_dir, stand_in):
+        """Test that concurrent batches still give every diagram its own image, in order."""
+        command, log = stand_in
+        renderer = BatchRenderer(command=command, batch_size=2, concurrency=3)
+        diagrams = [(f"diagram{i}", f"flowchart TD\nStart --> node{i}") for i in range(9)]
+        result = renderer.render(diagrams, os.path.join(temp_test_dir, "png"))
+        assert [os.path.basename(path) for path in result.rendered] == [f"diagram{i}.png" for i in range(9)]
+        assert sorted(read_log(log)) == [1, 2, 2, 2, 2]
+
+    def test_failures_are_reported_per_diagram(self, temp_test_dir, stand_in):
+        """Test that a diagram without an image is reported without failing the others."""
+        command, _ = stand_in
+        renderer = BatchRenderer(command=command)
+        result = renderer.render([("good", "flowchart TD"), ("bad", "FAIL")], os.path.join(temp_test_dir, "png"))
+        assert [os.path.basename(path) for path in result.rendered] == ["good.png"]
+        assert result.failures == {"bad": "renderer produced no image"}
+
+    def test_identical_diagrams_are_rendered_once(self, temp_test_dir, stand_in):
+        """Test that diagrams with the same text are rendered once and linked to that image."""
+        command, log = stand_in
+        renderer = BatchRenderer(command=command)
+        output_dir = os.path.join(temp_test_dir, "png")
+        result = renderer.render([("a", "flowchart TD"), ("b", "flowchart TD\nx"), ("c", "flowchart TD"),
+                                  ("d", "FAIL"), ("e", "FAIL")], output_dir)
+        assert read_log(log) == [3]
+        assert [os.path.basename(path) for path in result.rendered] == ["a.png", "b.png", "c.png"]
+        assert sorted(result.failures) == ["d", "e"]
+        with open(os.path.join(output_dir, "c.png")) as f:
+            assert f.read() == "flowchart TD"
+
+    def test_missing_renderer_fails_the_batch(self, temp_test_dir):
+        """Test that a renderer that cannot be started fails every diagram in the batch."""
+        renderer = BatchRenderer(command=[os.path.join(temp_test_dir, "no-such-renderer")])
+        result = renderer.render([("a", "flowchart TD"), ("b", "flowchart TD")], temp_test_dir)
+        assert result.rendered == []
+        assert sorted(result.failures) == ["a", "b"]
+
+    def test_only_stale_diagrams_are_rendered(self, temp_test_dir, stand_in):
+        """Test that the command line only renders diagrams newer than their image."""
+        command, log = stand_in
+        input_dir = os.path.join(temp_test_dir, "mmd")
+        output_dir = os.path.join(temp_test_dir, "png")
+        os.makedirs(input_dir)
+        for name in ["a", "b"]:
+            with open(os.path.join(input_dir, f"{name}.mmd"), "w") as f:
+                f.write(f"flowchart TD\n{name}")
+        command_line = ["--command", " ".join(command), input_dir, output_dir]
+        assert main(command_line) == 0
+        assert stale_diagrams(input_dir, output_dir) == []
+
+        future = time.time() + 10
+        os.utime(os.path.join(input_dir, "b.mmd"), (future, future))
+        assert stale_diagrams(input_dir, output_dir) == [os.path.join(input_dir, "b.mmd")]
+        assert main(command_line) == 0
+        assert read_log(log) == [2, 1]
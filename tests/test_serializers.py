@@ -0,0 +1,109 @@
+"""
+Unit tests for the output format serializers.
+"""
+
+import json
+import os
+
+import pytest
+
+from flomatic.cache import DiagramCache
+from flomatic.code_to_mermaid import FlowchartGenerator, diagram_filename
+from flomatic.serializers import FORMATS, read_adjacency, serialize, to_adjacency, to_dot, to_json
+
+SOURCE = '''
+def check(x):
+    if x == "a":
+        return 1
+    return 2
+'''
+
+
+def make_graph():
+    return FlowchartGenerator().generate_flowchart_graph(SOURCE)
+
+
+class TestSerializers:
+    """Test cases for the DOT, JSON and adjacency serializers."""
+
+    def test_dot(self):
+        """Test that DOT output declares every node and edge, with quotes escaped."""
+        dot = to_dot(make_graph())
+        assert dot.startswith("digraph flowchart {")
+        assert dot.endswith("}")
+        assert 'Start [label="Start", shape=oval];' in dot
+        assert 'node2 [label="If: x == \\"a\\""];' in dot
+        assert "  Start -> node1;" in dot
+        assert "End [label=\"End\", shape=oval];" in dot
+
+    def test_dot_escapes_quotes(self):
+        """Test that double quotes in labels are escaped in DOT output."""
+        graph = FlowchartGenerator().generate_flowchart_graph("def f():\n    return 'x'\n")
+        assert '[label="Return: \'x\'"]' in to_dot(graph)
+        graph.add_node('say "hi"')
+        assert r'[label="say \"hi\""]' in to_dot(graph)
+
+    def test_json(self):
+        """Test that JSON output lists the nodes and edges of the graph."""
+        graph = make_graph()
+        document = json.loads(to_json(graph))
+        assert document["start"] == 0
+        assert document["end"] == graph.end
+        assert [node["label"] for node in document["nodes"]] == [graph.label(n) for n in range(graph.node_count)]
+        assert document["nodes"][graph.end]["name"] == "End"
+        assert [tuple(edge) for edge in document["edges"]] == graph.edges()
+
+    def test_adjacency_round_trip(self):
+        """Test that the binary adjacency format reads back to the same graph."""
+        graph = make_graph()
+        data = to_adjacency(graph)
+        assert isinstance(data, bytes)
+        assert data[:4] == b"FLOA"
+        copy = read_adjacency(data)
+        assert copy.labels == graph.labels
+        assert list(copy.node_labels) == list(graph.node_labels)
+        assert copy.end == graph.end
+        assert copy.successors() == graph.successors()
+
+    def test_read_adjacency_rejects_other_data(self):
+        """Test that reading something other than an adjacency file fails."""
+        with pytest.raises(ValueError):
+            read_adjacency(b"flowchart TD")
+
+    def test_serialize_unknown_format(self):
+        """Test that an unknown format name is rejected."""
+        with pytest.raises(ValueError):
+            serialize(make_graph(), "png")
+
+    def test_generate_flowchart_in_each_format(self):
+        """Test that the generator serializes the same graph in every format."""
+        generator = FlowchartGenerator()
+        for format, (serializer, _) in FORMATS.items():
+            assert generator.generate_flowchart(SOURCE, format=format) == serializer(make_graph())
+
+    def test_save_in_each_format(self, temp_test_dir):
+        """Test that saved diagrams get the suffix of their format and match a cached run."""
+        cache = DiagramCache(os.path.join(temp_test_dir, "cache"))
+        for format, (_, suffix) in FORMATS.items():
+            output_dir = os.path.join(temp_test_dir, format)
+            saved = FlowchartGenerator().save_mermaid_diagram(SOURCE, output_dir, format=format, cache=cache)
+            assert saved == [os.path.join(output_dir, "check" + suffix)]
+            expected = FlowchartGenerator().generate_flowchart(SOURCE, "check", format=format)
+            mode = "rb" if isinstance(expected, bytes) else "r"
+            with open(saved[0], mode) as f:
+                assert f.read() == expected
+            # A second run is served from the cache, with the same type of content
+            assert FlowchartGenerator().generate_function_flowcharts(SOURCE, cache=cache, format=format) == \
+                [("check", expected)]
+
+    def test_update_removes_files_of_previous_format(self, temp_test_dir):
+        """Test that switching formats replaces the diagrams saved in the old format."""
+        source_file = os.path.join(temp_test_dir, "module.py")
+        with open(source_file, "w") as f:
+            f.write(SOURCE)
+        output_dir = os.path.join(temp_test_dir, "out")
+        generator = FlowchartGenerator()
+        generator.update_mermaid_diagrams(source_file, output_dir)
+        written, removed = generator.update_mermaid_diagrams(source_file, output_dir, format="dot")
+        assert written == [os.path.join(output_dir, diagram_filename("check", "dot"))]
+        assert removed == [os.path.join(output_dir, "check.mmd")]
@@ -0,0 +1,107 @@
+"""
+Unit tests for the graph simplification pass.
+"""
+
+from flomatic.code_to_mermaid import FlowchartGenerator
+from flomatic.graph import START, FlowGraph
+from flomatic.serializers import to_mermaid
+from flomatic.simplify import simplify_graph
+
+SOURCE = """
+def f(items):
+    total = 0
+    for item in items:
+        if item < 0:
+            break
+            print(item)
+        total += item
+    return total
+"""
+
+
+def labels(graph):
+    return [graph.label(node) for node in range(graph.node_count)]
+
+
+def labelled_edges(graph):
+    return {(graph.label(from_node), graph.label(to_node)) for from_node, to_node in graph.edges()}
+
+
+class TestSimplifyGraph:
+    """Test cases for simplify_graph."""
+
+    def test_prunes_unreachable_nodes(self):
+        """Test that the Unreachable node after a break, and what hangs off it, are removed."""
+        graph = FlowchartGenerator().generate_flowchart_graph(SOURCE, compact=False)
+        assert "Unreachable" in labels(graph)
+
+        simplified = simplify_graph(graph, collapse=False, merge=False)
+        assert "Unreachable" not in labels(simplified)
+        assert "Expr" not in labels(simplified)
+        assert "AugAssign" in labels(simplified)
+
+    def test_collapses_placeholders(self):
+        """Test that Then, Loop Body and After Loop nodes are bypassed without losing flow."""
+        graph = FlowchartGenerator().generate_flowchart_graph(SOURCE)
+        simplified = simplify_graph(graph)
+
+        assert labels(simplified) == ["Start", "Function f", "For: item in items", "If: item < 0",
+                                      "Break", "Return: total", "End"]
+        assert labelled_edges(simplified) == {
+            ("Start", "Function f"),
+            ("Function f", "For: item in items"),
+            ("For: item in items", "If: item < 0"),
+            ("If: item < 0", "For: item in items"),
+            ("If: item < 0", "Break"),
+            ("Break", "Return: total"),
+            ("For: item in items", "Return: total"),
+            ("Return: total", "End"),
+        }
+
+    def test_merges_linear_chains(self):
+        """Test that straight-line runs are merged, but definitions keep their own nodes."""
+        graph = FlowGraph()
+        function = graph.add_node("Function f")
+        first = graph.add_node("Assign")
+        second = graph.add_node("Expr")
+        graph.add_edge(START, function)
+        graph.add_edge(function, first)
+        graph.add_edge(first, second)
+        end = graph.add_end()
+        graph.add_edge(second, end)
+
+        simplified = simplify_graph(graph)
+        assert labels(simplified) == ["Start", "Function f", "Assign; Expr", "End"]
+        assert simplified.edges() == [(0, 1), (1, 2), (2, 3)]
+
+    def test_keeps_start_end_and_order(self):
+        """Test that Start and End survive and edges follow their nodes in the output."""
+        graph = FlowchartGenerator().generate_flowchart_graph(SOURCE)
+        simplified = simplify_graph(graph)
+
+        assert simplified.label(START) == "Start"
+        assert simplified.end == simplified.node_count - 1
+        assert simplified.label(simplified.end) == "End"
+        lines = to_mermaid(simplified).splitlines()
+        assert lines.index('node1["Function f"]') < lines.index("Start --> node1")
+
+    def test_duplicate_edges_are_dropped(self):
+        """Test that repeated edges between the same nodes are kept once."""
+        graph = FlowGraph()
+        node = graph.add_node("Assign")
+        graph.add_edge(START, node)
+        graph.add_edge(START, node)
+        graph.add_edge(node, graph.add_end())
+
+        assert simplify_graph(graph, merge=False).edge_count == 2
+
+    def test_generator_option(self):
+        """Test that FlowchartGenerator(simplify=True) simplifies its diagrams and keys."""
+        plain = FlowchartGenerator().generate_flowchart_graph(SOURCE, compact=False)
+        generator = FlowchartGenerator(simplify=True)
+        simplified = generator.generate_flowchart_graph(SOURCE, compact=False)
+
+        assert simplified.node_count < plain.node_count
+        assert simplified.edge_count < plain.edge_count
+        assert "Unreachable" not in generator.generate_mermaid_flowchart(SOURCE)
+        assert generator._options_key() != FlowchartGenerator()._options_key()
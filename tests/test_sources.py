@@ -0,0 +1,120 @@
+"""
+Unit tests for reading sources from archives and finding modules by name.
+"""
+
+import os
+import sys
+import zipfile
+
+import pytest
+
+from flomatic.project import discover_sources, generate_project_diagrams, module_sources, output_dir_for
+from flomatic.sources import module_locations, read_source, source_mtime, split_archive_path
+
+MODULE = """
+def first(x):
+    if x:
+        return 1
+    return 2
+"""
+
+# A package whose code must never run while its files are found and read
+EXPLOSIVE_INIT = "raise RuntimeError('imported')\n"
+
+
+def make_wheel(directory, name="demo-1.0-py3-none-any.whl"):
+    path = os.path.join(directory, name)
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("demo/__init__.py", MODULE)
+        zf.writestr("demo/sub/__init__.py", "")
+        zf.writestr("demo/sub/latin.py", "# -*- coding: latin-1 -*-\ndef f():\n    return '\xe9'\n".encode("latin-1"))
+        zf.writestr("demo/__pycache__/cached.py", MODULE)
+        zf.writestr("demo/tests/test_demo.py", MODULE)
+        zf.writestr("demo-1.0.dist-info/METADATA", "Name: demo\n")
+    return path
+
+
+def make_package(directory, name):
+    package = os.path.join(directory, name)
+    os.makedirs(os.path.join(package, "sub"))
+    with open(os.path.join(package, "__init__.py"), "w") as f:
+        f.write(EXPLOSIVE_INIT)
+    with open(os.path.join(package, "sub", "__init__.py"), "w") as f:
+        f.write(EXPLOSIVE_INIT)
+    with open(os.path.join(package, "sub", "module.py"), "w") as f:
+        f.write(MODULE)
+    return package
+
+
+class TestArchives:
+    """Test cases for sources inside .whl and .zip archives."""
+
+    def test_read_member(self, temp_test_dir):
+        """Test that members are read without extracting them, honouring coding declarations."""
+        wheel = make_wheel(temp_test_dir)
+        assert read_source(os.path.join(wheel, "demo", "__init__.py")) == MODULE
+        assert "return '\xe9'" in read_source(os.path.join(wheel, "demo", "sub", "latin.py"))
+        assert os.listdir(temp_test_dir) == [os.path.basename(wheel)]
+        with pytest.raises(FileNotFoundError):
+            read_source(os.path.join(wheel, "demo", "missing.py"))
+
+    def test_split_and_mtime(self, temp_test_dir):
+        """Test that member paths are split at the archive, and take its modification time."""
+        wheel = make_wheel(temp_test_dir)
+        member = os.path.join(wheel, "demo", "sub", "latin.py")
+        assert split_archive_path(member) == (wheel, "demo/sub/latin.py")
+        assert split_archive_path(wheel) == (wheel, "")
+        assert split_archive_path(os.path.join(temp_test_dir, "missing.py")) is None
+        assert source_mtime(member) == os.stat(wheel).st_mtime_ns
+
+    def test_discover_sources(self, temp_test_dir):
+        """Test that archives, and directories inside them, are searched like directories."""
+        wheel = make_wheel(temp_test_dir)
+        assert discover_sources(wheel, exclude=["tests"]) == [
+            os.path.join(wheel, "demo", "__init__.py"),
+            os.path.join(wheel, "demo", "sub", "__init__.py"),
+            os.path.join(wheel, "demo", "sub", "latin.py")]
+        assert discover_sources(os.path.join(wheel, "demo", "sub"), include=["latin.py"]) == [
+            os.path.join(wheel, "demo", "sub", "latin.py")]
+        assert output_dir_for(os.path.join(wheel, "demo", "sub", "latin.py"), wheel, "out") == \
+            os.path.join("out", "demo", "sub", "latin")
+
+    def test_project_run(self, temp_test_dir):
+        """Test that a project run over an archive saves the diagrams of its members."""
+        wheel = make_wheel(temp_test_dir)
+        output_dir = os.path.join(temp_test_dir, "out")
+        result = generate_project_diagrams(wheel, output_dir, jobs=1, changed_only=True)
+        assert result.failures == {}
+        assert os.path.exists(os.path.join(output_dir, "demo", "__init__", "first.mmd"))
+        assert os.path.exists(os.path.join(output_dir, "demo", "sub", "latin", "f.mmd"))
+        # Nothing changed, so nothing is read again
+        assert len(generate_project_diagrams(wheel, output_dir, jobs=1, changed_only=True).unchanged) == 4
+
+
+class TestModules:
+    """Test cases for finding the sources of modules by their dotted name."""
+
+    def test_package_is_not_imported(self, temp_test_dir, monkeypatch):
+        """Test that a package's files are found without running its code."""
+        package = make_package(temp_test_dir, "flomatic_explosive")
+        monkeypatch.syspath_prepend(temp_test_dir)
+        assert module_sources("flomatic_explosive.sub") == [
+            (os.path.join(package, "sub", "__init__.py"), temp_test_dir),
+            (os.path.join(package, "sub", "module.py"), temp_test_dir)]
+        assert module_locations("flomatic_explosive.sub.module") == [
+            (os.path.join(package, "sub", "module.py"), temp_test_dir)]
+        assert "flomatic_explosive" not in sys.modules
+
+    def test_module_in_archive(self, temp_test_dir, monkeypatch):
+        """Test that modules on an archive on sys.path are found inside it."""
+        wheel = make_wheel(temp_test_dir, "flomatic_zipped.zip")
+        monkeypatch.syspath_prepend(wheel)
+        assert module_sources("demo.sub", include=["latin.py"]) == [
+            (os.path.join(wheel, "demo", "sub", "latin.py"), wheel)]
+
+    def test_missing_and_builtin_modules(self):
+        """Test that modules that cannot be found or have no source give no locations."""
+        assert module_locations("flomatic_no_such_module.sub") == []
+        assert module_locations("sys") == []
+        assert module_locations("not a name") == []
+        assert module_locations("json.decoder")[0][0].endswith(os.path.join("json", "decoder.py"))
@@ -0,0 +1,90 @@
+"""
+Unit tests for the opt-in generator instrumentation.
+"""
+
+import json
+import os
+
+from flomatic.code_to_mermaid import FlowchartGenerator
+from flomatic.project import generate_project_diagrams
+from flomatic.stats import GeneratorStats
+
+SOURCE = """
+def loop(items):
+    for item in items:
+        if item > 2:
+            return item
+    return None
+
+def nested(x):
+    def inner(y):
+        return y
+    return inner(x)
+"""
+
+
+class TestGeneratorStats:
+    """Test cases for GeneratorStats and FlowchartGenerator.enable_stats."""
+
+    def test_records_phases_visits_and_emitted_graphs(self):
+        """Test that an instrumented generator records phases, node types, nodes and edges."""
+        generator = FlowchartGenerator()
+        stats = generator.enable_stats()
+        graph = generator.generate_flowchart_graph(SOURCE, target_function="loop")
+        generator.generate_mermaid_flowchart(SOURCE)
+
+        assert set(stats.phases) == {"parse", "visit", "label", "serialize"}
+        assert stats.phases["parse"][0] == 2
+        assert stats.phases["serialize"][0] == 1
+        # loop's If test, For target and iterable and two return values, then the same again
+        # for the whole module plus the return values of nested and inner
+        assert stats.phases["label"][0] == 2 * 5 + 2
+        assert stats.node_types["For"][0] == 2
+        assert stats.node_types["Module"][0] == 1
+        visits, seconds, self_seconds = stats.node_types["Module"]
+        assert 0 <= self_seconds <= seconds
+        assert stats.graphs == 2
+        assert stats.nodes >= graph.node_count and stats.edges >= graph.edge_count
+
+    def test_disabled_generator_is_not_instrumented(self):
+        """Test that disabling stats restores the plain methods and output."""
+        generator = FlowchartGenerator()
+        plain = generator.generate_mermaid_flowchart(SOURCE)
+        generator.enable_stats()
+        assert generator.generate_mermaid_flowchart(SOURCE) == plain
+        generator.disable_stats()
+        assert set(vars(generator)) == set(vars(FlowchartGenerator()))
+        assert generator.generate_mermaid_flowchart(SOURCE) == plain
+
+    def test_merge_and_json_report(self, temp_test_dir):
+        """Test that stats merge, including from their dictionary form, and write a JSON report."""
+        first = FlowchartGenerator().enable_stats()
+        generator = FlowchartGenerator()
+        generator.enable_stats(first)
+        generator.generate_mermaid_flowchart(SOURCE)
+
+        total = GeneratorStats()
+        total.merge(first)
+        total.merge(first.to_dict())
+        assert total.graphs == 2 * first.graphs
+        assert total.node_types["If"][0] == 2 * first.node_types["If"][0]
+
+        path = os.path.join(temp_test_dir, "stats.json")
+        total.write_json(path)
+        with open(path) as f:
+            report = json.load(f)
+        assert report["nodes"] == total.nodes
+        assert report["phases"]["visit"]["calls"] == total.phases["visit"][0]
+        assert "graphs" in total.summary()
+
+    def test_project_stats(self, temp_test_dir):
+        """Test that a project run collects the workers' stats and its write time."""
+        root = os.path.join(temp_test_dir, "src")
+        os.makedirs(root)
+        with open(os.path.join(root, "module.py"), "w") as f:
+            f.write(SOURCE)
+        stats = GeneratorStats()
+        generate_project_diagrams(root, os.path.join(temp_test_dir, "out"), jobs=1, stats=stats)
+        assert stats.graphs == 3
+        assert stats.phases["write"][0] == 3
+        assert stats.phases["parse"][0] == 1
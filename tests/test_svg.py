@@ -0,0 +1,100 @@
+"""
+Unit tests for the built-in SVG layout renderer.
+"""
+
+import os
+import xml.etree.ElementTree as ET
+
+from flomatic.code_to_mermaid import FlowchartGenerator
+from flomatic.render import main
+from flomatic.svg import NODE_GAP, flowchart_to_svg, graph_to_svg, layout_graph, parse_flowchart
+
+LOOP_EXAMPLE = """
+def find(items, target):
+    for item in items:
+        if item == target:
+            return item
+        if item < 0:
+            continue
+    while target > 0:
+        target -= 1
+    return None
+"""
+
+SVG = "{http://www.w3.org/2000/svg}"
+
+
+class TestSvg:
+    """Test cases for the SVG layout renderer."""
+
+    def test_parse_flowchart(self):
+        """Test that nodes and edges are read back from generated Mermaid text."""
+        nodes, edges = parse_flowchart('flowchart TD\nStart["Start"]\nnode1["If: a == \\"b\\""]\nStart --> node1\nEnd["End"]\nnode1 --> End')
+        assert nodes == {"Start": "Start", "node1": 'If: a == \\"b\\"', "End": "End"}
+        assert edges == [("Start", "node1"), ("node1", "End")]
+
+    def test_parse_flowchart_unescapes_quotes(self):
+        """Test that double quotes written as #quot; in labels are read back."""
+        nodes, _ = parse_flowchart('flowchart TD\nnode1["If: a == #quot;b#quot;"]')
+        assert nodes == {"node1": 'If: a == "b"'}
+
+    def test_layout_is_layered_without_overlaps(self):
+        """Test that edges point down except loop back edges, and nodes in a layer do not overlap."""
+        text = FlowchartGenerator().generate_mermaid_flowchart(LOOP_EXAMPLE)
+        nodes, edges = parse_flowchart(text)
+        layout = layout_graph(nodes, edges)
+
+        assert set(layout.positions) == set(nodes)
+        rows = {}
+        for node, (x, y) in layout.positions.items():
+            rows.setdefault(y, []).append((x, layout.sizes[node][0]))
+        for row in rows.values():
+            row.sort()
+            for (x1, w1), (x2, w2) in zip(row, row[1:]):
+                assert x2 - x1 >= (w1 + w2) / 2 + NODE_GAP - 1e-6
+
+        upward = [(a, b) for a, b in edges if layout.positions[b][1] < layout.positions[a][1]]
+        assert upward and all(nodes[b].startswith(("For:", "While:")) for a, b in upward)
+        assert layout.positions["Start"][1] == min(y for x, y in layout.positions.values())
+        assert layout.positions["End"][1] == max(y for x, y in layout.positions.values())
+
+    def test_edges_follow_their_direction(self):
+        """Test that every edge polyline starts at its source node and ends at its target node."""
+        text = FlowchartGenerator().generate_mermaid_flowchart(LOOP_EXAMPLE)
+        nodes, edges = parse_flowchart(text)
+        layout = layout_graph(nodes, edges)
+        for (a, b), points in zip(edges, layout.edge_points):
+            assert abs(points[0][0] - layout.positions[a][0]) < 1e-6
+            assert abs(points[-1][0] - layout.positions[b][0]) < 1e-6
+
+    def test_svg_document(self):
+        """Test that the SVG is well formed, with one box per node and escaped labels."""
+        text = FlowchartGenerator().generate_mermaid_flowchart(LOOP_EXAMPLE)
+        root = ET.fromstring(flowchart_to_svg(text))
+        assert root.tag == f"{SVG}svg"
+        labels = [element.text for element in root.iter(f"{SVG}text")]
+        assert "If: item < 0" in labels
+        assert len(root.findall(f"{SVG}rect")) == len(labels) == len(parse_flowchart(text)[0])
+        assert len(root.findall(f"{SVG}polyline")) == len(parse_flowchart(text)[1])
+
+    def test_large_graph(self):
+        """Test that a thousand-node flowchart lays out with every node placed."""
+        source = "def big(x):\n" + "".join(f"    if x == {i}:\n        x += {i}\n" for i in range(500))
+        text = FlowchartGenerator().generate_mermaid_flowchart(source)
+        nodes, edges = parse_flowchart(text)
+        assert len(nodes) > 1000
+        assert len(layout_graph(nodes, edges).positions) == len(nodes)
+
+    def test_builtin_render_command(self, temp_test_dir):
+        """Test that the render command can draw SVG without mmdc."""
+        with open(os.path.join(temp_test_dir, "find.mmd"), "w") as f:
+            f.write(FlowchartGenerator().generate_mermaid_flowchart(LOOP_EXAMPLE))
+        output_dir = os.path.join(temp_test_dir, "svg")
+        assert main(["--builtin", "--format", "svg", temp_test_dir, output_dir]) == 0
+        assert ET.parse(os.path.join(output_dir, "find.svg")).getroot().tag == f"{SVG}svg"
+
+    def test_graph_to_svg_matches_text(self):
+        """Test that rendering the graph directly gives the same SVG as rendering its Mermaid text."""
+        generator = FlowchartGenerator()
+        graph = generator.generate_flowchart_graph(LOOP_EXAMPLE)
+        assert graph_to_svg(graph) == flowchart_to_svg(generator.generate_mermaid_flowchart(LOOP_EXAMPLE))
@@ -0,0 +1,230 @@
+"""
+Unit tests for watch mode.
+"""
+
+import os
+import threading
+import time
+
+import pytest
+
+from flomatic.code_to_mermaid import FlowchartGenerator
+from flomatic.watch import DiagramWatcher, inotify_waker, sources_under
+
+MODULE = """
+def first(x):
+    if x:
+        return 1
+    return 2
+
+def second(items):
+    for item in items:
+        print(item)
+"""
+
+
+def write(path, text):
+    with open(path, "w") as f:
+        f.write(text)
+    # Make sure the change is visible even on file systems with coarse timestamps
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def make_watcher(root, output_dir, **options):
+    options.setdefault("debounce", 0.01)
+    return DiagramWatcher(sources_under(root), output_dir, **options)
+
+
+class FailingGenerator(FlowchartGenerator):
+    """A generator with a bug that raises for one file."""
+
+    def update_mermaid_diagrams(self, file_path, *args, **kwargs):
+        if file_path.endswith("buggy.py"):
+            raise KeyError("visitor bug")
+        return super().update_mermaid_diagrams(file_path, *args, **kwargs)
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+class TestDiagramWatcher:
+    """Test cases for DiagramWatcher.sync and DiagramWatcher.run."""
+
+    def test_first_sync_generates_everything(self, temp_test_dir):
+        """Test that the first sync writes the diagrams of every file, and the next one nothing."""
+        root = os.path.join(temp_test_dir, "src")
+        os.makedirs(root)
+        write(os.path.join(root, "module.py"), MODULE)
+        output_dir = os.path.join(temp_test_dir, "out")
+        watcher = make_watcher(root, output_dir)
+
+        result = watcher.sync()
+        assert sorted(os.path.basename(path) for path in result.saved_files[os.path.join(root, "module.py")]) == \
+            ["first.mmd", "second.mmd"]
+        assert watcher.sync().saved_files == {}
+
+    def test_changed_file_rewrites_only_changed_functions(self, temp_test_dir):
+        """Test that editing one function rewrites only that function's diagram."""
+        root = os.path.join(temp_test_dir, "src")
+        os.makedirs(root)
+        source_file = os.path.join(root, "module.py")
+        write(source_file, MODULE)
+        output_dir = os.path.join(temp_test_dir, "out")
+        watcher = make_watcher(root, output_dir)
+        watcher.sync()
+
+        write(source_file, MODULE.replace("if x:", "if x > 1:"))
+        result = watcher.sync()
+        assert result.saved_files == {source_file: [os.path.join(output_dir, "module", "first.mmd")]}
+        with open(os.path.join(output_dir, "module", "first.mmd")) as f:
+            assert "If: x > 1" in f.read()
+
+    def test_added_and_deleted_files(self, temp_test_dir):
+        """Test that new files are picked up and the diagrams of deleted files are removed."""
+        root = os.path.join(temp_test_dir, "src")
+        os.makedirs(root)
+        write(os.path.join(root, "module.py"), MODULE)
+        output_dir = os.path.join(temp_test_dir, "out")
+        watcher = make_watcher(root, output_dir)
+        watcher.sync()
+
+        added = os.path.join(root, "added.py")
+        write(added, "def third():\n    return 3\n")
+        result = watcher.sync()
+        assert list(result.saved_files) == [added]
+
+        os.remove(added)
+        result = watcher.sync()
+        assert result.removed == {added: [os.path.join(output_dir, "added", "third.mmd")]}
+        assert not os.path.exists(os.path.join(output_dir, "added", "third.mmd"))
+
+    def test_syntax_error_is_reported_and_recovered(self, temp_test_dir):
+        """Test that a half-typed edit fails that file only, and the next save updates it."""
+        root = os.path.join(temp_test_dir, "src")
+        os.makedirs(root)
+        source_file = os.path.join(root, "module.py")
+        write(source_file, MODULE)
+        output_dir = os.path.join(temp_test_dir, "out")
+        watcher = make_watcher(root, output_dir)
+        watcher.sync()
+
+        write(source_file, MODULE + "\ndef broken(:\n")
+        assert "SyntaxError" in watcher.sync().failures[source_file]
+        write(source_file, MODULE + "\ndef fixed():\n    pass\n")
+        result = watcher.sync()
+        assert result.failures == {}
+        assert os.path.join(output_dir, "module", "fixed.mmd") in result.saved_files[source_file]
+
+    def test_unexpected_error_fails_that_file_only(self, temp_test_dir):
+        """Test that any exception while updating a file is reported as its failure."""
+        root = os.path.join(temp_test_dir, "src")
+        os.makedirs(root)
+        write(os.path.join(root, "buggy.py"), MODULE)
+        write(os.path.join(root, "module.py"), MODULE)
+        watcher = make_watcher(root, os.path.join(temp_test_dir, "out"), generator=FailingGenerator())
+
+        result = watcher.sync()
+        assert result.failures == {os.path.join(root, "buggy.py"): "KeyError: 'visitor bug'"}
+        assert len(result.saved_files[os.path.join(root, "module.py")]) == 2
+
+    @pytest.mark.parametrize("use_inotify", [False, True])
+    def test_run_picks_up_a_save_within_a_second(self, temp_test_dir, use_inotify):
+        """Test that a running watcher updates a diagram within a second of the file being saved."""
+        if use_inotify and inotify_waker() is None:
+            pytest.skip("inotify is not available")
+        root = os.path.join(temp_test_dir, "src")
+        os.makedirs(root)
+        source_file = os.path.join(root, "module.py")
+        write(source_file, MODULE)
+        diagram = os.path.join(temp_test_dir, "out", "module", "first.mmd")
+        watcher = make_watcher(root, os.path.join(temp_test_dir, "out"), use_inotify=use_inotify)
+        reports = []
+        stop = threading.Event()
+        thread = threading.Thread(target=watcher.run, kwargs={"report": reports.append, "stop": stop})
+        thread.start()
+        try:
+            assert wait_for(lambda: os.path.exists(diagram))
+            write(source_file, MODULE.replace("if x:", "if x is None:"))
+            saved = time.monotonic()
+
+            def updated():
+                with open(diagram) as f:
+                    return "If: x is None" in f.read()
+            assert wait_for(updated)
+            assert time.monotonic() - saved < 1.0
+        finally:
+            stop.set()
+            thread.join()
+        assert len(reports) == 2
+
+    def test_run_picks_up_a_save_in_a_new_directory(self, temp_test_dir):
+        """Test that with inotify a file saved in a newly created directory is updated without a rescan."""
+        if inotify_waker() is None:
+            pytest.skip("inotify is not available")
+        root = os.path.join(temp_test_dir, "src")
+        os.makedirs(root)
+        write(os.path.join(root, "module.py"), MODULE)
+        diagram = os.path.join(temp_test_dir, "out", "package", "added", "third.mmd")
+        # No regular rescan within the test's timeout, so only inotify events can trigger the update
+        watcher = make_watcher(root, os.path.join(temp_test_dir, "out"), interval=3.0, rescan_interval=3.0)
+        stop = threading.Event()
+        thread = threading.Thread(target=watcher.run, kwargs={"stop": stop})
+        thread.start()
+        try:
+            assert wait_for(lambda: os.path.exists(os.path.join(temp_test_dir, "out", "module", "first.mmd")))
+            os.makedirs(os.path.join(root, "package"))
+            # Let the watcher scan the empty directory before the file is saved in it
+            time.sleep(0.2)
+            write(os.path.join(root, "package", "added.py"), "def third():\n    return 3\n")
+            assert wait_for(lambda: os.path.exists(diagram), timeout=1.0)
+        finally:
+            stop.set()
+            thread.join()
+
+
+class TestInotifyWaker:
+    """Test cases for waiting on inotify events."""
+
+    def test_wakes_on_a_write(self, temp_test_dir):
+        """Test that a write in a watched directory wakes the waiter, and that it times out otherwise."""
+        waker = inotify_waker()
+        if waker is None:
+            pytest.skip("inotify is not available")
+        try:
+            waker.watch(temp_test_dir)
+            assert not waker.wait(0.01)
+            write(os.path.join(temp_test_dir, "module.py"), MODULE)
+            assert waker.wait(1.0)
+            # The events were drained
+            assert not waker.wait(0.01)
+        finally:
+            waker.close()
+
+    def test_watches_new_directories(self, temp_test_dir):
+        """Test that a directory created in a watched directory is watched, with the directories in it."""
+        waker = inotify_waker()
+        if waker is None:
+            pytest.skip("inotify is not available")
+        try:
+            waker.watch(temp_test_dir)
+            os.makedirs(os.path.join(temp_test_dir, "package", "sub"))
+            assert waker.wait(1.0)
+            write(os.path.join(temp_test_dir, "package", "sub", "module.py"), MODULE)
+            assert waker.wait(1.0)
+            # A directory removed and created again is watched again
+            os.remove(os.path.join(temp_test_dir, "package", "sub", "module.py"))
+            os.rmdir(os.path.join(temp_test_dir, "package", "sub"))
+            assert waker.wait(1.0)
+            os.mkdir(os.path.join(temp_test_dir, "package", "sub"))
+            assert waker.wait(1.0)
+            write(os.path.join(temp_test_dir, "package", "sub", "module.py"), MODULE)
+            assert waker.wait(1.0)
+        finally:
+            waker.close()